@@ -0,0 +1,262 @@
+"""
+Load a mailbox straight into Postgres with COPY, as if it had been synced (and
+optionally enriched and embedded), to get tenants of millions of emails in minutes.
+"""
+
+import json
+import math
+import random
+import uuid
+import zlib
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Iterable, Iterator, List
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from benchmarks.mailbox import Mailbox
+from src.base import Message
+from src.database import Contact, EmailAccount
+from src.libs.rag_utils import clean_up_text
+from src.libs.types import EmailFolder
+
+COPY_BATCH_SIZE = 10_000
+EMBED_DIM = 1536  # text-embedding-3-small, see VectorDB
+# Emails share this many distinct embeddings, generating one per email would dominate
+# the load time
+VECTOR_POOL_SIZE = 256
+SEED_CATEGORIES = [["actionable"], ["information"], ["newsletter"], ["promo"], ["urgent"]]
+FOLDERS_BY_LABEL = {
+    "SENT": EmailFolder.SENT,
+    "DRAFT": EmailFolder.DRAFTS,
+    "SPAM": EmailFolder.SPAM,
+    "TRASH": EmailFolder.TRASH,
+}
+EMAIL_COLUMNS = (
+    "id",
+    "created_at",
+    "updated_at",
+    "sender",
+    "sender_name",
+    "to",
+    "subject",
+    "date",
+    "cc",
+    "processed",
+    "summary",
+    "content",
+    "snippet",
+    "raw_content",
+    "thread_id",
+    "is_read",
+    "is_shown",
+    "categories",
+    "labels",
+    "folder",
+    "email_id",
+    "email_account_id",
+)
+VECTOR_COLUMNS = ("text", "metadata_", "node_id", "embedding")
+ROW_NAMESPACE = uuid.UUID("6f1c1f4e-3d55-4a8e-9a55-2f0d6f1e8b7a")
+
+
+def _escape(value: str) -> str:
+    # COPY text format; NUL cannot be stored in a text column at all
+    return (
+        value.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+        .replace("\x00", "")
+    )
+
+
+def _array(values: Iterable) -> str:
+    items = (str(value).replace("\\", "\\\\").replace('"', '\\"') for value in values)
+    return "{" + ",".join(f'"{item}"' for item in items) + "}"
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (list, tuple)):
+        return _escape(_array(value))
+    if isinstance(value, datetime):
+        if value.tzinfo:
+            # Stored as naive UTC, like the ORM does through the session time zone
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.isoformat()
+    return _escape(str(value))
+
+
+class _CopyStream:
+    """File-like view of rows in COPY text format, encoded as they are read."""
+
+    def __init__(self, rows: Iterable[tuple]):
+        self._lines = ("\t".join(map(_copy_value, row)) + "\n" for row in rows)
+        self._buffer = bytearray()
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line.encode()
+        size = len(self._buffer) if size < 0 else size
+        chunk = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return chunk
+
+
+def copy_rows(db: Session, table: str, columns: Iterable[str], rows: Iterable[tuple]):
+    """Stream `rows` into `table` with one COPY in the session's transaction."""
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table} ({column_list}) FROM STDIN", _CopyStream(rows))
+    finally:
+        cursor.close()
+
+
+def _vector_pool(seed) -> List[str]:
+    """Unit vectors as pgvector literals, the same for every load with the same seed."""
+    pool = []
+    for n in range(VECTOR_POOL_SIZE):
+        rng = random.Random(f"{seed}:vector:{n}")
+        vector = [rng.gauss(0, 1) for _ in range(EMBED_DIM)]
+        norm = math.sqrt(sum(x * x for x in vector))
+        pool.append("[" + ",".join(f"{x / norm:.6f}" for x in vector) + "]")
+    return pool
+
+
+def _email_row(email_account_id: str, mailbox: Mailbox, index: int, enriched: bool) -> tuple:
+    message = Message(mailbox.gmail_message(index))
+    labels = message.get_label_ids()
+    folder = next(
+        (FOLDERS_BY_LABEL[label] for label in labels if label in FOLDERS_BY_LABEL),
+        EmailFolder.INBOX,
+    )
+    email_id = message.get_email_id()
+    subject = message.get_subject()
+    now = datetime.utcnow()
+    return (
+        uuid.uuid5(ROW_NAMESPACE, f"{email_account_id}:{email_id}"),
+        now,
+        now,
+        message.get_from(),
+        message.get_from_name(),
+        message.get_to(),
+        subject,
+        message.get_date(),
+        message.get_cc(),
+        enriched,
+        f"Summary of {subject}" if enriched else None,
+        message.get_content(),
+        message.get_snippet(),
+        message.get_raw_content(),
+        message.get_thread_id(),
+        "UNREAD" not in labels,
+        False,
+        SEED_CATEGORIES[index % len(SEED_CATEGORIES)] if enriched else None,
+        labels,
+        folder.value,
+        email_id,
+        email_account_id,
+    )
+
+
+def _vector_row(user_id: str, email: tuple, pool: List[str]) -> tuple:
+    row = dict(zip(EMAIL_COLUMNS, email))
+    node_id = str(uuid.uuid5(ROW_NAMESPACE, f"vector:{row['id']}"))
+    date = row["date"]
+    # Same metadata as EmailVector._create_document and VectorDB.insert
+    metadata = {
+        "thread": row["thread_id"],
+        "sender": " ".join(row["sender"]),
+        "to": " ".join(row["to"]),
+        "cc": " ".join(row["cc"]),
+        "subject": row["subject"] or "",
+        "date": date.strftime("%Y %m %d %B") if date else "",
+        "id": row["email_id"],
+        "user": user_id,
+        "user_id": user_id,
+        "doc_id": row["email_id"],
+        "document_id": row["email_id"],
+        "ref_doc_id": row["email_id"],
+    }
+    content = clean_up_text((row["content"] or "").strip())
+    embedding = pool[zlib.crc32(row["email_id"].encode()) % len(pool)]
+    return content, json.dumps(metadata), node_id, embedding
+
+
+def _ensure_vector_table():
+    # PGVectorStore creates its table on first use
+    from src.database.vectory_db import VectorDB
+
+    VectorDB().vector_store._initialize()
+
+
+def load_mailbox(
+    db: Session,
+    email_account_id: str,
+    mailbox: Mailbox,
+    start: int = 0,
+    stop: int = None,
+    enriched: bool = True,
+    vectors: bool = False,
+) -> dict:
+    """
+    Insert messages `start` to `stop` of `mailbox` as emails of the account, with their
+    contacts and, if `vectors`, their email_vectors rows.
+
+    Rows are built from the Gmail payloads for either provider. Messages are generated and
+    written COPY_BATCH_SIZE at a time, each batch in its own transaction, so disjoint
+    ranges can be loaded in parallel (see benchmarks/tasks.py).
+
+    Returns:
+        Number of emails, vectors and contacts written
+    """
+    email_account = db.get(EmailAccount, email_account_id)
+    user_id = str(email_account.user_id)
+    email_account_id = str(email_account_id)
+    stop = len(mailbox) if stop is None else min(stop, len(mailbox))
+    pool = []
+    if vectors:
+        _ensure_vector_table()
+        pool = _vector_pool(getattr(mailbox, "seed", 0))
+
+    counts = {"emails": 0, "vectors": 0, "contacts": 0}
+    contacts = {}
+    indexes: Iterator[int] = iter(range(start, stop))
+    while batch := list(islice(indexes, COPY_BATCH_SIZE)):
+        emails = [_email_row(email_account_id, mailbox, index, enriched) for index in batch]
+        copy_rows(db, "emails", EMAIL_COLUMNS, emails)
+        if vectors:
+            copy_rows(
+                db,
+                "data_email_vectors",
+                VECTOR_COLUMNS,
+                (_vector_row(user_id, email, pool) for email in emails),
+            )
+            counts["vectors"] += len(emails)
+        db.commit()
+        counts["emails"] += len(emails)
+
+        for email in emails:
+            row = dict(zip(EMAIL_COLUMNS, email))
+            for address, name in zip(row["sender"], row["sender_name"] or []):
+                contacts.setdefault(address, name)
+            for address in row["to"] + row["cc"]:
+                contacts.setdefault(address, "")
+
+    Contact.bulk_upsert(db, ((email_account_id, a, n) for a, n in contacts.items()))
+    counts["contacts"] = len(contacts)
+
+    # Planner statistics would otherwise describe the table before the load
+    for table in ("emails", "contacts") + (("data_email_vectors",) if vectors else ()):
+        db.execute(text(f"ANALYZE {table}"))
+    db.commit()
+    return counts
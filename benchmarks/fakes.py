@@ -0,0 +1,356 @@
+"""
+Local stand-ins for the external APIs the backend talks to: Gmail, Microsoft Graph,
+OpenAI and SES, served by one FastAPI app on a random local port.
+
+Mailboxes are looked up by the bearer token of the request, so every seeded account
+gets its own mailbox. Responses follow the shapes of the real APIs closely enough for
+the production clients (googleapiclient, msgraph-sdk, openai, boto3) to parse them.
+"""
+
+import asyncio
+import base64
+import hashlib
+import random
+import re
+import socket
+import struct
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Dict, Optional
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request, Response
+
+from benchmarks.mailbox import GRAPH_FOLDERS, Mailbox
+
+GMAIL_PAGE_SIZE = 100
+GRAPH_PAGE_SIZE = 10
+EMBEDDING_DIMENSIONS = 1536
+CATEGORIES = ["urgent", "actionable", "information", "newsletter", "promo", "other"]
+UUID_PATTERN = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+
+def _usage(text: str, completion: str = "") -> dict:
+    prompt_tokens, completion_tokens = len(text) // 4 + 1, len(completion) // 4 + 1
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "input_tokens": prompt_tokens,
+        "output_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def _embedding(text: str, dimensions: int) -> list:
+    """Deterministic unit vector for `text`, so identical inputs embed identically."""
+    rng = random.Random(hashlib.sha256(text.encode()).digest())
+    vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = sum(value * value for value in vector) ** 0.5
+    return [value / norm for value in vector]
+
+
+class FakeServices:
+    """
+    Runs the stand-in APIs in a background thread.
+
+    Args:
+        openai_latency (float): Seconds every OpenAI request takes
+        provider_latency (float): Seconds every Gmail / Graph request takes
+    """
+
+    def __init__(self, openai_latency: float = 0.0, provider_latency: float = 0.0):
+        self.openai_latency = openai_latency
+        self.provider_latency = provider_latency
+        self.mailboxes: Dict[str, Mailbox] = {}
+        self.requests = Counter()
+        self.app = self._build_app()
+        self._server: Optional[uvicorn.Server] = None
+        self._thread: Optional[threading.Thread] = None
+        self.url: Optional[str] = None
+
+    def add_mailbox(self, access_token: str, mailbox: Mailbox):
+        self.mailboxes[access_token] = mailbox
+
+    def environment(self) -> Dict[str, str]:
+        """Settings that point the backend at these services."""
+        return {
+            "GMAIL_API_ENDPOINT": f"{self.url}/",
+            "MSGRAPH_BASE_URL": f"{self.url}/graph/v1.0",
+            "OPENAI_BASE_URL": f"{self.url}/openai/v1",
+            # llama-index reads the older name
+            "OPENAI_API_BASE": f"{self.url}/openai/v1",
+            "OPENAI_API_KEY": "benchmark",
+            "AWS_ENDPOINT_URL_SES": f"{self.url}/ses",
+            "AWS_ACCESS_KEY_ID": "benchmark",
+            "AWS_SECRET_ACCESS_KEY": "benchmark",
+        }
+
+    def start(self) -> str:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(("127.0.0.1", 0))
+        self.url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+        config = uvicorn.Config(self.app, log_level="warning", access_log=False)
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(
+            target=self._server.run, kwargs={"sockets": [sock]}, daemon=True
+        )
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self.url
+
+    def stop(self):
+        if self._server:
+            self._server.should_exit = True
+            self._thread.join()
+
+    def _mailbox(self, request: Request) -> Mailbox:
+        token = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+        if token not in self.mailboxes:
+            raise HTTPException(status_code=401, detail="Unknown access token")
+        return self.mailboxes[token]
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.middleware("http")
+        async def count_and_delay(request: Request, call_next):
+            service = request.url.path.strip("/").split("/")[0]
+            self.requests[service] += 1
+            if service == "openai":
+                await asyncio.sleep(self.openai_latency)
+            elif service in ("gmail", "graph"):
+                await asyncio.sleep(self.provider_latency)
+            return await call_next(request)
+
+        self._add_gmail_routes(app)
+        self._add_graph_routes(app)
+        self._add_openai_routes(app)
+        self._add_ses_routes(app)
+        return app
+
+    def _add_gmail_routes(self, app: FastAPI):
+        prefix = "/gmail/v1/users/{user_id}"
+
+        @app.get(prefix + "/messages")
+        def gmail_list(request: Request, q: str = "", pageToken: str = None, maxResults: int = 0):
+            mailbox = self._mailbox(request)
+            after = None
+            if match := re.search(r"after:(\d{4}/\d{2}/\d{2})", q):
+                after = datetime.strptime(match.group(1), "%Y/%m/%d").replace(tzinfo=timezone.utc)
+            label = request.query_params.get("labelIds")
+            start = int(pageToken or 0)
+            page_size = min(maxResults or GMAIL_PAGE_SIZE, 500)
+            indexes = list(islice(mailbox.iter_indexes(label, after), start, start + page_size + 1))
+            response = {
+                "messages": [self._gmail_ref(mailbox, index) for index in indexes[:page_size]],
+                "resultSizeEstimate": min(len(indexes), page_size),
+            }
+            if len(indexes) > page_size:
+                response["nextPageToken"] = str(start + page_size)
+            return response
+
+        @app.get(prefix + "/messages/{message_id}")
+        def gmail_get(request: Request, message_id: str):
+            mailbox = self._mailbox(request)
+            index = mailbox.index_of(message_id)
+            if index is None:
+                raise HTTPException(status_code=404, detail="Requested entity was not found.")
+            return mailbox.gmail_message(index)
+
+        @app.get(prefix + "/messages/{message_id}/attachments/{attachment_id}")
+        def gmail_attachment(request: Request, message_id: str, attachment_id: str):
+            data = self._mailbox(request).attachment(message_id, attachment_id)
+            return {"size": len(data), "data": base64.urlsafe_b64encode(data).decode()}
+
+        @app.post(prefix + "/messages/{message_id}/modify")
+        def gmail_modify(request: Request, message_id: str):
+            return gmail_get(request, message_id)
+
+        @app.post(prefix + "/messages/send")
+        def gmail_send(request: Request):
+            self._mailbox(request)
+            return {"id": uuid.uuid4().hex[:16], "labelIds": ["SENT"]}
+
+        @app.post(prefix + "/drafts")
+        def gmail_draft(request: Request):
+            self._mailbox(request)
+            return {"id": uuid.uuid4().hex[:16], "message": {"id": uuid.uuid4().hex[:16]}}
+
+        @app.get(prefix + "/profile")
+        def gmail_profile(request: Request):
+            mailbox = self._mailbox(request)
+            return {"emailAddress": "bench.user@example.com", "messagesTotal": len(mailbox)}
+
+    @staticmethod
+    def _gmail_ref(mailbox: Mailbox, index: int) -> dict:
+        message_id = mailbox.message_id(index)
+        return {"id": message_id, "threadId": message_id}
+
+    def _add_graph_routes(self, app: FastAPI):
+        prefix = "/graph/v1.0/me"
+        folder_labels = {folder: label for label, folder in GRAPH_FOLDERS.items()}
+
+        def list_messages(request: Request, label: Optional[str]):
+            mailbox = self._mailbox(request)
+            after = None
+            query_filter = request.query_params.get("$filter", "")
+            if match := re.search(r"receivedDateTime gt (\S+)", query_filter):
+                after = datetime.strptime(match.group(1), "%Y-%m-%dT%H:%M:%SZ").replace(
+                    tzinfo=timezone.utc
+                )
+            skip = int(request.query_params.get("$skip", 0))
+            top = int(request.query_params.get("$top", GRAPH_PAGE_SIZE))
+            indexes = list(islice(mailbox.iter_indexes(label, after), skip, skip + top + 1))
+            page = [mailbox.graph_message(index) for index in indexes[:top]]
+            more = len(indexes) > top
+            response = {"value": page}
+            if more:
+                params = dict(request.query_params)
+                params.update({"$skip": str(skip + top), "$top": str(top)})
+                query = "&".join(f"{key}={value}" for key, value in params.items())
+                response["@odata.nextLink"] = f"{self.url}{request.url.path}?{query}"
+            return response
+
+        @app.get(prefix + "/messages")
+        def graph_messages(request: Request):
+            return list_messages(request, "INBOX")
+
+        @app.get(prefix + "/mailFolders/{folder}/messages")
+        def graph_folder_messages(request: Request, folder: str):
+            return list_messages(request, folder_labels.get(folder.lower(), folder.upper()))
+
+        @app.get(prefix + "/messages/{message_id}")
+        def graph_get(request: Request, message_id: str):
+            mailbox = self._mailbox(request)
+            index = mailbox.index_of(message_id)
+            if index is None:
+                raise HTTPException(status_code=404, detail="ErrorItemNotFound")
+            return mailbox.graph_message(index)
+
+        @app.patch(prefix + "/messages/{message_id}")
+        def graph_update(request: Request, message_id: str):
+            return graph_get(request, message_id)
+
+        @app.post(prefix + "/messages/{message_id}/move")
+        def graph_move(request: Request, message_id: str):
+            return graph_get(request, message_id)
+
+        @app.get(prefix + "/messages/{message_id}/attachments")
+        def graph_attachments(request: Request, message_id: str):
+            self._mailbox(request)
+            return {"value": []}
+
+        @app.post(prefix + "/messages")
+        def graph_draft(request: Request):
+            self._mailbox(request)
+            return {"id": uuid.uuid4().hex, "isDraft": True}
+
+        @app.post(prefix + "/sendMail")
+        def graph_send(request: Request):
+            self._mailbox(request)
+            return Response(status_code=202)
+
+        @app.get(prefix)
+        def graph_me(request: Request):
+            self._mailbox(request)
+            return {"displayName": "Bench User", "mail": "bench.user@example.com"}
+
+    def _add_openai_routes(self, app: FastAPI):
+        prefix = "/openai/v1"
+
+        @app.post(prefix + "/responses")
+        async def responses(request: Request):
+            body = await request.json()
+            prompt = str(body.get("input", ""))
+            text_format = (body.get("text") or {}).get("format") or {}
+            if text_format.get("type") == "json_schema":
+                # Structured output, the daily report is the only caller
+                ids = list(dict.fromkeys(UUID_PATTERN.findall(prompt)))
+                output = '{"results": [%s]}' % ", ".join(
+                    '{"summary": "Update from a sender in your inbox", "id": ["%s"]}' % email_id
+                    for email_id in ids
+                )
+            else:
+                digest = hashlib.sha256(prompt.encode()).digest()
+                output = '["%s"]' % CATEGORIES[digest[0] % len(CATEGORIES)]
+            return {
+                "id": f"resp_{uuid.uuid4().hex}",
+                "object": "response",
+                "created_at": int(time.time()),
+                "model": body.get("model", "gpt-5-nano"),
+                "status": "completed",
+                "error": None,
+                "output": [
+                    {
+                        "type": "message",
+                        "id": f"msg_{uuid.uuid4().hex}",
+                        "status": "completed",
+                        "role": "assistant",
+                        "content": [{"type": "output_text", "text": output, "annotations": []}],
+                    }
+                ],
+                "parallel_tool_calls": True,
+                "tool_choice": "auto",
+                "tools": [],
+                "usage": _usage(prompt, output),
+            }
+
+        @app.post(prefix + "/chat/completions")
+        async def chat_completions(request: Request):
+            body = await request.json()
+            prompt = " ".join(str(message.get("content", "")) for message in body["messages"])
+            content = "You have a new email that needs a quick look."
+            return {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "gpt-5-nano"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": _usage(prompt, content),
+            }
+
+        @app.post(prefix + "/embeddings")
+        async def embeddings(request: Request):
+            body = await request.json()
+            inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            dimensions = body.get("dimensions") or EMBEDDING_DIMENSIONS
+            data = []
+            for position, text in enumerate(inputs):
+                vector = _embedding(str(text), dimensions)
+                if body.get("encoding_format") == "base64":
+                    vector = base64.b64encode(struct.pack(f"<{dimensions}f", *vector)).decode()
+                data.append({"object": "embedding", "index": position, "embedding": vector})
+            text = " ".join(str(text) for text in inputs)
+            usage = _usage(text)
+            return {
+                "object": "list",
+                "data": data,
+                "model": body.get("model", "text-embedding-3-small"),
+                "usage": {
+                    "prompt_tokens": usage["prompt_tokens"],
+                    "total_tokens": usage["prompt_tokens"],
+                },
+            }
+
+    def _add_ses_routes(self, app: FastAPI):
+        @app.post("/ses/")
+        @app.post("/ses")
+        def ses(request: Request):
+            body = (
+                '<SendEmailResponse xmlns="http://ses.amazonaws.com/doc/2010-12-01/">'
+                f"<SendEmailResult><MessageId>{uuid.uuid4()}</MessageId></SendEmailResult>"
+                f"<ResponseMetadata><RequestId>{uuid.uuid4()}</RequestId></ResponseMetadata>"
+                "</SendEmailResponse>"
+            )
+            return Response(content=body, media_type="text/xml")
@@ -0,0 +1,85 @@
+"""
+Generate synthetic mailboxes.
+
+    # Stream Gmail messages.get payloads as JSON lines
+    python -m benchmarks.generate dump --size 100000 --seed 1 > mailbox.jsonl
+
+    # Create a user with a 1M email account, loaded by 8 Celery tasks
+    python -m benchmarks.generate load --size 1000000 --seed 1 --vectors --shards 8
+"""
+
+import argparse
+import json
+import sys
+import uuid
+from datetime import datetime, timezone
+
+from benchmarks.synthetic import SyntheticMailbox
+
+
+def dump(args):
+    mailbox = SyntheticMailbox(args.size, seed=args.seed, newest=args.newest)
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for index in range(len(mailbox)):
+            if args.provider == "graph":
+                message = mailbox.graph_message(index)
+            else:
+                message = mailbox.gmail_message(index)
+            output.write(json.dumps(message) + "\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+def load(args):
+    from benchmarks.seed import create_account
+    from src.database import get_db
+    from src.libs.const import STAGE
+
+    if STAGE == "production":
+        sys.exit("Refusing to load synthetic mailboxes with STAGE=production")
+
+    mailbox = SyntheticMailbox(args.size, seed=args.seed, newest=args.newest)
+    with get_db() as db:
+        user_id, email_account_id = create_account(db, f"synthetic-{uuid.uuid4().hex}")
+    print(f"user {user_id}, email account {email_account_id}")
+
+    if args.shards > 1:
+        from benchmarks.tasks import load_synthetic_mailbox_sharded
+
+        result = load_synthetic_mailbox_sharded(
+            email_account_id, args.size, args.seed, args.newest, args.shards, args.vectors
+        )
+        print(result.get())
+    else:
+        from benchmarks.bulk_load import load_mailbox
+
+        with get_db() as db:
+            print(load_mailbox(db, email_account_id, mailbox, vectors=args.vectors))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(required=True)
+    for name, handler in (("dump", dump), ("load", load)):
+        command = commands.add_parser(name)
+        command.set_defaults(handler=handler)
+        command.add_argument("--size", type=int, required=True)
+        command.add_argument("--seed", type=int, default=0)
+        command.add_argument(
+            "--newest",
+            type=lambda value: datetime.fromisoformat(value).astimezone(timezone.utc),
+            default=datetime.now(timezone.utc),
+            help="ISO date of the newest message, now by default",
+        )
+    commands.choices["dump"].add_argument("--provider", choices=["gmail", "graph"], default="gmail")
+    commands.choices["dump"].add_argument("--output")
+    commands.choices["load"].add_argument("--vectors", action="store_true")
+    commands.choices["load"].add_argument("--shards", type=int, default=1)
+    args = parser.parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Run the backend's hot paths against local stand-ins for Gmail, Graph, OpenAI and SES.
+
+Needs Postgres (with pgvector and migrations applied) and Redis, configured through the
+usual settings. Never run it against production data.
+
+    python -m benchmarks.run --sizes 1000,10000 --scenarios ingest_email,get_emails
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+
+from benchmarks.fakes import FakeServices
+from benchmarks.mailbox import ReplayMailbox
+from benchmarks.synthetic import SyntheticMailbox
+
+# Scenarios that need the mailbox already in the database rather than synced by them
+SEEDED_SCENARIOS = {"get_new_emails", "embed_new_emails", "get_emails", "search", "daily_report"}
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def summarize(name: str, size: int, measurement) -> dict:
+    latencies = measurement.latencies
+    total = sum(latencies)
+    return {
+        "scenario": name,
+        "size": size,
+        "iterations": len(latencies),
+        "errors": measurement.errors,
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "mean": statistics.fmean(latencies),
+        "items": measurement.items,
+        "items_per_second": measurement.items / total if total else 0.0,
+        "provider_requests": measurement.provider_requests,
+        "openai_requests": measurement.openai_requests,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="1000", help="Comma separated mailbox sizes")
+    parser.add_argument("--scenarios", default="", help="Comma separated scenarios, all by default")
+    parser.add_argument(
+        "--mailbox",
+        choices=["replay", "synthetic"],
+        default="replay",
+        help="Replay the recorded fixtures or generate messages",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of synthetic mailboxes")
+    parser.add_argument("--openai-latency", type=float, default=0.0)
+    parser.add_argument("--provider-latency", type=float, default=0.0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+
+    services = FakeServices(args.openai_latency, args.provider_latency)
+    services.start()
+    # Settings are read at import time, so the backend is imported only once they point
+    # at the stand-ins
+    os.environ.update(services.environment())
+    from src.libs.const import STAGE
+
+    if STAGE == "production":
+        sys.exit("Refusing to run benchmarks with STAGE=production")
+
+    from benchmarks import scenarios
+
+    names = [n for n in args.scenarios.split(",") if n] or list(scenarios.SCENARIOS)
+    unknown = set(names) - set(scenarios.SCENARIOS)
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = []
+    try:
+        for size in (int(s) for s in args.sizes.split(",")):
+            for name in names:
+                if args.mailbox == "synthetic":
+                    mailbox = SyntheticMailbox(size, seed=args.seed)
+                else:
+                    mailbox = ReplayMailbox(size)
+                ctx = scenarios.create_context(
+                    services, mailbox, size, seed=name in SEEDED_SCENARIOS
+                )
+                try:
+                    before = services.requests.copy()
+                    measurement = scenarios.SCENARIOS[name](ctx)
+                    requests = services.requests - before
+                    measurement.provider_requests = requests["gmail"] + requests["graph"]
+                    measurement.openai_requests = requests["openai"]
+                finally:
+                    scenarios.drop_context(ctx)
+                result = summarize(name, size, measurement)
+                results.append(result)
+                print(
+                    f"{name:<18} size={size:<7} p50={result['p50']:.3f}s "
+                    f"p95={result['p95']:.3f}s p99={result['p99']:.3f}s "
+                    f"items/s={result['items_per_second']:.1f} errors={result['errors']} "
+                    f"provider={result['provider_requests']} openai={result['openai_requests']}"
+                )
+    finally:
+        services.stop()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
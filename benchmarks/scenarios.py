@@ -0,0 +1,228 @@
+"""
+Benchmark scenarios. Importing this module imports the backend, so the environment
+must already point at the stand-in services (see benchmarks/run.py).
+"""
+
+import datetime
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from benchmarks.fakes import FakeServices
+from benchmarks.mailbox import Mailbox
+from benchmarks.bulk_load import load_mailbox
+from benchmarks.seed import create_account
+from benchmarks.storage import InMemoryStorageService
+from src.celery_config import celery
+from src.celery_tasks.ea_tasks import daily_morning_report_for_user
+from src.celery_tasks.tasks import delete_user, embed_new_emails, get_new_emails, ingest_email
+from src.database import get_db
+from src.database.cache import cache
+from src.database.vectory_db import VectorDB
+from src.libs import inbox_cache
+from src.main import app
+from src.routes.auth import create_jwt_token
+from src.services.storage_service import set_storage_service
+
+# Run queued tasks inline so a scenario covers the whole pipeline it triggers
+celery.conf.task_always_eager = True
+celery.conf.task_eager_propagates = False
+
+set_storage_service(InMemoryStorageService())
+
+
+@dataclass
+class Context:
+    services: FakeServices
+    mailbox: Mailbox
+    size: int
+    user_id: str
+    email_account_id: str
+    client: TestClient
+
+
+@dataclass
+class Measurement:
+    """Latency of each iteration and the number of items (emails, pages) it handled."""
+
+    latencies: List[float] = field(default_factory=list)
+    items: int = 0
+    errors: int = 0
+    provider_requests: int = 0
+    openai_requests: int = 0
+
+    def run(
+        self,
+        fn: Callable[[], Optional[int]],
+        iterations: int = 1,
+        before: Optional[Callable[[], None]] = None,
+    ):
+        """Time `fn` `iterations` times, calling `before` untimed ahead of each one."""
+        for _ in range(iterations):
+            if before:
+                before()
+            start = time.perf_counter()
+            try:
+                self.items += fn() or 0
+            except Exception:
+                self.errors += 1
+            self.latencies.append(time.perf_counter() - start)
+        return self
+
+
+SCENARIOS: Dict[str, Callable[[Context], Measurement]] = {}
+
+
+def scenario(name: str):
+    def register(fn):
+        SCENARIOS[name] = fn
+        return fn
+
+    return register
+
+
+def _account_email_count(email_account_id: str) -> int:
+    with get_db() as db:
+        return db.execute(
+            text("SELECT count(*) FROM emails WHERE email_account_id = :id"),
+            {"id": email_account_id},
+        ).scalar()
+
+
+@scenario("ingest_email")
+def ingest(ctx: Context) -> Measurement:
+    """Initial sync of the whole mailbox, including the enrichment it queues."""
+    with get_db() as db:
+        db.execute(
+            text("DELETE FROM emails WHERE email_account_id = :id"), {"id": ctx.email_account_id}
+        )
+        db.execute(
+            text(
+                "UPDATE email_accounts SET status = 'NOT_STARTED', last_sync = NULL "
+                "WHERE id = :id"
+            ),
+            {"id": ctx.email_account_id},
+        )
+
+    def run():
+        ingest_email(ctx.email_account_id)
+        return _account_email_count(ctx.email_account_id)
+
+    return Measurement().run(run)
+
+
+@scenario("get_new_emails")
+def incremental_sync(ctx: Context) -> Measurement:
+    """Sync after new mail arrived in an already synced mailbox."""
+    new_messages = max(ctx.size // 100, 10)
+
+    def run():
+        before = _account_email_count(ctx.email_account_id)
+        ctx.mailbox.grow(new_messages)
+        get_new_emails(ctx.user_id)
+        return _account_email_count(ctx.email_account_id) - before
+
+    return Measurement().run(run, iterations=3)
+
+
+@scenario("embed_new_emails")
+def enrichment(ctx: Context) -> Measurement:
+    """Classify and summarize every email of the mailbox again."""
+    with get_db() as db:
+        pending = db.execute(
+            text(
+                "UPDATE emails SET processed = false, categories = NULL, summary = NULL, "
+                "created_at = now() WHERE email_account_id = :id"
+            ),
+            {"id": ctx.email_account_id},
+        ).rowcount
+
+    def run():
+        embed_new_emails(ctx.user_id)
+        return pending
+
+    return Measurement().run(run)
+
+
+def _skip_sync(ctx: Context):
+    # Listing queues a sync, which would run inline and be measured as part of it
+    cache.set(f"debounce:get_new_emails:{ctx.user_id}", 1, ex=3600)
+
+
+def _get_emails(ctx: Context, page: int):
+    response = ctx.client.get(f"/user/{ctx.user_id}/emails", params={"page": page, "limit": 30})
+    response.raise_for_status()
+    return 1
+
+
+@scenario("get_emails")
+def list_emails(ctx: Context) -> Measurement:
+    """Page through the inbox through the API, with the inbox cache dropped every time."""
+    _skip_sync(ctx)
+    pages = iter(range(1, 1_000_000))
+
+    def run():
+        return _get_emails(ctx, next(pages) % 20 + 1)
+
+    return Measurement().run(run, iterations=50, before=lambda: inbox_cache.invalidate(ctx.user_id))
+
+
+@scenario("get_emails_cached")
+def list_cached_emails(ctx: Context) -> Measurement:
+    """Load the first inbox page again and again, as served from the inbox cache."""
+    _skip_sync(ctx)
+    _get_emails(ctx, 1)
+
+    def run():
+        return _get_emails(ctx, 1)
+
+    return Measurement().run(run, iterations=50)
+
+
+@scenario("search")
+def search(ctx: Context) -> Measurement:
+    """Semantic search, as run by the search route."""
+    vector_db = VectorDB()
+    queries = ["invoice from billing", "meeting tomorrow", "spring sale", "proposal draft"]
+    queries = iter(queries * 5)
+
+    def run():
+        vector_db.query(next(queries), 20, ctx.user_id)
+        return 1
+
+    return Measurement().run(run, iterations=20)
+
+
+@scenario("daily_report")
+def daily_report(ctx: Context) -> Measurement:
+    """Generate and send one user's morning report."""
+    report_date = datetime.date.today().isoformat()
+
+    def run():
+        with get_db() as db:
+            db.execute(text("DELETE FROM daily_reports WHERE user_id = :id"), {"id": ctx.user_id})
+        cache.delete(f"daily_report:claim:{report_date}:{ctx.user_id}")
+        daily_morning_report_for_user(ctx.user_id, report_date)
+        return 1
+
+    return Measurement().run(run, iterations=3)
+
+
+def create_context(services: FakeServices, mailbox: Mailbox, size: int, seed: bool) -> Context:
+    """Create a benchmark user whose account reads `mailbox`."""
+    access_token = f"bench-{id(mailbox)}-{time.time_ns()}"
+    services.add_mailbox(access_token, mailbox)
+    with get_db() as db:
+        user_id, email_account_id = create_account(db, access_token)
+        if seed:
+            load_mailbox(db, email_account_id, mailbox, stop=size, vectors=True)
+    client = TestClient(app)
+    client.cookies.set("auth_token", create_jwt_token({"sub": user_id}))
+    return Context(services, mailbox, size, user_id, email_account_id, client)
+
+
+def drop_context(ctx: Context):
+    delete_user.apply(args=[ctx.user_id])
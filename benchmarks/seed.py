@@ -0,0 +1,50 @@
+import uuid
+from datetime import datetime, timedelta
+from typing import Tuple
+
+from sqlalchemy.orm import Session
+
+from src.database import EmailAccount, Token, User
+from src.database.email_account import EmailAccountStatus, EmailProvider
+from src.database.user import MembershipStatus
+
+
+def create_account(
+    db: Session, access_token: str, provider: EmailProvider = EmailProvider.GMAIL
+) -> Tuple[str, str]:
+    """
+    Create an active user with one email account whose stored token is `access_token`,
+    the key of its mailbox in the fake provider APIs.
+
+    Returns:
+        (user_id, email_account_id)
+    """
+    suffix = uuid.uuid4().hex[:12]
+    user = User(
+        email=f"bench-{suffix}@example.com",
+        name="Bench User",
+        waitlisted=False,
+        show_tutorial=False,
+        membership_status=MembershipStatus.ACTIVE.value,
+    )
+    db.add(user)
+    db.flush()
+    email_account = EmailAccount(
+        email=f"bench-{suffix}@example.com",
+        provider=provider,
+        user_id=user.id,
+        status=EmailAccountStatus.NOT_STARTED,
+    )
+    db.add(email_account)
+    db.flush()
+    db.add(
+        Token(
+            token=access_token,
+            refresh_token=f"bench-refresh-{suffix}",
+            email_account_id=email_account.id,
+            # Far enough out that the token manager never tries to refresh it
+            expires_at=datetime.utcnow() + timedelta(days=30),
+        )
+    )
+    db.commit()
+    return str(user.id), str(email_account.id)
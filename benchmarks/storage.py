@@ -0,0 +1,36 @@
+import threading
+from datetime import timedelta
+from typing import BinaryIO, Dict
+
+from src.services.storage_service import StorageService
+
+
+class InMemoryStorageService(StorageService):
+    """GCS stand-in that keeps attachment blobs in process memory."""
+
+    def __init__(self):
+        self.blobs: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def exists(self, path: str) -> bool:
+        return path in self.blobs
+
+    def upload(self, path: str, fileobj: BinaryIO, content_type: str = None):
+        fileobj.seek(0)
+        data = fileobj.read()
+        with self._lock:
+            self.blobs[path] = data
+
+    def signed_url(self, path: str, expiration: timedelta, filename: str = None) -> str:
+        return f"memory://{path}?expires={int(expiration.total_seconds())}"
+
+    def delete_prefix(self, prefix: str) -> int:
+        with self._lock:
+            paths = [path for path in self.blobs if path.startswith(prefix)]
+            for path in paths:
+                del self.blobs[path]
+        return len(paths)
+
+    def delete(self, path: str):
+        with self._lock:
+            self.blobs.pop(path, None)
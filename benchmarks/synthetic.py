@@ -0,0 +1,298 @@
+import base64
+import hashlib
+import random
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import List
+
+from benchmarks.mailbox import GRAPH_FOLDERS, Mailbox
+
+FIRST_NAMES = [
+    "Ada", "Ben", "Chloe", "Dana", "Elias", "Farah", "Gus", "Hana", "Ivan", "Jun", "Kofi",
+    "Lena", "Mateo", "Nia", "Omar", "Priya", "Quinn", "Rosa", "Sam", "Tariq", "Uma", "Vera",
+    "Wes", "Xin", "Yara", "Zoe",
+]  # fmt: skip
+LAST_NAMES = [
+    "Abbott", "Baptiste", "Castillo", "Dubois", "Eriksen", "Fischer", "Garcia", "Haddad",
+    "Ito", "Jensen", "Kowalski", "Lindqvist", "Moreau", "Nakamura", "Okafor", "Petrov",
+    "Quist", "Rossi", "Schmidt", "Tanaka", "Ueda", "Varga", "Whitfield", "Yilmaz", "Zhou",
+]  # fmt: skip
+DOMAINS = [
+    "gmail.com", "outlook.com", "partner.example.org", "vendor.example.net", "acme.example.com",
+    "news.example.io", "shop.example.co", "university.example.edu",
+]  # fmt: skip
+WORDS = (
+    "account agenda approve budget call client contract deadline deliver draft estimate "
+    "feedback follow invoice launch meeting milestone notes offer order payment plan "
+    "proposal quarter receipt release renewal report review schedule shipment signed "
+    "status summary team ticket timeline travel update vendor week"
+).split()
+SUBJECTS = {
+    "personal": ["Re: {word} for next week", "Quick question about the {word}", "{word} notes"],
+    "newsletter": ["This week in {word}", "Your {word} digest", "20% off every {word}"],
+    "invoice": ["Invoice INV-{number} for your {word}", "Receipt #{number}"],
+    "notification": ["[{word}] Ticket #{number} was updated", "Your {word} has shipped"],
+    "calendar": ["Invitation: {word} review", "Updated invitation: {word} sync"],
+}
+KIND_WEIGHTS = {"personal": 30, "newsletter": 30, "invoice": 10, "notification": 25, "calendar": 5}
+# Labels besides INBOX, by kind
+KIND_LABELS = {
+    "personal": ["CATEGORY_PERSONAL"],
+    "newsletter": ["CATEGORY_PROMOTIONS"],
+    "invoice": ["CATEGORY_UPDATES"],
+    "notification": ["CATEGORY_UPDATES"],
+    "calendar": ["CATEGORY_PERSONAL"],
+}
+OFFSETS = [0, 60, 120, -300, -420, 330, 540]
+
+
+def _rfc(date: datetime) -> str:
+    return format_datetime(date)
+
+
+def _utc_comment(date: datetime) -> str:
+    return f"{format_datetime(date)} (UTC)"
+
+
+def _named_zone(date: datetime) -> str:
+    return format_datetime(date.astimezone(timezone.utc)).replace("+0000", "GMT")
+
+
+def _nbsp(date: datetime) -> str:
+    return "\xa0" + format_datetime(date)
+
+
+def _repeated_weekday(date: datetime) -> str:
+    return f"{date:%a}, {format_datetime(date)}"
+
+
+def _microseconds(date: datetime) -> str:
+    return date.strftime("%a, %d %b %Y %H:%M:%S.%f %z")
+
+
+def _invalid_offset(date: datetime) -> str:
+    return date.strftime("%a, %d %b %Y %H:%M:%S +4865")
+
+
+def _no_weekday(date: datetime) -> str:
+    return f"{date.day} {date:%b %Y %H:%M:%S %z}"
+
+
+def _no_zone(date: datetime) -> str:
+    return date.astimezone(timezone.utc).strftime("%a, %d %b %Y %H:%M:%S")
+
+
+# Date header styles seen in the wild that email_date_converter has to handle, weighted
+# by how common they are
+DATE_STYLES = [
+    (_rfc, 80),
+    (_utc_comment, 5),
+    (_named_zone, 4),
+    (_nbsp, 1),
+    (_repeated_weekday, 2),
+    (_microseconds, 2),
+    (_invalid_offset, 1),
+    (_no_weekday, 3),
+    (_no_zone, 2),
+]
+
+
+def _b64(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode()).decode()
+
+
+def _part(mime_type: str, body: dict, part_id: str, filename: str = "", parts=None) -> dict:
+    part = {
+        "partId": part_id,
+        "mimeType": mime_type,
+        "filename": filename,
+        "headers": [{"name": "Content-Type", "value": mime_type}],
+        "body": body,
+    }
+    if parts is not None:
+        part["parts"] = parts
+    return part
+
+
+class SyntheticMailbox(Mailbox):
+    """
+    A generated mailbox of any size, reproducible from `seed`.
+
+    Every message is derived from the seed and its id alone, so nothing is kept in memory
+    and any process building a mailbox with the same seed, size and `newest` serves the
+    same messages. Senders follow a long-tailed distribution over `senders` contacts.
+    """
+
+    def __init__(self, size: int, seed: int = 0, senders: int = 2000, **kwargs):
+        super().__init__(size, **kwargs)
+        self.seed = seed
+        self.senders = senders
+
+    def _random(self, index: int) -> random.Random:
+        return random.Random(f"{self.seed}:{self.message_id(index)}")
+
+    def person(self, number: int) -> tuple:
+        """(name, address) of contact `number`."""
+        rng = random.Random(f"{self.seed}:person:{number}")
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        domain = rng.choice(DOMAINS)
+        return f"{first} {last}", f"{first}.{last}{number}@{domain}".lower()
+
+    def _draw(self, index: int) -> dict:
+        rng = self._random(index)
+        kind = rng.choices(list(KIND_WEIGHTS), weights=list(KIND_WEIGHTS.values()))[0]
+        word = rng.choice(WORDS)
+        number = rng.randint(1000, 99999)
+        paragraphs = [
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 40))).capitalize() + "."
+            for _ in range(max(1, int(rng.lognormvariate(0.7, 0.6))))
+        ]
+        sender = min(int(rng.paretovariate(1.1)) - 1, self.senders - 1)
+
+        labels = ["INBOX", *KIND_LABELS[kind]]
+        folder_roll = rng.random()
+        if folder_roll < 0.08:
+            labels = ["SENT"]
+        elif folder_roll < 0.1:
+            labels = ["SPAM"]
+        elif folder_roll < 0.12:
+            labels = ["TRASH"]
+        if rng.random() < 0.15:
+            labels.append("UNREAD")
+
+        # A third of the messages reply to one of the few messages before them
+        number_in_mailbox = int(self.message_id(index), 16)
+        thread = number_in_mailbox
+        if rng.random() < 0.3:
+            thread = max(number_in_mailbox - rng.randint(1, 5), 0)
+
+        offset = timedelta(minutes=rng.choice(OFFSETS))
+        date_style = rng.choices(
+            [style for style, _ in DATE_STYLES], weights=[w for _, w in DATE_STYLES]
+        )[0]
+        to = [self.person(rng.randrange(self.senders)) for _ in range(rng.choice([0, 0, 1, 3]))]
+        cc = [self.person(rng.randrange(self.senders)) for _ in range(rng.choice([0, 0, 0, 2]))]
+        return {
+            "kind": kind,
+            "subject": rng.choice(SUBJECTS[kind]).format(word=word, number=number),
+            "paragraphs": paragraphs,
+            "sender": self.person(sender),
+            "to": [("Bench User", "bench.user@example.com"), *to],
+            "cc": cc,
+            "labels": labels,
+            "thread": f"{thread:016x}",
+            "date": self.date(index).astimezone(timezone(offset)),
+            "date_style": date_style,
+            "attachments": [
+                (f"{kind}-{number}-{n}.pdf", rng.randint(20_000, 2_000_000))
+                for n in range(rng.choice([1, 1, 2]) if kind in ("invoice", "calendar") else 0)
+            ],
+        }
+
+    @staticmethod
+    def _addresses(people: List[tuple]) -> str:
+        return ", ".join(f"{name} <{address}>" for name, address in people)
+
+    def labels(self, index: int) -> List[str]:
+        return self._draw(index)["labels"]
+
+    def gmail_message(self, index: int) -> dict:
+        draw = self._draw(index)
+        message_id = self.message_id(index)
+        text = "\n\n".join(draw["paragraphs"])
+        html = "".join(f"<p>{paragraph}</p>" for paragraph in draw["paragraphs"])
+        if draw["kind"] == "newsletter":
+            html = (
+                '<html><head><link rel="stylesheet" href="https://news.example.io/mail.css">'
+                f"</head><body><table><tr><td>{html}</td></tr></table></body></html>"
+            )
+
+        plain = _part("text/plain", {"size": len(text), "data": _b64(text)}, "0.0")
+        rich = _part("text/html", {"size": len(html), "data": _b64(html)}, "0.1")
+        attachments = [
+            _part(
+                "application/pdf",
+                {"attachmentId": f"{message_id}.{n}.{size}", "size": size},
+                str(n + 1),
+                filename=filename,
+            )
+            for n, (filename, size) in enumerate(draw["attachments"])
+        ]
+
+        if draw["kind"] == "notification":
+            # Single part, no multipart wrapper
+            payload = _part("text/plain", plain["body"], "")
+        elif draw["kind"] == "calendar":
+            invite = "BEGIN:VCALENDAR\nMETHOD:REQUEST\nEND:VCALENDAR"
+            related = _part(
+                "multipart/related",
+                {"size": 0},
+                "0",
+                parts=[
+                    _part("multipart/alternative", {"size": 0}, "0.0", parts=[plain, rich]),
+                    _part("text/calendar", {"size": len(invite), "data": _b64(invite)}, "0.1"),
+                ],
+            )
+            payload = _part("multipart/mixed", {"size": 0}, "", parts=[related, *attachments])
+        elif attachments:
+            alternative = _part("multipart/alternative", {"size": 0}, "0", parts=[plain, rich])
+            payload = _part("multipart/mixed", {"size": 0}, "", parts=[alternative, *attachments])
+        else:
+            payload = _part("multipart/alternative", {"size": 0}, "", parts=[plain, rich])
+
+        headers = [
+            {"name": "From", "value": self._addresses([draw["sender"]])},
+            {"name": "To", "value": self._addresses(draw["to"])},
+            {"name": "Subject", "value": draw["subject"]},
+            {"name": "Date", "value": draw["date_style"](draw["date"])},
+            {"name": "Message-ID", "value": f"<{message_id}@synthetic.example>"},
+        ]
+        if draw["cc"]:
+            headers.append({"name": "Cc", "value": self._addresses(draw["cc"])})
+        payload["headers"] = headers + payload["headers"]
+
+        return {
+            "id": message_id,
+            "threadId": draw["thread"],
+            "labelIds": draw["labels"],
+            "snippet": text[:120],
+            "sizeEstimate": len(text) + len(html) + sum(size for _, size in draw["attachments"]),
+            "internalDate": str(int(draw["date"].timestamp() * 1000)),
+            "payload": payload,
+        }
+
+    def graph_message(self, index: int) -> dict:
+        draw = self._draw(index)
+
+        def recipients(people):
+            return [{"emailAddress": {"name": n, "address": a}} for n, a in people]
+
+        received = draw["date"].astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        folder = next(
+            (GRAPH_FOLDERS[label] for label in draw["labels"] if label in GRAPH_FOLDERS), "inbox"
+        )
+        return {
+            "id": self.message_id(index),
+            "conversationId": draw["thread"],
+            "createdDateTime": received,
+            "receivedDateTime": received,
+            "subject": draw["subject"],
+            "isRead": "UNREAD" not in draw["labels"],
+            "hasAttachments": bool(draw["attachments"]),
+            "parentFolderId": folder,
+            "bodyPreview": draw["paragraphs"][0][:120],
+            "body": {
+                "contentType": "html",
+                "content": "".join(f"<p>{paragraph}</p>" for paragraph in draw["paragraphs"]),
+            },
+            "from": recipients([draw["sender"]])[0],
+            "sender": recipients([draw["sender"]])[0],
+            "toRecipients": recipients(draw["to"]),
+            "ccRecipients": recipients(draw["cc"]),
+        }
+
+    def attachment(self, message_id: str, attachment_id: str) -> bytes:
+        # Attachment ids carry their size, see gmail_message
+        size = int(attachment_id.rsplit(".", 1)[-1]) if attachment_id.count(".") == 2 else 65536
+        block = hashlib.sha256(attachment_id.encode()).digest()
+        return (b"%PDF-1.4\n" + block * (size // len(block) + 1))[:size]
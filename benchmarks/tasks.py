@@ -0,0 +1,62 @@
+"""
+Celery tasks for loading synthetic tenants in parallel. They are not part of the
+production worker, start a worker with `-I benchmarks.tasks` to run them.
+"""
+
+import logging
+from datetime import datetime
+
+from celery import group, shared_task
+
+from benchmarks.bulk_load import load_mailbox
+from benchmarks.synthetic import SyntheticMailbox
+from src.database import get_db
+from src.libs.const import STAGE
+from src.libs.metrics import count_items
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name="load_synthetic_mailbox")
+def load_synthetic_mailbox(
+    email_account_id: str,
+    size: int,
+    seed: int,
+    newest: str,
+    start: int = 0,
+    stop: int = None,
+    vectors: bool = False,
+):
+    """
+    Bulk load messages `start` to `stop` of a synthetic mailbox into an account.
+
+    Args:
+        newest: ISO date of the newest message, shared by every shard so they all
+            generate the same mailbox
+    """
+    if STAGE == "production":
+        raise RuntimeError("Synthetic mailboxes cannot be loaded in production")
+    mailbox = SyntheticMailbox(size, seed=seed, newest=datetime.fromisoformat(newest))
+    with get_db() as db:
+        counts = load_mailbox(db, email_account_id, mailbox, start, stop, vectors=vectors)
+    count_items("load_synthetic_mailbox", "emails", counts["emails"])
+    logger.info(f"Loaded {counts} into account {email_account_id} ({start}-{stop})")
+    return counts
+
+
+def load_synthetic_mailbox_sharded(
+    email_account_id: str,
+    size: int,
+    seed: int,
+    newest: datetime,
+    shards: int,
+    vectors: bool = False,
+):
+    """Split the load into `shards` disjoint ranges run by as many workers."""
+    step = -(-size // shards)
+    return group(
+        load_synthetic_mailbox.s(
+            email_account_id, size, seed, newest.isoformat(), start, start + step, vectors
+        )
+        for start in range(0, size, step)
+    ).apply_async()
@@ -4,6 +4,10 @@
 echo "Running Alembic migrations..."
 alembic upgrade head
 
+# Workers share their metrics through this directory, it must start empty
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus_api}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 # Start Uvicorn server
 echo "Starting Uvicorn server..."
-gunicorn -k uvicorn.workers.UvicornWorker -b 0.0.0.0:8080 src.main:app
\ No newline at end of file
+gunicorn -c gunicorn.conf.py src.main:app
\ No newline at end of file
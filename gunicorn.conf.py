@@ -0,0 +1,25 @@
+"""
+Gunicorn settings of the API, see entrypoint.sh.
+
+Every worker records its metrics in PROMETHEUS_MULTIPROC_DIR and the master serves them
+together on METRICS_PORT, which is not published like the API port.
+"""
+
+import os
+
+bind = "0.0.0.0:8080"
+worker_class = "uvicorn.workers.UvicornWorker"
+
+
+def when_ready(server):
+    from src.libs.const import METRICS_PORT
+    from src.libs.metrics import start_exporter
+
+    start_exporter(METRICS_PORT, shared=True)
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,32 @@
+"""Add partial index on unprocessed emails
+
+Revision ID: 3c1d7e9a4b21
+Revises: b5ea141598c6
+Create Date: 2025-10-19 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3c1d7e9a4b21"
+down_revision: Union[str, None] = "b5ea141598c6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_emails_unprocessed_created_at",
+        "emails",
+        ["created_at"],
+        unique=False,
+        postgresql_where=sa.text("processed = false"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_emails_unprocessed_created_at", table_name="emails")
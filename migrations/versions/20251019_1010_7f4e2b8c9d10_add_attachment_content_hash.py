@@ -0,0 +1,35 @@
+"""Add content hash to email attachments
+
+Revision ID: 7f4e2b8c9d10
+Revises: 3c1d7e9a4b21
+Create Date: 2025-10-19 10:10:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "7f4e2b8c9d10"
+down_revision: Union[str, None] = "3c1d7e9a4b21"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "email_attachments", sa.Column("content_hash", sa.String(length=64), nullable=True)
+    )
+    op.create_index(
+        op.f("ix_email_attachments_content_hash"),
+        "email_attachments",
+        ["content_hash"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_email_attachments_content_hash"), table_name="email_attachments")
+    op.drop_column("email_attachments", "content_hash")
@@ -0,0 +1,58 @@
+"""Add current weekly recap pointer to email accounts
+
+Revision ID: 9a3d5f1e2c47
+Revises: 7f4e2b8c9d10
+Create Date: 2025-10-19 10:20:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "9a3d5f1e2c47"
+down_revision: Union[str, None] = "7f4e2b8c9d10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("email_accounts", sa.Column("current_weekly_recap_id", sa.UUID(), nullable=True))
+    op.create_foreign_key(
+        "fk_email_accounts_current_weekly_recap_id",
+        "email_accounts",
+        "weekly_email_recaps",
+        ["current_weekly_recap_id"],
+        ["id"],
+        ondelete="SET NULL",
+    )
+    # Point every account at its most recent recap
+    op.execute(
+        """
+        UPDATE email_accounts AS account
+        SET current_weekly_recap_id = latest.id
+        FROM (
+            SELECT DISTINCT ON (email_account_id) id, email_account_id
+            FROM weekly_email_recaps
+            ORDER BY email_account_id, week_start DESC
+        ) AS latest
+        WHERE latest.email_account_id = account.id
+        """
+    )
+    # Drop duplicates accumulated by the old append
+    op.execute(
+        """
+        UPDATE weekly_email_recaps
+        SET email_ids = ARRAY(SELECT DISTINCT unnest(email_ids))
+        WHERE email_ids IS NOT NULL
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint(
+        "fk_email_accounts_current_weekly_recap_id", "email_accounts", type_="foreignkey"
+    )
+    op.drop_column("email_accounts", "current_weekly_recap_id")
@@ -0,0 +1,41 @@
+"""Add unique contact per email account
+
+Revision ID: 5b8e2d4f6a13
+Revises: 9a3d5f1e2c47
+Create Date: 2025-10-19 10:30:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5b8e2d4f6a13"
+down_revision: Union[str, None] = "9a3d5f1e2c47"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Keep the highest scored row of each duplicate group
+    op.execute(
+        """
+        DELETE FROM contacts
+        WHERE id NOT IN (
+            SELECT DISTINCT ON (email_account_id, email_address) id
+            FROM contacts
+            ORDER BY email_account_id, email_address, score DESC NULLS LAST, created_at
+        )
+        """
+    )
+    op.create_index(
+        "uq_contacts_email_account_id_email_address",
+        "contacts",
+        ["email_account_id", "email_address"],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("uq_contacts_email_account_id_email_address", table_name="contacts")
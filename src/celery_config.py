@@ -1,8 +1,25 @@
+import time
+
+from gevent import monkey
+
+# The celery CLI patches the standard library for --pool=gevent before importing this
+# module, but psycopg2 waits on the server in C and would block every greenlet. Let it
+# yield to the hub instead, before anything below opens a connection.
+if monkey.is_module_patched("socket"):
+    from psycogreen.gevent import patch_psycopg
+
+    patch_psycopg()
+
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import task_postrun, task_prerun, worker_init, worker_process_init
 from dotenv import load_dotenv
+from kombu import Exchange, Queue
 
-from src.libs.const import CELERY_BROKER_URL, CELERY_RESULT_BACKEND
+from src.libs import inbox_cache  # noqa: F401, subscribes to email changes
+from src.libs.const import CELERY_BROKER_URL, CELERY_RESULT_BACKEND, METRICS_PORT
+from src.libs.metrics import TASK_DURATION, start_exporter
+from src.libs.tracing import setup_tracing
 
 load_dotenv()
 
@@ -20,6 +37,70 @@ celery.conf.update(
     accept_content=["json"],
     result_compression="zlib",
 )
+
+# Workload classes. Each queue is consumed by its own worker pool so a backlog in one
+# class (e.g. enrichment after a large backfill) cannot delay latency-sensitive work
+# such as call preparation. See docker-compose.production.yaml for the worker topology.
+SYNC_QUEUE = "sync"  # provider API I/O (gevent)
+ENRICHMENT_QUEUE = "enrichment"  # OpenAI classification / summaries (gevent)
+ATTACHMENTS_QUEUE = "attachments"  # attachment download + upload (gevent)
+REPORTS_QUEUE = "reports"  # per-user daily reports, weekly recaps (gevent)
+CALLS_QUEUE = "calls"  # Telnyx voice sessions, a caller is waiting (gevent)
+DEFAULT_QUEUE = "default"  # user maintenance and everything else (prefork)
+
+# Redis emulates priorities with one list per step; 0 is the highest priority.
+HIGH_PRIORITY = 0
+DEFAULT_PRIORITY = 5
+LOW_PRIORITY = 9
+
+default_exchange = Exchange("default", type="direct")
+
+celery.conf.task_queues = [
+    Queue(name, default_exchange, routing_key=name)
+    for name in (
+        DEFAULT_QUEUE,
+        SYNC_QUEUE,
+        ENRICHMENT_QUEUE,
+        ATTACHMENTS_QUEUE,
+        REPORTS_QUEUE,
+        CALLS_QUEUE,
+    )
+]
+celery.conf.task_default_queue = DEFAULT_QUEUE
+celery.conf.task_default_exchange = default_exchange.name
+celery.conf.task_default_routing_key = DEFAULT_QUEUE
+celery.conf.task_default_priority = DEFAULT_PRIORITY
+celery.conf.task_routes = {
+    "ingest_email": {"queue": SYNC_QUEUE, "priority": DEFAULT_PRIORITY},
+    "get_new_emails": {"queue": SYNC_QUEUE, "priority": DEFAULT_PRIORITY},
+    "refresh_expiring_tokens": {"queue": SYNC_QUEUE, "priority": HIGH_PRIORITY},
+    "enrich_emails": {"queue": ENRICHMENT_QUEUE, "priority": DEFAULT_PRIORITY},
+    "embed_new_emails": {"queue": ENRICHMENT_QUEUE, "priority": LOW_PRIORITY},
+    "embed_new_attachments": {"queue": ATTACHMENTS_QUEUE, "priority": LOW_PRIORITY},
+    "create_weekly_recap": {"queue": REPORTS_QUEUE, "priority": LOW_PRIORITY},
+    "daily_morning_report": {"queue": REPORTS_QUEUE, "priority": DEFAULT_PRIORITY},
+    "daily_morning_report_for_user": {"queue": REPORTS_QUEUE, "priority": DEFAULT_PRIORITY},
+    "daily_evening_report": {"queue": REPORTS_QUEUE, "priority": DEFAULT_PRIORITY},
+    "prepare_email_brief": {"queue": CALLS_QUEUE, "priority": HIGH_PRIORITY},
+    "refresh_call_brief": {"queue": CALLS_QUEUE, "priority": DEFAULT_PRIORITY},
+    "hangup_call": {"queue": CALLS_QUEUE, "priority": HIGH_PRIORITY},
+    "apply_call_action": {"queue": CALLS_QUEUE, "priority": HIGH_PRIORITY},
+    "follow_up_actions": {"queue": CALLS_QUEUE, "priority": DEFAULT_PRIORITY},
+    "mark_emails_as_shown": {"queue": DEFAULT_QUEUE, "priority": LOW_PRIORITY},
+    "flush_shown_emails": {"queue": DEFAULT_QUEUE, "priority": LOW_PRIORITY},
+    "delete_user": {"queue": DEFAULT_QUEUE, "priority": LOW_PRIORITY},
+    # benchmarks/tasks.py, only registered by workers started with -I benchmarks.tasks
+    "load_synthetic_mailbox": {"queue": DEFAULT_QUEUE, "priority": LOW_PRIORITY},
+}
+celery.conf.broker_transport_options = {
+    "priority_steps": list(range(10)),
+    "sep": ":",
+    "queue_order_strategy": "priority",
+}
+# Only reserve one message per process so a slow task does not hold back others that
+# another idle process could pick up. Workers override this per queue on the CLI.
+celery.conf.worker_prefetch_multiplier = 1
+
 celery.conf.broker_url = CELERY_BROKER_URL
 celery.conf.result_backend = CELERY_RESULT_BACKEND
 celery.conf.beat_schedule = {
@@ -27,6 +108,10 @@ celery.conf.beat_schedule = {
         "task": "get_new_emails",
         "schedule": 15 * 60,  # 15 minutes
     },
+    "run-every-5-minutes-refresh-tokens": {
+        "task": "refresh_expiring_tokens",
+        "schedule": 5 * 60,  # 5 minutes
+    },
     "run-every-15-minutes-embed": {
         "task": "embed_new_emails",
         "schedule": 15 * 60,  # 15 minutes
@@ -39,6 +124,10 @@ celery.conf.beat_schedule = {
         "task": "follow_up_actions",
         "schedule": 15 * 60,  # 15 minutes
     },
+    "run-every-30-seconds-flush-shown-emails": {
+        "task": "flush_shown_emails",
+        "schedule": 30,  # 30 seconds
+    },
     "run-every-7-days-create-weekly-recap": {
         "task": "create_weekly_recap",
         "schedule": crontab(day_of_week=0, hour=0, minute=0),  # 7 days
@@ -58,6 +147,40 @@ celery.conf.beat_schedule = {
 }
 
 
+# Instrumentation. Each worker serves its metrics on METRICS_PORT; prefork workers need
+# PROMETHEUS_MULTIPROC_DIR so the parent can report what its children recorded.
+_task_started = {}
+
+
+@worker_init.connect
+def _start_worker_instrumentation(**kwargs):
+    start_exporter(METRICS_PORT)
+    # Prefork children inherit this, the span processor restarts its thread after a fork
+    setup_tracing("worker")
+
+
+@worker_process_init.connect
+def _reset_db_pool(**kwargs):
+    # Prefork children must not reuse connections opened by the parent before the fork
+    from src.database.db import reset_pools_after_fork
+
+    reset_pools_after_fork()
+
+
+@task_prerun.connect
+def _task_prerun(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def _task_postrun(task_id=None, task=None, state=None, **kwargs):
+    start = _task_started.pop(task_id, None)
+    if start is not None:
+        TASK_DURATION.labels(task=task.name, state=state or "UNKNOWN").observe(
+            time.perf_counter() - start
+        )
+
+
 def start_worker():
     """Start the Celery worker"""
     worker = celery.Worker(loglevel="info")
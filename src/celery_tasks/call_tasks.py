@@ -1,19 +1,26 @@
-import asyncio
 import json
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from typing import List, Optional
 
 import telnyx
 from celery import shared_task
 from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm import Session
 
 from src.database.cache import cache
-from src.database.call_session import CallSession
+from src.database.call_session import Action, CallSession
 from src.database.db import get_db
 from src.database.email import Email
 from src.database.email_account import EmailAccount
 from src.database.user import User
-from src.libs.const import TELNYX_API_KEY
+from src.libs.const import CALL_BRIEF_DEBOUNCE_SECONDS, CALL_BRIEF_MAX_EMAILS, TELNYX_API_KEY
+from src.libs.event_loop import run_async
+from src.libs.events import EMAILS_CHANGED, publish
+from src.libs.locks import debounce
+from src.libs.rate_limit import classify_error
 from src.libs.types import EmailFolder
 
 telnyx.api_key = TELNYX_API_KEY
@@ -24,6 +31,14 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.WARNING)
 
+CALL_BRIEF_COLUMNS = ["id", "sender", "sender_name", "subject", "date", "summary", "snippet"]
+# Snapshots are rebuilt whenever the inbox changes, the TTL only drops those of inactive users
+CALL_BRIEF_TTL = 2 * 24 * 60 * 60
+CALL_TTL = 60 * 60
+# Calls are capped well below this, older sessions are closed without asking Telnyx
+CALL_SESSION_MAX_AGE = 6 * 60 * 60
+CALL_STATUS_CONCURRENCY = 8
+
 
 @shared_task(name="hangup_call")
 def hangup_call(call_control_id: str):
@@ -31,70 +46,190 @@ def hangup_call(call_control_id: str):
     call.hangup()
 
 
+def _call_brief_key(phone_number: str) -> str:
+    return f"call_brief:{phone_number}"
+
+
+def _call_key(call_control_id: str) -> str:
+    return f"call_control_id_{call_control_id}"
+
+
+def build_call_brief(db: Session, user: User) -> dict:
+    """
+    Store the brief the voice agent reads to the user, keyed by their phone number.
+
+    The snapshot holds every unread inbox email from the last day, so a call can be
+    answered from a single cache read. Emails older than a day are dropped when the
+    snapshot is read, so it does not have to be rebuilt as time passes.
+    """
+    new_emails = (
+        db.query(Email)
+        .join(EmailAccount, Email.email_account_id == EmailAccount.id)
+        .filter(
+            Email.is_read == False,
+            Email.folder == EmailFolder.INBOX,
+            Email.date >= datetime.now() - timedelta(days=1),
+            EmailAccount.user_id == user.id,
+        )
+        .order_by(Email.created_at.desc())
+        .limit(CALL_BRIEF_MAX_EMAILS)
+        .all()
+    )
+    brief = {
+        "user_id": str(user.id),
+        "name": user.name,
+        "emails": [
+            {
+                **jsonable_encoder(email.to_dict(allowed_columns=CALL_BRIEF_COLUMNS)),
+                "_received_at": email.date.timestamp(),
+            }
+            for email in new_emails
+        ],
+    }
+    cache.set(_call_brief_key(user.phone_number), json.dumps(brief), ex=CALL_BRIEF_TTL)
+    return brief
+
+
+def get_call_brief(phone_number: str) -> Optional[dict]:
+    if brief := cache.get(_call_brief_key(phone_number)):
+        return json.loads(brief)
+    return None
+
+
+def register_call(call_control_id: str, phone_number: str):
+    """Remember whose brief the later tool calls of this call read."""
+    cache.set(_call_key(call_control_id), phone_number, ex=CALL_TTL)
+
+
+def get_call_emails(call_control_id: str) -> Optional[List[dict]]:
+    """Emails from the brief of the user on the call, or None if the call is unknown."""
+    phone_number = cache.get(_call_key(call_control_id))
+    brief = phone_number and get_call_brief(phone_number.decode("utf-8"))
+    if not brief:
+        return None
+    cutoff = time.time() - timedelta(days=1).total_seconds()
+    return [
+        {key: value for key, value in email.items() if key != "_received_at"}
+        for email in brief["emails"]
+        if email["_received_at"] >= cutoff
+    ]
+
+
+def schedule_call_brief_refresh(user_id: str):
+    """
+    Rebuild a user's call brief once their inbox changed.
+
+    Changes within CALL_BRIEF_DEBOUNCE_SECONDS (e.g. every chunk of a sync) are coalesced
+    into one rebuild that runs at the end of the window and so sees all of them.
+    """
+    if debounce(f"call_brief:{user_id}", CALL_BRIEF_DEBOUNCE_SECONDS):
+        refresh_call_brief.apply_async(args=[str(user_id)], countdown=CALL_BRIEF_DEBOUNCE_SECONDS)
+
+
+@shared_task(name="refresh_call_brief")
+def refresh_call_brief(user_id: str):
+    with get_db() as db:
+        user = db.query(User).filter(User.id == user_id).first()
+        if user and user.phone_number:
+            build_call_brief(db, user)
+
+
 @shared_task(name="prepare_email_brief")
 def prepare_email_brief(phone_number: str, call_control_id: str, call_session_id: str):
+    """
+    Rebuild the brief of a caller who was greeted from a cached snapshot.
+
+    The name webhook answers from the snapshot and creates the call session itself, this
+    only brings in emails that arrived since the snapshot was built before the agent asks
+    for them.
+    """
     with get_db() as db:
         user = db.query(User).filter(User.phone_number == phone_number).first()
-
         if user:
-            new_emails = (
-                db.query(Email)
-                .filter()
-                .join(EmailAccount, Email.email_account_id == EmailAccount.id)
-                .filter(
-                    Email.is_read == False,
-                    Email.folder == EmailFolder.INBOX,
-                    Email.date >= datetime.now() - timedelta(days=1),
-                    EmailAccount.user_id == user.id,
-                )
-                .order_by(Email.created_at.desc())
-                .all()
-            )
-            cache.set(
-                f"call_control_id_{call_control_id}",
-                json.dumps(
-                    [
-                        jsonable_encoder(
-                            email.to_dict(
-                                allowed_columns=[
-                                    "id",
-                                    "sender",
-                                    "sender_name",
-                                    "subject",
-                                    "date",
-                                    "summary",
-                                    "snippet",
-                                ]
-                            )
-                        )
-                        for email in new_emails
-                    ]
-                ),
-                ex=3600,
-            )
-
-            call_session = CallSession(
-                user_id=user.id,
-                call_control_id=call_control_id,
-                follow_up_tasks=[],
-            )
-            db.add(call_session)
-            db.commit()
+            build_call_brief(db, user)
+
+
+@shared_task(name="apply_call_action", bind=True, max_retries=3)
+def apply_call_action(self, user_id: str, email_id: str, action: str, body: str = None):
+    """
+    Carry out an email action the user asked for during a call.
+
+    Queued by the Telnyx tool webhooks so the voice agent gets its answer without
+    waiting on the email provider. Creating a draft is not idempotent, so a failed
+    draft is only retried when the provider refused the request; after any other error
+    it may already exist and a retry could leave the user with two.
+    """
+    with get_db() as db:
+        email = (
+            db.query(Email)
+            .join(EmailAccount, Email.email_account_id == EmailAccount.id)
+            .filter(Email.id == email_id, EmailAccount.user_id == user_id)
+            .first()
+        )
+        if not email:
+            logger.warning(f"Email {email_id} of call action {action} not found")
+            return
+        # Read and unread leave the email where it is
+        folder = email.folder
+        try:
+            if action == Action.RESPOND_TO_EMAIL.value:
+                run_async(email.draft_response(body, db))
+            elif action == Action.MARK_AS_READ.value:
+                run_async(email.mark_as_read(db))
+            elif action == Action.MARK_AS_UNREAD.value:
+                run_async(email.mark_as_unread(db))
+        except Exception as e:
+            logger.error(f"Call action {action} on email {email_id} failed: {e}", exc_info=True)
+            db.rollback()
+            if action == Action.RESPOND_TO_EMAIL.value:
+                retryable, throttled, _ = classify_error(e, idempotent=False)
+                if not (retryable or throttled):
+                    return
+            raise self.retry(countdown=5 * (self.request.retries + 1))
+
+    if action != Action.RESPOND_TO_EMAIL.value:
+        publish(EMAILS_CHANGED, user_id=user_id, folders=[folder])
+        # The user may ask for their emails again while still on the call
+        refresh_call_brief(user_id)
+
+
+def _is_call_alive(call_control_id: str) -> Optional[bool]:
+    try:
+        return bool(telnyx.Call.retrieve(call_control_id)["is_alive"])
+    except Exception as e:
+        logger.warning(f"Could not retrieve call {call_control_id}: {e}")
+        return None
 
 
 @shared_task(name="follow_up_actions")
 def follow_up_actions(call_control_id: str = None):
+    """
+    Close call sessions whose call ended.
+
+    Sessions are normally closed by the call.hangup webhook within seconds. This is the
+    fallback for missed events: calls are checked concurrently, sessions older than
+    CALL_SESSION_MAX_AGE are closed without asking Telnyx, and all ended sessions are
+    closed in one update.
+    """
     with get_db() as db:
-        call_sessions = (
-            db.query(CallSession)
-            .filter(CallSession.is_processed == False, CallSession.is_completed == False)
-            .all()
+        query = db.query(CallSession.call_control_id, CallSession.created_at).filter(
+            CallSession.is_processed == False, CallSession.is_completed == False
         )
+        if call_control_id:
+            query = query.filter(CallSession.call_control_id == call_control_id)
+        call_sessions = query.all()
         logger.info(f"Found {len(call_sessions)} call sessions")
-        if call_sessions:
-            for call_session in call_sessions:
-                call = telnyx.Call.retrieve(call_session.call_control_id)
-                if not call["is_alive"]:
-                    call_session.is_completed = True
-                    db.add(call_session)
-                    db.commit()
+        if not call_sessions:
+            return
+
+        cutoff = datetime.utcnow() - timedelta(seconds=CALL_SESSION_MAX_AGE)
+        ended, to_check = [], []
+        for session in call_sessions:
+            (ended if session.created_at < cutoff else to_check).append(session.call_control_id)
+        with ThreadPoolExecutor(max_workers=CALL_STATUS_CONCURRENCY) as executor:
+            for call_id, alive in zip(to_check, executor.map(_is_call_alive, to_check)):
+                if alive is False:
+                    ended.append(call_id)
+
+        completed = CallSession.mark_completed(db, ended)
+        logger.info(f"Closed {completed} ended call sessions")
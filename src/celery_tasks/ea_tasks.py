@@ -1,16 +1,28 @@
 import datetime
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from typing import List, Tuple, Optional
 from enum import Enum
+from bs4 import BeautifulSoup
 from celery import shared_task
 from llama_index.core.output_parsers import PydanticOutputParser
 
 from openai import BaseModel
-from sqlalchemy import select
+from sqlalchemy import Row, func, or_, select
 
 from src.libs.types import EmailFolder
-from src.libs.llm_utils import create_daily_report
+from src.libs.const import (
+    DAILY_REPORT_LLM_CONCURRENCY,
+    DAILY_REPORT_MAIL_CONCURRENCY,
+    DAILY_REPORT_PROMPT_TOKEN_BUDGET,
+)
+from src.libs.llm_utils import count_tokens, create_daily_report, truncate_to_tokens
+from src.libs.locks import debounce, semaphore
+from src.libs.metrics import DAILY_REPORT_JOBS, DAILY_REPORT_RUN_DURATION
+from src.database.cache import cache
 from src.database.email_account import EmailAccount
 from src.database.email import Email
 from src.libs.email_service import send_email
@@ -32,6 +44,14 @@ class EmailCategory(str, Enum):
 
 
 REPORT_HOURS_THRESHOLD = 12
+REPORT_CATEGORIES = [EmailCategory.ACTIONABLE.value, EmailCategory.INFORMATION.value]
+REPORT_CLAIM_TTL = 24 * 60 * 60
+REPORT_PROGRESS_TTL = 2 * 24 * 60 * 60
+REPORT_PROGRESS_FIELDS = ("sent", "skipped", "failed")
+# Cap for an email without a stored summary, so one huge body cannot fill a whole batch
+REPORT_EMAIL_MAX_TOKENS = 1000
+# How long a report job waits for an LLM / mail slot before giving up and retrying
+REPORT_SLOT_TIMEOUT = 120
 
 
 class DailyReportResult(BaseModel):
@@ -47,14 +67,21 @@ class DailyReportResults(BaseModel):
 parser = PydanticOutputParser(output_cls=DailyReportResults)
 
 
-def serialize_email(email: Email):
+def _report_email_text(email: Row) -> str:
+    """Prefer the stored summary; otherwise strip markup from the body and cap its length."""
+    if email.summary:
+        return email.summary
+    text = BeautifulSoup(email.content or "", "html.parser").get_text(" ", strip=True)
+    return truncate_to_tokens(" ".join(text.split()), REPORT_EMAIL_MAX_TOKENS)
+
+
+def serialize_email(email: Row):
     return f"""id: {str(email.id)} \
-        content: {email.content}           \
+        content: {_report_email_text(email)}           \
         sender: {email.sender} \
         sender_name: {email.sender_name} \
         subject: {email.subject} \
-        date: {email.date.strftime("%Y-%m-%d %H:%M:%S")} \
-        raw_content: {email.raw_content}
+        date: {email.date.strftime("%Y-%m-%d %H:%M:%S")}
     """
 
 
@@ -86,14 +113,15 @@ def _calculate_date_threshold(db, user_id: str) -> datetime.datetime:
             DailyReport.user_id == user_id,
             DailyReport.daily_report_type == DailyReportType.MORNING.value,
             DailyReport.created_at >= base_threshold,
+            # A report whose send failed (and is being retried) did not cover anything
+            DailyReport.sent_at.isnot(None),
         )
         .limit(1)
     )
     earlier_report = db.execute(earlier_report).scalar_one_or_none()
 
     if earlier_report:
-        # Use the earlier report's sent_at time if it exists, otherwise use created_at
-        threshold = earlier_report.sent_at or earlier_report.created_at
+        threshold = earlier_report.sent_at
         logger.info(f"Using previous report threshold: {threshold} for user {user_id}")
         return threshold
 
@@ -109,25 +137,36 @@ def _get_user_email_account_ids(db, user_id: str) -> List[str]:
     ]
 
 
-def _query_emails_by_category(
-    db, email_account_ids: List[str], category: EmailCategory, date_threshold: datetime.datetime
-) -> List[Email]:
-    """Query emails by category with common filters."""
-    res = (
-        db.query(Email)
+def _query_report_emails(
+    db, email_account_ids: List[str], date_threshold: datetime.datetime
+) -> List[Row]:
+    """
+    Fetch every report candidate in one query.
+
+    The category filter runs in Postgres (`categories && ARRAY[...]`) and only the columns
+    `serialize_email` needs are selected, so large bodies like `raw_content` stay in the
+    database.
+    """
+    return (
+        db.query(
+            Email.id,
+            Email.content,
+            Email.sender,
+            Email.sender_name,
+            Email.subject,
+            Email.date,
+            Email.categories,
+            Email.summary,
+        )
         .filter(
             Email.email_account_id.in_(email_account_ids),
             Email.folder == EmailFolder.INBOX,
             Email.date >= date_threshold,
+            Email.categories.overlap(REPORT_CATEGORIES),
         )
         .order_by(Email.date.desc())
         .all()
     )
-    matching_emails = []
-    for email in res:
-        if email.categories and category.value in email.categories:
-            matching_emails.append(email)
-    return matching_emails
 
 
 def _generate_text_report(
@@ -175,26 +214,93 @@ def _generate_html_report(
 
 
 def _process_user_emails(
-    db, user: User, date_threshold: datetime.datetime, email_account_ids: List[str]
+    user: User, date_threshold: datetime.datetime, email_account_ids: List[str]
 ) -> Tuple[List, List]:
-    """Process both actionable and informational emails for a user."""
-    # Query actionable emails
-    actionable_emails = _query_emails_by_category(
-        db, email_account_ids, EmailCategory.ACTIONABLE, date_threshold
-    )
+    """Split the user's report emails into actionable and informational groups."""
+    # The report's heaviest query, a replica a few seconds behind sees the same emails
+    with get_db(readonly=True) as db:
+        report_emails = _query_report_emails(db, email_account_ids, date_threshold)
+
+    actionable_emails = [
+        email for email in report_emails if EmailCategory.ACTIONABLE.value in email.categories
+    ]
     logger.info(f"Found {len(actionable_emails)} actionable emails for user {user.id}")
 
-    # Query informational emails
-    informational_emails = _query_emails_by_category(
-        db, email_account_ids, EmailCategory.INFORMATION, date_threshold
-    )
+    informational_emails = [
+        email for email in report_emails if EmailCategory.INFORMATION.value in email.categories
+    ]
     logger.info(f"Found {len(informational_emails)} informational emails for user {user.id}")
 
     return actionable_emails, informational_emails
 
 
-def _generate_daily_report_for_user(db, user: User) -> None:
-    """Generate and send daily morning report for a single user."""
+@contextmanager
+def _report_slot(name: str, limit: int):
+    """Hold one of `limit` cluster-wide slots for a provider call made by report jobs."""
+    with semaphore(f"daily_report:{name}", limit, timeout=REPORT_SLOT_TIMEOUT) as acquired:
+        if not acquired:
+            raise TimeoutError(f"Timed out waiting for a daily report {name} slot")
+        yield
+
+
+def _pack_report_batches(emails: List[Row], token_budget: int) -> List[str]:
+    """
+    Pack serialized emails into prompts of at most `token_budget` tokens.
+
+    Emails are grouped by sender first so the model can still combine a sender's emails
+    into one summary when a report spans several batches.
+    """
+    batches, batch, batch_tokens = [], [], 0
+    for email in sorted(emails, key=lambda email: tuple(email.sender or [])):
+        serialized = serialize_email(email)
+        tokens = count_tokens(serialized)
+        if batch and batch_tokens + tokens > token_budget:
+            batches.append("\n".join(batch))
+            batch, batch_tokens = [], 0
+        batch.append(serialized)
+        batch_tokens += tokens
+    if batch:
+        batches.append("\n".join(batch))
+    return batches
+
+
+def _run_report_batch(prompt: str) -> List:
+    with _report_slot("llm", DAILY_REPORT_LLM_CONCURRENCY):
+        response, status = create_daily_report(prompt)
+    if status is not True:
+        raise RuntimeError(f"Daily report generation failed: {status}")
+    return response.results if response and response.results else []
+
+
+def _create_daily_reports(email_groups: List[List[Row]]) -> List[List]:
+    """
+    Summarize each group of emails, returning one merged result list per group.
+
+    Every group is split into token-budgeted batches and all batches run concurrently.
+    """
+    jobs = [
+        (group_index, prompt)
+        for group_index, emails in enumerate(email_groups)
+        for prompt in _pack_report_batches(emails, DAILY_REPORT_PROMPT_TOKEN_BUDGET)
+    ]
+    results = [[] for _ in email_groups]
+    if not jobs:
+        return results
+
+    with ThreadPoolExecutor(max_workers=min(len(jobs), DAILY_REPORT_LLM_CONCURRENCY)) as executor:
+        batch_results = executor.map(_run_report_batch, [prompt for _, prompt in jobs])
+        for (group_index, _), group_results in zip(jobs, batch_results):
+            results[group_index].extend(group_results)
+    return results
+
+
+def _generate_daily_report_for_user(db, user: User) -> bool:
+    """
+    Generate and send daily morning report for a single user.
+
+    Returns:
+        True if the report email was sent.
+    """
     logger.info(f"Generating daily morning report for user {user.id} ({user.email})")
 
     # Calculate date threshold
@@ -204,7 +310,7 @@ def _generate_daily_report_for_user(db, user: User) -> None:
     email_account_ids = _get_user_email_account_ids(db, user.id)
     if not email_account_ids:
         logger.warning(f"No email accounts found for user {user.id}")
-        return
+        return False
 
     # Create daily report record
     daily_report = DailyReport(
@@ -218,21 +324,11 @@ def _generate_daily_report_for_user(db, user: User) -> None:
 
     # Process emails
     actionable_emails, informational_emails = _process_user_emails(
-        db, user, date_threshold, email_account_ids
+        user, date_threshold, email_account_ids
+    )
+    actionable_results, informational_results = _create_daily_reports(
+        [actionable_emails, informational_emails]
     )
-    # Generate reports for actionable emails
-    actionable_response = None
-    if actionable_emails:
-        actionable_response, _ = create_daily_report(
-            "\n".join([serialize_email(email) for email in actionable_emails])
-        )
-
-    # Generate reports for informational emails
-    informational_response = None
-    if informational_emails:
-        informational_response, _ = create_daily_report(
-            "\n".join([serialize_email(email) for email in informational_emails])
-        )
 
     # Process results - ensure 1-dimensional lists
     def flatten_to_1d(data):
@@ -247,16 +343,7 @@ def _generate_daily_report_for_user(db, user: User) -> None:
                 result.append(item)
         return result
 
-    actionable_results = (
-        actionable_response.results if actionable_response and actionable_response.results else []
-    )
     actionable_results = flatten_to_1d(actionable_results)
-
-    informational_results = (
-        informational_response.results
-        if informational_response and informational_response.results
-        else []
-    )
     informational_results = flatten_to_1d(informational_results)
     # Generate reports
     text_report = _generate_text_report(user.name, actionable_results, informational_results)
@@ -273,46 +360,182 @@ def _generate_daily_report_for_user(db, user: User) -> None:
     )
     db.commit()
 
-    # Send email
-    if len(actionable_results) > 0 or len(informational_results) > 0:
-        response = send_email(user.email, "Daily Morning Report", text_report, html_report)
-    else:
-        response = None
-    if response:
-        daily_report.sent_at = datetime.datetime.now()
-        db.commit()
-        logger.info(f"Successfully sent daily morning report to user {user.id}")
-    else:
-        logger.error(f"Failed to send daily morning report to user {user.id}")
+    if not actionable_results and not informational_results:
+        logger.info(f"Nothing to report for user {user.id}")
+        return False
+    _send_daily_report(db, user, daily_report)
+    return True
+
+
+class ReportDeliveryError(Exception):
+    """SES did not accept a daily report."""
+
+
+def _send_daily_report(db, user: User, daily_report: DailyReport):
+    """Email a generated report and mark it as sent, raising ReportDeliveryError on failure."""
+    with _report_slot("mail", DAILY_REPORT_MAIL_CONCURRENCY):
+        sent = send_email(
+            user.email, "Daily Morning Report", daily_report.text_report, daily_report.html_report
+        )
+    if not sent:
+        raise ReportDeliveryError(f"Daily morning report of user {user.id} was not accepted")
+    daily_report.sent_at = datetime.datetime.now()
+    db.commit()
+    logger.info(f"Successfully sent daily morning report to user {user.id}")
+
+
+def _unsent_report(db, user_id: str, report_date: str) -> Optional[DailyReport]:
+    """
+    Report generated by an earlier attempt of this date's job that failed to send.
+
+    Reports without results are stored too but never sent, they are not picked up here.
+    """
+    # created_at is in UTC, the report date is local like the beat schedule
+    day_start = (
+        datetime.datetime.combine(datetime.date.fromisoformat(report_date), datetime.time.min)
+        .astimezone(datetime.timezone.utc)
+        .replace(tzinfo=None)
+    )
+    return (
+        db.query(DailyReport)
+        .filter(
+            DailyReport.user_id == user_id,
+            DailyReport.daily_report_type == DailyReportType.MORNING.value,
+            DailyReport.sent_at.is_(None),
+            DailyReport.text_report.isnot(None),
+            or_(
+                func.cardinality(DailyReport.actionable_email_ids) > 0,
+                func.cardinality(DailyReport.information_email_ids) > 0,
+            ),
+            DailyReport.created_at >= day_start,
+            DailyReport.created_at < day_start + datetime.timedelta(days=1),
+        )
+        .order_by(DailyReport.created_at.desc())
+        .first()
+    )
+
+
+def _report_progress_key(report_date: str) -> str:
+    return f"daily_report:progress:{report_date}"
+
+
+def _record_report_progress(report_date: str, outcome: str):
+    """Count one finished report job and log once the whole run has completed."""
+    DAILY_REPORT_JOBS.labels(outcome=outcome).inc()
+    key = _report_progress_key(report_date)
+    pipe = cache.pipeline()
+    pipe.hincrby(key, outcome, 1)
+    pipe.hmget(key, "total", "started_at", *REPORT_PROGRESS_FIELDS)
+    _, (total, started_at, *counts) = pipe.execute()
+    if total is None:
+        return
+
+    counts = [int(count or 0) for count in counts]
+    if sum(counts) == int(total):
+        elapsed = time.time() - float(started_at)
+        DAILY_REPORT_RUN_DURATION.set(elapsed)
+        logger.info(
+            f"Daily morning reports for {report_date} completed in {elapsed:.0f}s: "
+            + ", ".join(f"{field}={count}" for field, count in zip(REPORT_PROGRESS_FIELDS, counts))
+        )
+
+
+def _report_already_sent(db, user_id: str, report_date: str) -> bool:
+    day_start = datetime.datetime.combine(
+        datetime.date.fromisoformat(report_date), datetime.time.min
+    )
+    return (
+        db.query(DailyReport.id)
+        .filter(
+            DailyReport.user_id == user_id,
+            DailyReport.daily_report_type == DailyReportType.MORNING.value,
+            DailyReport.sent_at >= day_start,
+        )
+        .first()
+        is not None
+    )
 
 
 @shared_task(name="daily_morning_report")
 def daily_morning_report():
-    """Generate and send daily morning reports for all eligible users."""
-    # First, get the list of eligible user IDs
-    with get_db() as db:
+    """
+    Fan out one `daily_morning_report_for_user` job per eligible user.
+
+    Runs once per day; a duplicate beat tick for the same day is ignored. Progress for the
+    run is tracked in the `daily_report:progress:<date>` Redis hash and exported as the
+    daily_report_jobs_total and daily_report_run_duration_seconds metrics.
+    """
+    report_date = datetime.datetime.now().date().isoformat()
+    if not debounce(f"daily_morning_report:{report_date}", REPORT_CLAIM_TTL):
+        logger.info(f"Daily morning reports for {report_date} were already dispatched")
+        return
+
+    with get_db(readonly=True) as db:
         eligible_user_ids = [
-            user_id
+            str(user_id)
             for user_id, in db.query(User.id)
             .filter(User.membership_status.in_([MembershipStatus.ACTIVE, MembershipStatus.TRIAL]))
             .all()
         ]
 
-    logger.info(f"Processing daily morning reports for {len(eligible_user_ids)} eligible users")
+    logger.info(f"Dispatching daily morning reports for {len(eligible_user_ids)} eligible users")
+
+    progress_key = _report_progress_key(report_date)
+    pipe = cache.pipeline()
+    pipe.delete(progress_key)
+    pipe.hset(progress_key, mapping={"total": len(eligible_user_ids), "started_at": time.time()})
+    pipe.expire(progress_key, REPORT_PROGRESS_TTL)
+    pipe.execute()
 
-    # Process each user with their own isolated database session
     for user_id in eligible_user_ids:
-        try:
-            with get_db() as db:
-                user = db.query(User).filter(User.id == user_id).first()
-                if user:
-                    _generate_daily_report_for_user(db, user)
-                else:
-                    logger.warning(f"User {user_id} not found when processing daily report")
-        except Exception as e:
+        daily_morning_report_for_user.delay(user_id, report_date)
+
+
+@shared_task(name="daily_morning_report_for_user", bind=True, max_retries=3)
+def daily_morning_report_for_user(self, user_id: str, report_date: str):
+    """
+    Generate and send one user's daily morning report.
+
+    Idempotent per day: a Redis claim stops duplicate deliveries of this job from running
+    concurrently, and a report already marked as sent today is never sent again. A report
+    SES did not accept is retried with backoff, resending the report already generated.
+
+    Args:
+        user_id (str): ID of the user to report on
+        report_date (str): ISO date of the report run
+    """
+    claim_key = f"daily_report:claim:{report_date}:{user_id}"
+    if not cache.set(claim_key, 1, nx=True, ex=REPORT_CLAIM_TTL):
+        logger.info(f"Daily morning report for user {user_id} is already claimed")
+        return
+
+    try:
+        with get_db() as db:
+            user = db.query(User).filter(User.id == user_id).first()
+            if not user:
+                logger.warning(f"User {user_id} not found when processing daily report")
+                sent = False
+            elif _report_already_sent(db, user_id, report_date):
+                logger.info(f"Daily morning report for user {user_id} was already sent")
+                sent = False
+            elif unsent := _unsent_report(db, user_id, report_date):
+                # A retry after a failed delivery sends the report it already generated
+                _send_daily_report(db, user, unsent)
+                sent = True
+            else:
+                sent = _generate_daily_report_for_user(db, user)
+    except Exception as e:
+        # Release the claim so the retry (or a manual rerun) can pick the user up again
+        cache.delete(claim_key)
+        if self.request.retries >= self.max_retries:
             logger.error(
                 f"Error generating daily morning report for user {user_id}: {e}", exc_info=True
             )
+            _record_report_progress(report_date, "failed")
+            raise
+        raise self.retry(exc=e, countdown=30 * (self.request.retries + 1))
+
+    _record_report_progress(report_date, "sent" if sent else "skipped")
 
 
 @shared_task(name="daily_evening_report")
@@ -1,35 +1,62 @@
-import asyncio
 import logging
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from typing import List, Set
 
 from celery import shared_task
+from sqlalchemy import or_, text, update
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 from tqdm import tqdm
 
 from src.base import Message
 from src.base.outlook_message import OutlookMessage
+from src.celery_tasks.call_tasks import schedule_call_brief_refresh
 from src.database import Email, EmailAccount, Token, User, get_db
+from src.database.cache import cache
 from src.database.contact import Contact
 from src.database.email_account import EmailAccountStatus, EmailProvider
 from src.database.email_attachment import EmailAttachment
-from src.database.email_label import EmailLabel
-from src.database.notification import Notification
 from src.database.settings import Settings
 from src.database.user import MembershipStatus
 from src.database.weekly_recap import WeeklyEmailRecap
-from src.libs.const import DISCORD_USER_ALERTS_CHANNEL
+from src.libs.const import (
+    ATTACHMENT_DOWNLOAD_CONCURRENCY,
+    DISCORD_USER_ALERTS_CHANNEL,
+    TOKEN_REFRESH_AHEAD_SECONDS,
+)
 from src.libs.discord_service import send_discord_message
+from src.libs.event_loop import run_async
+from src.libs.events import EMAILS_CHANGED, publish
 from src.libs.llm_utils import classify_email
+from src.libs.locks import distributed_lock
+from src.libs.metrics import SYNC_ACCOUNT_DURATION, count_items, timed
 from src.libs.text_utils import summarize_text
 from src.libs.types import EmailFolder
 from src.services import GmailService
 from src.services.outlook_service import OutlookService
+from src.services.storage_service import get_storage_service
+from src.services.token_manager import token_manager
 
 MINUTES = 60 * 24
 BACKFILL_DAYS = 3
 CHUNK_SIZE = 100  # Define the size of each chunk
+ENRICHMENT_LOOKBACK_DAYS = 7
+SKIP_ENRICHMENT_FOLDERS = [
+    EmailFolder.TRASH.value,
+    EmailFolder.SPAM.value,
+    EmailFolder.DRAFTS.value,
+]
+# Emails rendered in the inbox, waiting for flush_shown_emails to mark them as shown
+SHOWN_EMAILS_KEY = "shown_emails:pending"
+SHOWN_EMAILS_FLUSH_BATCH = 1000
+TOKEN_REFRESH_CONCURRENCY = 8
+# An email stays marked as queued for enrichment this long, so the sweeper does not queue
+# it again while its enrich_emails message waits behind a backlog
+ENRICH_QUEUED_TTL = 2 * 60 * 60
+ENRICH_LOCK_MAX_RETRIES = 8
 
 logging.basicConfig(
     level=logging.WARNING, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -43,24 +70,33 @@ logging.getLogger("openai").setLevel(logging.ERROR)
 logging.getLogger("httpx").setLevel(logging.WARNING)  # openai uses httpx under the hood
 
 
-@shared_task(name="ingest_email")
-def ingest_email(email_account_id: str):
+@shared_task(name="ingest_email", bind=True, max_retries=None)
+def ingest_email(self, email_account_id: str):
+    """
+    Backfill a newly connected account.
+
+    Waits for as long as a scheduled sync holds the account, giving up would leave it
+    never ingested. The sync ends eventually and a crashed worker's lease expires. Once it
+    has the lock, an account that another ingest already started or finished is skipped.
+    """
     logger.info(f"Ingesting emails for {email_account_id}")
-    with get_db() as db:
+    with get_db() as db, distributed_lock(f"sync:{email_account_id}") as acquired:
+        if not acquired:
+            # A scheduled sync is already working on this account, try again shortly
+            raise self.retry(countdown=30)
         email_account = db.query(EmailAccount).get(email_account_id)
-        if email_account.status == EmailAccountStatus.NOT_STARTED:
+        if email_account.status != EmailAccountStatus.NOT_STARTED:
+            logger.info(f"Account {email_account_id} was already ingested, skipping")
+        else:
             try:
                 from_date = _calculate_sync_date(email_account)
                 email_account.status = EmailAccountStatus.SYNCING
                 db.add(email_account)
                 db.commit()
 
-                # Fetch and process emails
+                # Fetch and process emails, new emails are queued for enrichment as they land
                 _process_email_account(db, email_account, from_date)
 
-                # Embed new emails
-                embed_new_emails.delay(str(email_account.user_id))
-
                 # Embed new attachments
                 embed_new_attachments.delay(str(email_account.user_id))
 
@@ -85,7 +121,17 @@ def get_new_emails(user_id: str = None):
     - Chunks email insertions
     - Logs detailed error information
     - Ensures minimal disruption if one account fails
+    - Skips accounts that another worker is already syncing
     """
+    # Only one full beat run at a time; a user-triggered run is scoped to that user
+    with distributed_lock(f"get_new_emails:{user_id or 'all'}") as acquired:
+        if not acquired:
+            logger.info(f"get_new_emails already running for {user_id or 'all users'}, skipping")
+            return
+        _sync_email_accounts(user_id)
+
+
+def _sync_email_accounts(user_id: str = None):
     try:
         with get_db() as db:
             if user_id:
@@ -102,11 +148,17 @@ def get_new_emails(user_id: str = None):
                 ):
                     continue
                 try:
-                    # Determine date range for email fetch
-                    from_date = _calculate_sync_date(email_account)
+                    with distributed_lock(f"sync:{email_account.id}") as acquired:
+                        if not acquired:
+                            logger.info(f"Account {email_account.id} is already syncing, skipping")
+                            continue
 
-                    # Fetch and process emails
-                    _process_email_account(db, email_account, from_date)
+                        # Determine date range for email fetch
+                        from_date = _calculate_sync_date(email_account)
+
+                        # Fetch and process emails
+                        with timed(SYNC_ACCOUNT_DURATION, provider=email_account.provider.value):
+                            _process_email_account(db, email_account, from_date)
 
                 except Exception as account_error:
                     logger.error(
@@ -207,9 +259,9 @@ def _process_outlook_folder(
         Set[str]: Set of new message IDs processed
     """
     if folder == EmailFolder.INBOX:
-        messages = asyncio.run(outlook_service.list_messages(from_date))
+        messages = run_async(outlook_service.list_messages(from_date))
     else:
-        messages = asyncio.run(outlook_service.list_messages_for_folder(folder, from_date))
+        messages = run_async(outlook_service.list_messages_for_folder(folder, from_date))
 
     if len(messages) > 0:
         message_ids = [message.id for message in messages]
@@ -367,12 +419,13 @@ def _insert_new_emails(
 
             # Commit in chunks
             if len(emails_created) >= CHUNK_SIZE:
-                _commit_emails(db, emails_created)
+                _commit_emails(db, email_account, emails_created, attachments_created)
                 if email_account.status != EmailAccountStatus.SUCCESS:
                     email_account.status = EmailAccountStatus.SUCCESS
                     db.add(email_account)
                     db.commit()
                 emails_created = []
+                attachments_created = []
 
         except Exception as message_error:
             logger.warning(
@@ -382,7 +435,7 @@ def _insert_new_emails(
 
     # Commit any remaining emails
     if emails_created:
-        _commit_emails(db, emails_created, attachments_created)
+        _commit_emails(db, email_account, emails_created, attachments_created)
 
 
 def _insert_new_outlook_emails(
@@ -414,7 +467,7 @@ def _insert_new_outlook_emails(
                     email_account=email_account, message=message, folder=EmailFolder.INBOX
                 )
                 emails_created.append(email)
-                for attachment in asyncio.run(
+                for attachment in run_async(
                     outlook_service.get_attachments(message.get_email_id())
                 ):
                     outlook_attachment = EmailAttachment(
@@ -444,7 +497,7 @@ def _insert_new_outlook_emails(
                 email = Email(email_account=email_account, message=message, folder=folder)
                 emails_created.append(email)
                 if folder == EmailFolder.INBOX or folder == EmailFolder.SENT:
-                    for attachment in asyncio.run(
+                    for attachment in run_async(
                         outlook_service.get_attachments(message.get_email_id())
                     ):
                         outlook_attachment = EmailAttachment(
@@ -457,7 +510,7 @@ def _insert_new_outlook_emails(
                         attachments_created.append(outlook_attachment)
             # Commit in chunks
             if len(emails_created) >= CHUNK_SIZE:
-                _commit_emails(db, emails_created, attachments_created)
+                _commit_emails(db, email_account, emails_created, attachments_created)
                 if email_account.status != EmailAccountStatus.SUCCESS:
                     email_account.status = EmailAccountStatus.SUCCESS
                     db.add(email_account)
@@ -471,26 +524,45 @@ def _insert_new_outlook_emails(
             )
 
     if emails_created:
-        _commit_emails(db, emails_created, attachments_created)
+        _commit_emails(db, email_account, emails_created, attachments_created)
 
 
-def _commit_emails(db: Session, emails: List[Email], attachments: List[EmailAttachment] = None):
+def _commit_emails(
+    db: Session,
+    email_account: EmailAccount,
+    emails: List[Email],
+    attachments: List[EmailAttachment] = None,
+):
     """
-    Commit emails to the database with error handling.
+    Commit emails to the database with error handling and queue them for enrichment.
 
     Args:
         db (Session): Database session
+        email_account (EmailAccount): Email account the emails belong to
         emails (List[Email]): List of emails to commit
+        attachments (List[EmailAttachment]): Attachments of the emails
     """
+    # Read before commit, committed instances are expired and would reload one by one
+    email_ids = [str(email.id) for email in emails if email.folder not in SKIP_ENRICHMENT_FOLDERS]
+    folders = {email.folder for email in emails}
+    user_id = str(email_account.user_id)
     try:
         db.add_all(emails)
         if attachments:
             db.add_all(attachments)
         db.commit()
         logger.info(f"Committed {len(emails)} new emails")
+        count_items("ingest", "emails", len(emails))
+        count_items("ingest", "attachments", len(attachments or []))
     except SQLAlchemyError as commit_error:
         db.rollback()
         logger.error(f"Failed to commit emails: {commit_error}", exc_info=True)
+        return
+
+    publish(EMAILS_CHANGED, user_id=user_id, folders=folders)
+    if email_ids:
+        _queue_enrichment(user_id, email_ids)
+    schedule_call_brief_refresh(user_id)
 
 
 def _finalize_account_sync(db: Session, email_account: EmailAccount):
@@ -512,259 +584,527 @@ def _finalize_account_sync(db: Session, email_account: EmailAccount):
         db.rollback()
 
 
-def _check_and_add_to_weekly_recap(db: Session, email_account_id: str, emails: List[Email]):
-    emails_to_add = []
+WEEKLY_RECAP_CATEGORIES = {"newsletter", "promo", "other"}
+
+
+def _check_and_add_to_weekly_recap(db: Session, emails: List[Email]):
+    email_ids_by_account: dict[str, List[str]] = {}
 
     for email in emails:
-        if email.categories and (
-            "newsletter" in email.categories
-            or "promo" in email.categories
-            or "other" in email.categories
-        ):
-            emails_to_add.append(email.id)
-    if emails_to_add:
-        WeeklyEmailRecap.add_to_latest_recap(db, email_account_id, emails_to_add)
+        if email.categories and WEEKLY_RECAP_CATEGORIES.intersection(email.categories):
+            email_ids_by_account.setdefault(str(email.email_account_id), []).append(str(email.id))
+    if email_ids_by_account:
+        WeeklyEmailRecap.add_to_current_recaps(db, email_ids_by_account)
+
+
+def _enrich_queued_key(email_id: str) -> str:
+    return f"enrich:queued:{email_id}"
+
+
+def _queue_enrichment(user_id: str, email_ids: List[str]) -> int:
+    """Queue emails for enrichment in chunks, skipping those already queued."""
+    pipe = cache.pipeline(transaction=False)
+    for email_id in email_ids:
+        pipe.set(_enrich_queued_key(email_id), 1, nx=True, ex=ENRICH_QUEUED_TTL)
+    email_ids = [email_id for email_id, queued in zip(email_ids, pipe.execute()) if queued]
+    for start in range(0, len(email_ids), CHUNK_SIZE):
+        enrich_emails.delay(user_id, email_ids[start : start + CHUNK_SIZE])
+    return len(email_ids)
+
+
+def _release_enrichment(email_ids: List[str]):
+    if email_ids:
+        cache.delete(*[_enrich_queued_key(email_id) for email_id in email_ids])
+
+
+@shared_task(name="enrich_emails", bind=True, max_retries=ENRICH_LOCK_MAX_RETRIES)
+def enrich_emails(self, user_id: str, email_ids: List[str]):
+    """
+    Classify, summarize and file a batch of newly ingested emails.
+
+    Emitted by ingestion right after a chunk of emails is committed, so enrichment runs
+    seconds after sync instead of waiting for the next beat. Emails that are already
+    processed are skipped, which makes duplicate deliveries harmless.
+
+    Batches of one user run one at a time. A batch waiting for another backs off, and
+    after ENRICH_LOCK_MAX_RETRIES attempts leaves its emails to the embed_new_emails sweep.
+    """
+    with distributed_lock(f"embed_new_emails:{user_id}") as acquired:
+        if not acquired:
+            if self.request.retries >= self.max_retries:
+                logger.warning(f"Leaving {len(email_ids)} emails of {user_id} to the sweep")
+                _release_enrichment(email_ids)
+                return
+            # Another batch for this user is in flight, back off with jitter so queued
+            # batches do not all poll together
+            countdown = min(300, 10 * 2**self.request.retries)
+            raise self.retry(countdown=random.uniform(countdown / 2, countdown))
+        try:
+            _enrich_queued_emails(user_id, email_ids)
+        finally:
+            _release_enrichment(email_ids)
+
+
+def _enrich_queued_emails(user_id: str, email_ids: List[str]):
+    with get_db() as db:
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user or user.membership_status == MembershipStatus.INACTIVE:
+            return
+        emails = (
+            db.query(Email)
+            .filter(
+                Email.id.in_(email_ids),
+                Email.processed == False,
+                Email.folder.notin_(SKIP_ENRICHMENT_FOLDERS),
+            )
+            .all()
+        )
+        if emails:
+            _enrich_emails(db, user, emails)
+
+
+@shared_task(name="refresh_expiring_tokens")
+def refresh_expiring_tokens():
+    """
+    Refresh provider tokens of active users that are about to expire.
+
+    Keeps the shared token cache warm, so sync tasks and API requests find a fresh
+    access token instead of waiting for an OAuth round trip.
+    """
+    horizon = datetime.utcnow() + timedelta(seconds=2 * TOKEN_REFRESH_AHEAD_SECONDS)
+    with get_db() as db:
+        expiring = (
+            db.query(Token.id, EmailAccount.provider)
+            .join(EmailAccount, Token.email_account_id == EmailAccount.id)
+            .join(User, User.id == EmailAccount.user_id)
+            .filter(
+                or_(Token.expires_at.is_(None), Token.expires_at < horizon),
+                User.membership_status != MembershipStatus.INACTIVE,
+            )
+            .all()
+        )
+
+    def refresh(token_id, provider):
+        try:
+            token_manager.refresh(token_id, provider.value, wait=False)
+        except Exception as e:
+            logger.warning(f"Could not refresh token {token_id}: {e}")
+
+    with ThreadPoolExecutor(max_workers=TOKEN_REFRESH_CONCURRENCY) as executor:
+        for token_id, provider in expiring:
+            executor.submit(refresh, token_id, provider)
 
 
 @shared_task(name="embed_new_emails")
 def embed_new_emails(user_id: str = None):
+    """
+    Sweep for unprocessed emails that were never enriched (e.g. a lost enrich_emails
+    message) and queue them in batches. Emails still waiting in the queue are skipped.
+
+    One query covers every user, so users without new mail cost nothing.
+    """
     with get_db() as db:
-        if user_id:
-            users = [db.query(User).filter(User.id == user_id).first()]
-        else:
-            users = db.query(User).all()
-        for user in users:
-            if user.membership_status == MembershipStatus.INACTIVE:
-                continue
-            user_id = user.id
-            one_week_ago = datetime.now() - timedelta(days=7)
-            emails = (
-                db.query(Email)
-                .filter(
-                    Email.email_account.has(user_id=user_id),
-                    Email.processed == False,
-                    Email.folder.notin_(
-                        [
-                            EmailFolder.TRASH.value,
-                            EmailFolder.SPAM.value,
-                            EmailFolder.DRAFTS.value,
-                        ]
-                    ),
-                    Email.created_at >= one_week_ago,
-                )
-                .all()
+        one_week_ago = datetime.now() - timedelta(days=ENRICHMENT_LOOKBACK_DAYS)
+        query = (
+            db.query(EmailAccount.user_id, Email.id)
+            .join(Email, Email.email_account_id == EmailAccount.id)
+            .join(User, User.id == EmailAccount.user_id)
+            .filter(
+                Email.processed == False,
+                Email.folder.notin_(SKIP_ENRICHMENT_FOLDERS),
+                Email.created_at >= one_week_ago,
+                User.membership_status != MembershipStatus.INACTIVE,
             )
+        )
+        if user_id:
+            query = query.filter(EmailAccount.user_id == user_id)
 
-            # Process emails in batches of 20
-            logger.info(f"Embedding emails and storing in VectorDB for user: {user_id}")
-            processed_email_count = 0
-
-            for email in emails:
-                # classify email
-                if not email.categories:
-                    category, res = classify_email(email.content)
-                    logging.info(f"Category: {category}, Email ID: {email.id}")
-                    if not category or len(category) == 0 or category == ["error"]:
-                        logger.error(
-                            f"Error classifying email {email.id}: {email.content}. Response: {res}"
-                        )
-                    else:
-                        email.categories = category
-                        db.add(email)
-                        db.commit()
-
-                Contact.get_or_create_contact(
-                    db,
-                    email_account_id=str(email.email_account_id),
-                    email_address=email.sender[0],
-                    name=email.sender_name[0] if len(email.sender_name) > 0 else "",
+        pending: dict[str, List[str]] = {}
+        for email_user_id, email_id in query:
+            pending.setdefault(str(email_user_id), []).append(str(email_id))
+
+    for email_user_id, email_ids in pending.items():
+        queued = _queue_enrichment(email_user_id, email_ids)
+        logger.info(f"Queued {queued} unprocessed emails for user {email_user_id}")
+        count_items("embed_new_emails", "emails_queued", queued)
+
+
+def _enrich_emails(db: Session, user: User, emails: List[Email]):
+    user_id = user.id
+    folders = {email.folder for email in emails}
+    logger.info(f"Embedding emails and storing in VectorDB for user: {user_id}")
+    processed_email_count = 0
+    senders = []
+
+    for email in emails:
+        # classify email
+        if not email.categories:
+            category, res = classify_email(email.content)
+            logging.info(f"Category: {category}, Email ID: {email.id}")
+            if not category or len(category) == 0 or category == ["error"]:
+                logger.error(
+                    f"Error classifying email {email.id}: {email.content}. Response: {res}"
                 )
-                # response = Email.embed_and_store(user_id=user_id, email=email)
-                processed_email_count += 1
-                # if response:
-                email.processed = True
+            else:
+                email.categories = category
                 db.add(email)
                 db.commit()
 
-            logger.info(f"Finished embedding and storing in VectorDB for user: {user_id}")
+        if email.sender:
+            senders.append(
+                (
+                    email.email_account_id,
+                    email.sender[0],
+                    email.sender_name[0] if email.sender_name else "",
+                )
+            )
+        # response = Email.embed_and_store(user_id=user_id, email=email)
+        processed_email_count += 1
+        # if response:
+        email.processed = True
+        db.add(email)
+        db.commit()
 
-            # Add emails to weekly recap for each email account
-            email_accounts = db.query(EmailAccount).filter(EmailAccount.user_id == user_id).all()
-            for email_account in email_accounts:
-                account_emails = [
-                    email for email in emails if email.email_account_id == email_account.id
-                ]
-                if account_emails:
-                    _check_and_add_to_weekly_recap(db, email_account.id, account_emails)
-
-            logger.info(f"Added emails to weekly recap for user: {user_id}")
-
-            logger.info(f"Generating summaries for {len(emails)} emails...")
-            for email in emails:
-                if email.summary is None:
-                    summary = summarize_text(
-                        content=f"{email.subject} {email.content}", name=user.name
-                    )
-                    email.summary = summary
-                    db.add(email)
-            db.commit()
-            logger.info("Finished generating summaries.")
+    logger.info(f"Finished embedding and storing in VectorDB for user: {user_id}")
+    count_items("enrich_emails", "emails", processed_email_count)
+
+    Contact.bulk_upsert(db, senders)
+
+    # Add emails to the current weekly recap of their email accounts
+    _check_and_add_to_weekly_recap(db, emails)
+
+    logger.info(f"Added emails to weekly recap for user: {user_id}")
+
+    logger.info(f"Generating summaries for {len(emails)} emails...")
+    for email in emails:
+        if email.summary is None:
+            summary = summarize_text(content=f"{email.subject} {email.content}", name=user.name)
+            email.summary = summary
+            db.add(email)
+    db.commit()
+    logger.info("Finished generating summaries.")
+    publish(EMAILS_CHANGED, user_id=user_id, folders=folders)
+
+    # The brief reads summaries, rebuild it now that they exist
+    schedule_call_brief_refresh(user_id)
 
 
 @shared_task(name="embed_new_attachments")
 def embed_new_attachments(user_id: str = None):
+    with distributed_lock(f"embed_new_attachments:{user_id or 'all'}") as acquired:
+        if not acquired:
+            logger.info(f"embed_new_attachments already running for {user_id or 'all users'}")
+            return
+        _store_pending_attachments(user_id)
+
+
+def _store_pending_attachments(user_id: str = None):
+    """
+    Download and upload all unprocessed attachments with bounded parallelism.
+
+    Downloads run in a thread pool of ATTACHMENT_DOWNLOAD_CONCURRENCY workers. Each
+    thread lazily builds its own provider client per account since the underlying HTTP
+    clients are not thread safe. All database writes stay on the calling thread.
+    """
     with get_db() as db:
-        users = db.query(User).all()
-        for user in users:
-            user_id = user.id
-            if user.membership_status == MembershipStatus.INACTIVE:
-                continue
-            ##### Gmail #####
-            print("Embedding new attachments for Gmail for user: ", user_id)
-            email_accounts = (
-                db.query(EmailAccount)
-                .filter(
-                    EmailAccount.user_id == user_id, EmailAccount.provider == EmailProvider.GMAIL
-                )
-                .all()
+        query = (
+            db.query(EmailAttachment, Email.email_id, EmailAccount)
+            .join(Email, EmailAttachment.email_id == Email.id)
+            .join(EmailAccount, Email.email_account_id == EmailAccount.id)
+            .join(User, User.id == EmailAccount.user_id)
+            .filter(
+                EmailAttachment.processed == False,
+                User.membership_status != MembershipStatus.INACTIVE,
             )
-            for email_account in email_accounts:
-                gmail_service = GmailService(email_account.token)
+        )
+        if user_id:
+            query = query.filter(EmailAccount.user_id == user_id)
+        pending = query.all()
+        if not pending:
+            return
+        logger.info(f"Storing {len(pending)} attachments")
+
+        accounts = {}
+        for _, _, email_account in pending:
+            if email_account.id not in accounts and email_account.token:
+                # Detach so worker threads can read the token without touching the session
+                token = email_account.token
+                db.expunge(token)
+                accounts[email_account.id] = (email_account.provider, token)
+
+        thread_state = threading.local()
+        stored_for = set()
+
+        def store(email_account_id, message_id: str, attachment_id: str, content_type: str):
+            services = thread_state.__dict__.setdefault("services", {})
+            provider, token = accounts[email_account_id]
+            if email_account_id not in services:
+                if provider == EmailProvider.GMAIL:
+                    services[email_account_id] = GmailService(token)
+                else:
+                    services[email_account_id] = OutlookService(token)
+            service = services[email_account_id]
+            return EmailAttachment.download_and_store(
+                message_id=message_id,
+                attachment_id=attachment_id,
+                content_type=content_type,
+                gmail_service=service if provider == EmailProvider.GMAIL else None,
+                outlook_service=service if provider == EmailProvider.OUTLOOK else None,
+            )
+
+        with ThreadPoolExecutor(max_workers=ATTACHMENT_DOWNLOAD_CONCURRENCY) as executor:
+            futures = {
+                executor.submit(
+                    store,
+                    email_account.id,
+                    message_id,
+                    attachment.attachment_id,
+                    attachment.content_type,
+                ): (attachment, email_account)
+                for attachment, message_id, email_account in pending
+                if email_account.id in accounts
+            }
+            for count, future in enumerate(as_completed(futures), start=1):
+                attachment, email_account = futures[future]
                 try:
-                    attachments = (
-                        db.query(EmailAttachment)
-                        .join(Email)
-                        .filter(
-                            Email.email_account_id == email_account.id,
-                            EmailAttachment.processed == False,
-                        )
-                        .all()
-                    )
+                    stored = future.result()
                 except Exception as e:
-                    logger.error(
-                        f"Error getting attachments for user {user_id}: {e}", exc_info=True
-                    )
+                    # Left unprocessed so the next run retries it
+                    logger.error(f"Error storing attachment {attachment.id}: {e}", exc_info=True)
                     continue
 
-                if attachments and len(attachments) > 0:
-                    for attachment in attachments:
-                        try:
-                            attachment.embed_and_store(
-                                user_id=user_id,
-                                email_id=attachment.email.email_id,
-                                attachment=attachment,
-                                gmail_service=gmail_service,
-                            )
-                            attachment.processed = True
-                            db.add(attachment)
-                        except Exception as e:
-                            logger.error(
-                                f"Error embedding attachment for user {user_id}: {e}", exc_info=True
-                            )
-                            continue
-                    db.commit()
-
-            ##### Outlook #####
-            print("Embedding new attachments for Outlook for user: ", user_id)
-            email_accounts = (
-                db.query(EmailAccount)
-                .filter(
-                    EmailAccount.user_id == user_id, EmailAccount.provider == EmailProvider.OUTLOOK
-                )
-                .all()
-            )
-            for email_account in email_accounts:
-                outlook_service = OutlookService(email_account.token)
-                attachments = (
-                    db.query(EmailAttachment)
-                    .join(Email)
-                    .filter(
-                        Email.email_account_id == email_account.id,
-                        EmailAttachment.processed == False,
-                    )
-                    .all()
-                )
-                if attachments and len(attachments) > 0:
-                    for attachment in attachments:
-                        try:
-                            attachment.embed_and_store(
-                                user_id=user_id,
-                                email_id=attachment.email.email_id,
-                                attachment=attachment,
-                                outlook_service=outlook_service,
-                            )
-                            attachment.processed = True
-                            db.add(attachment)
-                        except Exception as e:
-                            logger.error(
-                                f"Error embedding attachment for user {user_id}: {e}", exc_info=True
-                            )
-                            continue
+                attachment.filepath = stored["filepath"]
+                attachment.content_hash = stored["content_hash"]
+                attachment.size = stored["size"]
+                attachment.uploaded = True
+                attachment.processed = True
+                stored_for.add(email_account.user_id)
+                if count % CHUNK_SIZE == 0:
                     db.commit()
+        db.commit()
+        logger.info("Finished storing attachments")
+
+    # Listed emails link to their stored attachments
+    for owner_id in stored_for:
+        publish(EMAILS_CHANGED, user_id=owner_id)
+
+
+_USER_ACCOUNTS = "SELECT id FROM email_accounts WHERE user_id = :user_id"
+_USER_EMAILS = f"SELECT id FROM emails WHERE email_account_id IN ({_USER_ACCOUNTS})"
+_USER_LABELS = "SELECT id FROM email_labels WHERE user_id = :user_id"
+
+# Children before parents so every chunk satisfies the foreign keys
+DELETE_USER_STEPS = [
+    (
+        "email_label_association",
+        f"email_id IN ({_USER_EMAILS}) OR email_label_id IN ({_USER_LABELS})",
+    ),
+    ("email_attachments", f"email_id IN ({_USER_EMAILS})"),
+    (
+        "email_tasks",
+        f"email_account_id IN ({_USER_ACCOUNTS}) OR email_id IN ({_USER_EMAILS})",
+    ),
+    ("emails", f"email_account_id IN ({_USER_ACCOUNTS})"),
+    ("contacts", f"email_account_id IN ({_USER_ACCOUNTS})"),
+    ("weekly_email_recaps", f"email_account_id IN ({_USER_ACCOUNTS})"),
+    ("settings", f"email_account_id IN ({_USER_ACCOUNTS})"),
+    ("tokens", f"email_account_id IN ({_USER_ACCOUNTS})"),
+    ("email_accounts", "user_id = :user_id"),
+    ("notifications", "user_id = :user_id"),
+    ("email_labels", "user_id = :user_id"),
+    ("call_sessions", "user_id = :user_id"),
+    ("daily_reports", "user_id = :user_id"),
+    # llama-index stores the user in the node metadata, see VectorDB.insert
+    ("data_email_vectors", "metadata_->>'user_id' = :user_id"),
+    # Same for VectorDB.insert_transactions
+    ("data_transaction_vectors", "metadata_->>'user_id' = :user_id"),
+    ("users", "id = :user_id"),
+]
+DELETE_CHUNK_SIZE = 5000
+
+
+def _delete_in_chunks(db: Session, table: str, where: str, params: dict) -> int:
+    """
+    Delete the rows of `table` matching `where`, DELETE_CHUNK_SIZE at a time.
 
-            print("Finished embedding new attachments for user: ", user_id)
+    Each chunk is its own transaction, so a large mailbox never holds locks on (or
+    buffers) all of its rows at once. A table that does not exist has nothing to delete,
+    llama-index only creates its vector tables on the first insert.
+    """
+    if db.execute(text("SELECT to_regclass(:table)"), {"table": table}).scalar() is None:
+        logger.info(f"Skipping {table}, it does not exist")
+        return 0
+    stmt = text(
+        f"DELETE FROM {table} WHERE ctid IN "
+        f"(SELECT ctid FROM {table} WHERE {where} LIMIT :chunk_size)"
+    )
+    total = 0
+    while True:
+        deleted = db.execute(stmt, {**params, "chunk_size": DELETE_CHUNK_SIZE}).rowcount
+        db.commit()
+        total += deleted
+        if deleted < DELETE_CHUNK_SIZE:
+            return total
+
+
+def _delete_attachment_files(db: Session, user_id: str, content_hashes: List[str]) -> int:
+    """Remove the user's stored files, keeping deduplicated blobs other users still use."""
+    storage_service = get_storage_service()
+    # Files written before attachments were content addressed
+    deleted = storage_service.delete_prefix(f"attachments/{user_id}/")
+
+    if content_hashes:
+        orphaned_hashes = db.execute(
+            text(
+                "SELECT candidate.content_hash "
+                "FROM unnest(CAST(:content_hashes AS text[])) AS candidate(content_hash) "
+                "WHERE NOT EXISTS (SELECT 1 FROM email_attachments AS attachment "
+                "WHERE attachment.content_hash = candidate.content_hash)"
+            ),
+            {"content_hashes": content_hashes},
+        ).scalars()
+        for content_hash in list(orphaned_hashes):
+            deleted += EmailAttachment.delete_unused_file(db, content_hash)
+    return deleted
+
+
+@shared_task(name="delete_user", bind=True)
+def delete_user(self, user_id: str):
+    """
+    Purge a user and everything that belongs to them.
 
+    Rows are removed with set-based, chunked DELETEs in foreign key order, followed by
+    the user's vectors and stored attachment files. Progress is reported through the
+    task state (`PROGRESS` with the current step and per-table counts).
 
-@shared_task(name="delete_user")
-def delete_user(user_id: str):
+    Args:
+        user_id (str): ID of the user to delete
+    """
     with get_db() as db:
         user = db.query(User).filter(User.id == user_id).first()
-        if user:
-            user_email = user.email
+        if not user:
+            logger.warning(f"User with ID {user_id} not found")
+            return
+        user_email = user.email
+        params = {"user_id": str(user_id)}
+
+        content_hashes = list(
+            db.execute(
+                text(
+                    "SELECT DISTINCT content_hash FROM email_attachments "
+                    f"WHERE content_hash IS NOT NULL AND email_id IN ({_USER_EMAILS})"
+                ),
+                params,
+            ).scalars()
+        )
+        # Recaps are referenced back from email_accounts
+        db.execute(
+            text(
+                "UPDATE email_accounts SET current_weekly_recap_id = NULL "
+                "WHERE user_id = :user_id"
+            ),
+            params,
+        )
+        db.commit()
 
-            try:
-                emails = db.query(Email).filter(Email.email_account.has(user_id=user_id)).all()
-                for email in emails:
-                    db.delete(email)
-            except Exception as e:
-                logger.error(f"Error deleting emails for user {user_id}: {e}", exc_info=True)
-            try:
-                email_accounts = (
-                    db.query(EmailAccount).filter(EmailAccount.user_id == user_id).all()
-                )
-                for email_account in email_accounts:
-                    db.delete(email_account)
-            except Exception as e:
-                logger.error(
-                    f"Error deleting email accounts for user {user_id}: {e}", exc_info=True
-                )
+        deleted = {}
+        for step, (table, where) in enumerate(DELETE_USER_STEPS):
+            self.update_state(
+                state="PROGRESS",
+                meta={"step": table, "current": step, "total": len(DELETE_USER_STEPS) + 1},
+            )
+            deleted[table] = _delete_in_chunks(db, table, where, params)
+            logger.info(f"Deleted {deleted[table]} rows from {table} for user {user_id}")
+
+        self.update_state(
+            state="PROGRESS",
+            meta={
+                "step": "attachment_files",
+                "current": len(DELETE_USER_STEPS),
+                "total": len(DELETE_USER_STEPS) + 1,
+            },
+        )
+        try:
+            deleted["attachment_files"] = _delete_attachment_files(db, user_id, content_hashes)
+        except Exception as e:
+            logger.error(f"Error deleting attachment files for user {user_id}: {e}", exc_info=True)
 
-            try:
-                tokens = db.query(Token).filter(Token.user_id == user_id).all()
-                for token in tokens:
-                    db.delete(token)
-            except Exception as e:
-                logger.error(f"Error deleting tokens for user {user_id}: {e}", exc_info=True)
-            try:
-                notifications = db.query(Notification).filter(Notification.user_id == user_id).all()
-                for notification in notifications:
-                    db.delete(notification)
-            except Exception as e:
-                logger.error(f"Error deleting notifications for user {user_id}: {e}", exc_info=True)
-            try:
-                email_labels = db.query(EmailLabel).filter(EmailLabel.user_id == user_id).all()
-                for email_label in email_labels:
-                    db.delete(email_label)
-            except Exception as e:
-                logger.error(f"Error deleting email labels for user {user_id}: {e}", exc_info=True)
+    send_discord_message(f"User {user_email} has been deleted", DISCORD_USER_ALERTS_CHANNEL)
+    return deleted
 
-            db.delete(user)
-            db.commit()
-            send_discord_message(f"User {user_email} has been deleted", DISCORD_USER_ALERTS_CHANNEL)
-        else:
-            logger.warning(f"User with ID {user_id} not found")
+
+def _mark_emails_as_shown(db: Session, email_ids: List[str], invalidate: bool = True):
+    """
+    Flag emails as shown and decay their senders' scores, two statements in total.
+
+    Args:
+        invalidate: Publish EMAILS_CHANGED for the emails that changed. Emails recorded by
+            the email list are already shown in its cached pages, they do not need it.
+    """
+    shown = db.execute(
+        update(Email)
+        .where(
+            Email.id.in_(email_ids),
+            or_(Email.is_shown.is_(None), Email.is_shown == False),
+            Email.email_account_id == EmailAccount.id,
+        )
+        .values(is_shown=True)
+        .returning(Email.email_account_id, Email.sender, Email.folder, EmailAccount.user_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.commit()
+
+    Contact.apply_score_events(
+        db,
+        [
+            (email_account_id, sender)
+            for email_account_id, senders, _, _ in shown
+            for sender in senders or []
+        ],
+        -1,
+    )
+
+    if not invalidate:
+        return
+    folders_by_user = {}
+    for _, _, folder, user_id in shown:
+        folders_by_user.setdefault(user_id, set()).add(folder)
+    for user_id, folders in folders_by_user.items():
+        publish(EMAILS_CHANGED, user_id=user_id, folders=folders)
+
+
+def record_shown_emails(email_ids: List[str]):
+    """Queue emails rendered in the inbox; flush_shown_emails persists them in bulk."""
+    if email_ids:
+        cache.sadd(SHOWN_EMAILS_KEY, *[str(email_id) for email_id in email_ids])
 
 
 @shared_task(name="mark_emails_as_shown")
 def mark_emails_as_shown(email_ids: List[str]):
     with get_db() as db:
-        emails = db.query(Email).filter(Email.id.in_(email_ids)).all()
-        for email in emails:
-            if email.is_shown is None or email.is_shown == False:
-                email.mark_as_shown(db)
-                contacts = db.query(Contact).filter(Contact.email_address.in_(email.sender))
-                for contact in contacts:
-                    contact.increment_score(db, -1)
+        _mark_emails_as_shown(db, email_ids)
+
+
+@shared_task(name="flush_shown_emails")
+def flush_shown_emails():
+    """
+    Drain the emails queued by record_shown_emails and mark them as shown.
+
+    Page views only add IDs to a Redis set, so repeated loads of the same page collapse
+    into one entry and Postgres sees one batched update per flush. The list caches its
+    pages with these emails already shown, so flushing does not invalidate them; pages
+    filtered by account may show them as new until they expire.
+    """
+    while email_ids := cache.spop(SHOWN_EMAILS_KEY, SHOWN_EMAILS_FLUSH_BATCH):
+        email_ids = [email_id.decode() for email_id in email_ids]
+        try:
+            with get_db() as db:
+                _mark_emails_as_shown(db, email_ids, invalidate=False)
+        except Exception as e:
+            logger.error(f"Error flushing {len(email_ids)} shown emails: {e}", exc_info=True)
+            # Put them back for the next flush
+            cache.sadd(SHOWN_EMAILS_KEY, *email_ids)
+            return
 
 
 @shared_task(name="create_weekly_recap")
@@ -782,11 +1122,11 @@ def create_weekly_recap(user_id: str = None):
 
             email_accounts = db.query(EmailAccount).filter(EmailAccount.user_id == user_id).all()
             for email_account in email_accounts:
-                if latest_recap := WeeklyEmailRecap.get_latest_recap(
+                if current_recap := WeeklyEmailRecap.get_current_recap(
                     db, email_account_id=email_account.id
                 ):
-                    latest_recap.completed = True
-                    db.add(latest_recap)
+                    current_recap.completed = True
+                    db.add(current_recap)
 
                 new_weekly_recap = WeeklyEmailRecap(
                     email_account_id=email_account.id,
@@ -794,4 +1134,6 @@ def create_weekly_recap(user_id: str = None):
                     week_end=datetime.now() + timedelta(days=7),
                 )
                 db.add(new_weekly_recap)
+                db.flush()
+                email_account.current_weekly_recap_id = new_weekly_recap.id
                 db.commit()
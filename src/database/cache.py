@@ -1,5 +1,8 @@
 import redis
+import redis.asyncio
 
 from src.libs.const import CELERY_BROKER_URL
 
 cache = redis.from_url(CELERY_BROKER_URL)
+# For async routes, so cache round trips do not block the event loop
+async_cache = redis.asyncio.from_url(CELERY_BROKER_URL)
@@ -1,9 +1,10 @@
+import json
 import uuid
 from datetime import datetime
 from enum import Enum
 
-from sqlalchemy import ARRAY, JSON, UUID, Boolean, Column, DateTime, ForeignKey, String
-from sqlalchemy.orm import relationship
+from sqlalchemy import ARRAY, JSON, UUID, Boolean, Column, DateTime, ForeignKey, String, text
+from sqlalchemy.orm import Session, relationship
 
 from src.database.db import Base
 
@@ -37,6 +38,20 @@ class FollowUpTask:
         }
 
 
+# Appends in one statement, so concurrent tool calls of a call cannot overwrite each other
+_APPEND_FOLLOW_UP_TASK = text(
+    """
+    UPDATE call_sessions
+    SET follow_up_tasks = array_append(
+            COALESCE(follow_up_tasks, ARRAY[]::json[]), CAST(:task AS json)
+        ),
+        updated_at = now()
+    WHERE call_control_id = :call_control_id
+    RETURNING user_id
+    """
+)
+
+
 class CallSession(Base):
     __tablename__ = "call_sessions"
     id = Column(UUID, primary_key=True, index=True, default=uuid.uuid4)
@@ -66,3 +81,31 @@ class CallSession(Base):
             "is_completed": self.is_completed,
             "is_processed": self.is_processed,
         }
+
+    @classmethod
+    def append_follow_up_task(cls, db: Session, call_control_id: str, task: FollowUpTask):
+        """
+        Record a follow up task on a call session.
+
+        Returns:
+            The ID of the user on the call, or None if there is no session for the call
+        """
+        user_id = db.execute(
+            _APPEND_FOLLOW_UP_TASK,
+            {"call_control_id": call_control_id, "task": json.dumps(task.to_dict())},
+        ).scalar()
+        db.commit()
+        return user_id
+
+    @classmethod
+    def mark_completed(cls, db: Session, call_control_ids: list[str]) -> int:
+        """Close the sessions of calls that ended, in one statement."""
+        if not call_control_ids:
+            return 0
+        updated = (
+            db.query(cls)
+            .filter(cls.call_control_id.in_(call_control_ids), cls.is_completed == False)
+            .update({cls.is_completed: True}, synchronize_session=False)
+        )
+        db.commit()
+        return updated
@@ -1,14 +1,46 @@
 import uuid
+from collections import Counter
 from datetime import datetime
+from typing import Iterable, Tuple
 
-from sqlalchemy import UUID, Column, DateTime, Float, ForeignKey, String
+from sqlalchemy import UUID, Column, DateTime, Float, ForeignKey, Index, String, text
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session, relationship
 
 from src.database.db import Base
 
+# Applying the moving average `score = a * value + (1 - a) * score` n times with the same
+# value collapses to `value * (1 - (1 - a)^n) + (1 - a)^n * score`, so any number of
+# events per contact is folded into one row update.
+_APPLY_SCORE_EVENTS = text(
+    """
+    UPDATE contacts AS contact
+    SET score = :value * (1 - power(1 - :alpha, events.n))
+            + power(1 - :alpha, events.n) * COALESCE(contact.score, 0),
+        updated_at = now()
+    FROM (
+        SELECT
+            unnest(CAST(:email_account_ids AS uuid[])) AS email_account_id,
+            unnest(CAST(:email_addresses AS text[])) AS email_address,
+            unnest(CAST(:counts AS integer[])) AS n
+    ) AS events
+    WHERE contact.email_account_id = events.email_account_id
+      AND contact.email_address = events.email_address
+    """
+)
+
 
 class Contact(Base):
     __tablename__ = "contacts"
+    __table_args__ = (
+        Index(
+            "uq_contacts_email_account_id_email_address",
+            "email_account_id",
+            "email_address",
+            unique=True,
+        ),
+    )
+
     id = Column(UUID, primary_key=True, index=True, default=uuid.uuid4)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
@@ -32,31 +64,60 @@ class Contact(Base):
         }
 
     @classmethod
-    def get_or_create_contact(
-        cls, db: Session, email_account_id: str, email_address: str, name: str
-    ):
-        contact = (
-            db.query(cls)
-            .filter(cls.email_account_id == email_account_id, cls.email_address == email_address)
-            .first()
-        )
-        if contact:
-            return contact
-        else:
-            contact = cls(
-                email_account_id=email_account_id,
-                email_address=email_address,
-                name=name,
+    def bulk_upsert(cls, db: Session, contacts: Iterable[Tuple[str, str, str]]):
+        """
+        Create every missing contact of a batch in one INSERT ... ON CONFLICT DO NOTHING.
+
+        Args:
+            contacts: (email_account_id, email_address, name) tuples, duplicates allowed
+        """
+        now = datetime.utcnow()
+        rows = {}
+        for email_account_id, email_address, name in contacts:
+            if not email_address:
+                continue
+            rows.setdefault(
+                (str(email_account_id), email_address),
+                {
+                    "id": uuid.uuid4(),
+                    "created_at": now,
+                    "updated_at": now,
+                    "email_account_id": str(email_account_id),
+                    "email_address": email_address,
+                    "name": name or "",
+                    "score": 0.0,
+                },
             )
-            db.add(contact)
-            db.commit()
-            return contact
+        if not rows:
+            return
 
-    def increment_score(self, db, value):
-        if not self.score:
-            self.score = 0
+        stmt = insert(cls).on_conflict_do_nothing(
+            index_elements=[cls.email_account_id, cls.email_address]
+        )
+        db.execute(stmt, list(rows.values()))
+        db.commit()
+
+    @classmethod
+    def apply_score_events(cls, db: Session, keys: Iterable[Tuple[str, str]], value: float):
+        """
+        Move the score of each contact towards `value` once per occurrence in `keys`.
 
-        self.score = self.alpha * value + (1 - self.alpha) * self.score
+        Args:
+            keys: (email_account_id, email_address) pairs, one per event
+            value: score the moving average is pulled towards
+        """
+        counts = Counter((str(email_account_id), address) for email_account_id, address in keys)
+        if not counts:
+            return
 
-        db.add(self)
+        db.execute(
+            _APPLY_SCORE_EVENTS,
+            {
+                "value": value,
+                "alpha": cls.alpha,
+                "email_account_ids": [email_account_id for email_account_id, _ in counts],
+                "email_addresses": [address for _, address in counts],
+                "counts": list(counts.values()),
+            },
+        )
         db.commit()
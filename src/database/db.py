@@ -1,37 +1,216 @@
+import logging
+import random
+import time
+import uuid
 from contextlib import contextmanager
-from typing import Generator
+from typing import Generator, Optional
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Session, sessionmaker
-from sqlalchemy.pool import QueuePool
+from sqlalchemy.pool import NullPool, QueuePool
 
-from src.libs.const import POSTGRES_URL
+from src.database.cache import cache
+from src.libs.const import (
+    DB_MAX_OVERFLOW,
+    DB_PGBOUNCER,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    POSTGRES_REPLICA_URLS,
+    POSTGRES_URL,
+    PROCESS_ROLE,
+    READ_YOUR_WRITES_SECONDS,
+    REPLICA_LAG_CHECK_SECONDS,
+    REPLICA_MAX_LAG_SECONDS,
+)
+from src.libs.metrics import (
+    DB_POOL_TIMEOUTS,
+    DB_POOL_WAIT,
+    DB_READ_SESSIONS,
+    instrument_engine,
+)
+
+logger = logging.getLogger(__name__)
 
 # Ensure POSTGRES_URL is available
 if not POSTGRES_URL:
     raise ValueError("POSTGRES_URL environment variable is not set")
 
-# Configure engine with connection pooling and reconnection settings
-engine = create_engine(
-    POSTGRES_URL,
-    poolclass=QueuePool,
-    pool_size=6,  # Number of connections to maintain in pool
-    max_overflow=10,  # Additional connections beyond pool_size
-    pool_pre_ping=True,  # Validate connections before use
-    pool_recycle=3600,  # Recycle connections after 1 hour
-    pool_timeout=30,  # Timeout when getting connection from pool
+# Connections per process by PROCESS_ROLE, as (pool_size, max_overflow). Every process
+# opens its own pool, so these multiplied by the process counts in
+# docker-compose.production.yaml have to stay under the server's max_connections.
+POOL_PROFILES = {
+    # One pool per gunicorn worker, shared by the request threadpool
+    "api": (8, 4),
+    # gevent workers, tens of concurrent tasks that mostly wait on provider APIs
+    "worker": (5, 5),
+    # prefork children run one task at a time
+    "prefork_worker": (1, 2),
+    "beat": (1, 0),
+}
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            DB_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - start)
+
+
+def _pool_options() -> dict:
+    if DB_PGBOUNCER:
+        # PgBouncer does the pooling and hands out a server connection per transaction,
+        # keeping idle ones here would only hold client slots
+        return {"poolclass": NullPool}
+    pool_size, max_overflow = POOL_PROFILES.get(PROCESS_ROLE, POOL_PROFILES["api"])
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": int(DB_POOL_SIZE) if DB_POOL_SIZE else pool_size,
+        "max_overflow": int(DB_MAX_OVERFLOW) if DB_MAX_OVERFLOW else max_overflow,
+        "pool_pre_ping": True,  # Validate connections before use
+        "pool_recycle": 3600,  # Recycle connections after 1 hour
+        "pool_timeout": DB_POOL_TIMEOUT,  # Timeout when getting connection from pool
+    }
+
+
+engine = create_engine(POSTGRES_URL, **_pool_options())
+
+# llama-index's PGVectorStore needs an async engine next to the sync one (see VectorDB).
+# Nothing awaits it today, so it never gets more than a couple of connections.
+async_engine = create_async_engine(
+    make_url(POSTGRES_URL).set(drivername="postgresql+asyncpg"),
+    **(
+        {
+            "poolclass": NullPool,
+            # asyncpg prepares every statement, which breaks once PgBouncer moves the
+            # session to another server connection
+            "connect_args": {
+                "statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+            },
+        }
+        if DB_PGBOUNCER
+        else {"pool_size": 1, "max_overflow": 1, "pool_pre_ping": True, "pool_recycle": 3600}
+    ),
 )
 
+instrument_engine(engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 Base.metadata.create_all(bind=engine)
 
+# Seconds the replica is behind. A replica that has replayed everything it received is
+# current even if the primary has been idle, so the replay timestamp is only used when
+# it is catching up.
+_REPLICA_LAG = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+    """
+)
+
+
+class Replica:
+    """A read replica with its own pool and its last measured replication lag."""
+
+    def __init__(self, url: str):
+        self.engine = create_engine(url, **_pool_options())
+        instrument_engine(self.engine)
+        self.sessions = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self._lag: Optional[float] = None
+        self._checked_at = float("-inf")
+
+    def lag(self) -> Optional[float]:
+        """
+        Replication lag in seconds, measured at most every REPLICA_LAG_CHECK_SECONDS.
+        None if the replica could not be reached.
+        """
+        now = time.monotonic()
+        if now - self._checked_at >= REPLICA_LAG_CHECK_SECONDS:
+            self._checked_at = now
+            try:
+                with self.engine.connect() as connection:
+                    self._lag = float(connection.execute(_REPLICA_LAG).scalar())
+            except exc.SQLAlchemyError as e:
+                logger.warning(f"Read replica {self.engine.url.host} is unavailable: {e}")
+                self._lag = None
+        return self._lag
+
+
+replicas = [Replica(url) for url in POSTGRES_REPLICA_URLS]
+
+
+def _recent_write_key(user_id: str) -> str:
+    return f"db:recent_write:{user_id}"
+
+
+def mark_recent_write(user_id: str):
+    """Keep the user's reads on the primary until replicas have their change."""
+    try:
+        cache.set(_recent_write_key(user_id), 1, ex=READ_YOUR_WRITES_SECONDS)
+    except Exception as e:
+        logger.warning(f"Could not mark recent write for user {user_id}: {e}")
+
+
+def _wrote_recently(user_id: str) -> bool:
+    try:
+        return bool(cache.exists(_recent_write_key(user_id)))
+    except Exception:
+        # Without the marker, a stale read is possible, the primary is always current
+        return True
+
+
+def _read_session(user_id: Optional[str]) -> Session:
+    if not replicas:
+        return SessionLocal()
+    if user_id and _wrote_recently(user_id):
+        DB_READ_SESSIONS.labels(target="primary", reason="recent_write").inc()
+        return SessionLocal()
+
+    current = [
+        replica
+        for replica in replicas
+        if (lag := replica.lag()) is not None and lag <= REPLICA_MAX_LAG_SECONDS
+    ]
+    if not current:
+        DB_READ_SESSIONS.labels(target="primary", reason="replica_lag").inc()
+        return SessionLocal()
+    DB_READ_SESSIONS.labels(target="replica", reason="current").inc()
+    return random.choice(current).sessions()
+
+
+def reset_pools_after_fork():
+    """Drop connections inherited from the parent process, without closing them for it."""
+    for pool_engine in (engine, *(replica.engine for replica in replicas)):
+        pool_engine.dispose(close=False)
+
 
 @contextmanager
-def get_db() -> Generator[Session, None, None]:
-    db = SessionLocal()
+def get_db(readonly: bool = False, user_id: str = None) -> Generator[Session, None, None]:
+    """
+    Session on the primary, or on a read replica for `readonly` work.
+
+    Args:
+        readonly: Use a replica no more than REPLICA_MAX_LAG_SECONDS behind, falling back
+            to the primary when there is none
+        user_id: User the work is done for. A write marks the user so that their
+            read-only sessions use the primary for READ_YOUR_WRITES_SECONDS.
+    """
+    db = _read_session(user_id) if readonly else SessionLocal()
     try:
         yield db
         db.commit()
@@ -40,3 +219,5 @@ def get_db() -> Generator[Session, None, None]:
         raise
     finally:
         db.close()
+        if user_id and not readonly:
+            mark_recent_write(user_id)
@@ -1,3 +1,4 @@
+import asyncio
 import uuid
 from datetime import datetime
 from email.message import EmailMessage
@@ -17,9 +18,11 @@ from sqlalchemy import (
     Column,
     DateTime,
     ForeignKey,
+    Index,
     String,
     UnicodeText,
     UniqueConstraint,
+    text,
 )
 from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import Session, class_mapper, relationship
@@ -43,6 +46,14 @@ CHUNK_SIZE = 50
 
 class Email(Base):
     __tablename__ = "emails"
+    __table_args__ = (
+        # Keeps the enrichment sweep cheap: only unprocessed rows are indexed
+        Index(
+            "ix_emails_unprocessed_created_at",
+            "created_at",
+            postgresql_where=text("processed = false"),
+        ),
+    )
     id = Column(UUID, primary_key=True, index=True, default=uuid.uuid4)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
@@ -217,7 +228,10 @@ class Email(Base):
     async def sync_from_web(self, db: Session):
         if self.email_account.provider == EmailProvider.GMAIL:
             gmail_service = GmailService(self.email_account.token)
-            full_message = gmail_service.get_message(message_id=self.email_id)
+            # Gmail calls block, run them off the event loop
+            full_message = await asyncio.to_thread(
+                gmail_service.get_message, message_id=self.email_id
+            )
             message = Message(full_message)
             self.sender = message.get_from()
             self.sender_name = message.get_from_name()
@@ -299,7 +313,7 @@ class Email(Base):
         if self.email_account.provider == EmailProvider.GMAIL:
             gmail_service = GmailService(self.email_account.token)
             email_data = self._create_gmail_response(email_body)
-            gmail_service.save_draft(email_data)
+            await asyncio.to_thread(gmail_service.save_draft, email_data)
         elif self.email_account.provider == EmailProvider.OUTLOOK:
             outlook_service = OutlookService(self.email_account.token, db)
             reply_request = self._create_outlook_response(email_body)
@@ -308,7 +322,9 @@ class Email(Base):
     async def mark_as_read(self, db: Session):
         if self.email_account.provider == EmailProvider.GMAIL:
             gmail_service = GmailService(self.email_account.token)
-            gmail_service.modify_labels(message_id=self.email_id, remove_labels=["UNREAD"])
+            await asyncio.to_thread(
+                gmail_service.modify_labels, message_id=self.email_id, remove_labels=["UNREAD"]
+            )
         if self.email_account.provider == EmailProvider.OUTLOOK:
             outlook_service = OutlookService(self.email_account.token, db)
             await outlook_service.mark_as_read(self.email_id)
@@ -320,7 +336,9 @@ class Email(Base):
     async def mark_as_unread(self, db: Session):
         if self.email_account.provider == EmailProvider.GMAIL:
             gmail_service = GmailService(self.email_account.token)
-            gmail_service.modify_labels(message_id=self.email_id, add_labels=["UNREAD"])
+            await asyncio.to_thread(
+                gmail_service.modify_labels, message_id=self.email_id, add_labels=["UNREAD"]
+            )
         if self.email_account.provider == EmailProvider.OUTLOOK:
             outlook_service = OutlookService(self.email_account.token, db)
             await outlook_service.mark_as_unread(self.email_id)
@@ -339,7 +357,9 @@ class Email(Base):
 
         if self.email_account.provider == EmailProvider.GMAIL:
             gmail_service = GmailService(self.email_account.token)
-            gmail_service.modify_labels(message_id=self.email_id, remove_labels=["INBOX"])
+            await asyncio.to_thread(
+                gmail_service.modify_labels, message_id=self.email_id, remove_labels=["INBOX"]
+            )
             return self
         if self.email_account.provider == EmailProvider.OUTLOOK:
             outlook_service = OutlookService(self.email_account.token, db)
@@ -351,7 +371,9 @@ class Email(Base):
         db.commit()
         if self.email_account.provider == EmailProvider.GMAIL:
             gmail_service = GmailService(self.email_account.token)
-            gmail_service.modify_labels(message_id=self.email_id, add_labels=["TRASH"])
+            await asyncio.to_thread(
+                gmail_service.modify_labels, message_id=self.email_id, add_labels=["TRASH"]
+            )
             return self
         if self.email_account.provider == EmailProvider.OUTLOOK:
             outlook_service = OutlookService(self.email_account.token, db)
@@ -363,7 +385,9 @@ class Email(Base):
         db.commit()
         if self.email_account.provider == EmailProvider.GMAIL:
             gmail_service = GmailService(self.email_account.token)
-            gmail_service.modify_labels(message_id=self.email_id, add_labels=["INBOX"])
+            await asyncio.to_thread(
+                gmail_service.modify_labels, message_id=self.email_id, add_labels=["INBOX"]
+            )
             return self
         if self.email_account.provider == EmailProvider.OUTLOOK:
             outlook_service = OutlookService(self.email_account.token, db)
@@ -375,7 +399,9 @@ class Email(Base):
         db.commit()
         if self.email_account.provider == EmailProvider.GMAIL:
             gmail_service = GmailService(self.email_account.token)
-            gmail_service.modify_labels(message_id=self.email_id, add_labels=["SPAM"])
+            await asyncio.to_thread(
+                gmail_service.modify_labels, message_id=self.email_id, add_labels=["SPAM"]
+            )
             return self
         if self.email_account.provider == EmailProvider.OUTLOOK:
             outlook_service = OutlookService(self.email_account.token, db)
@@ -1,3 +1,4 @@
+import asyncio
 import base64
 import uuid
 from datetime import datetime
@@ -45,7 +46,22 @@ class EmailAccount(Base):
     tasks = relationship("EmailTask", back_populates="email_account")
     settings = relationship("Settings", back_populates="email_account", uselist=False)
     contacts = relationship("Contact", back_populates="email_account")
-    weekly_email_recap = relationship("WeeklyEmailRecap", back_populates="email_account")
+    weekly_email_recap = relationship(
+        "WeeklyEmailRecap",
+        back_populates="email_account",
+        foreign_keys="WeeklyEmailRecap.email_account_id",
+    )
+    # Recap that newly enriched emails are added to, rotated weekly by create_weekly_recap
+    current_weekly_recap_id = Column(
+        UUID,
+        ForeignKey(
+            "weekly_email_recaps.id",
+            use_alter=True,
+            name="fk_email_accounts_current_weekly_recap_id",
+            ondelete="SET NULL",
+        ),
+        nullable=True,
+    )
 
     status = Column(
         Enum(EmailAccountStatus, name="emailaccountstatus"),
@@ -77,7 +93,7 @@ class EmailAccount(Base):
             encoded_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
             create_message = {"raw": encoded_message}
             try:
-                gmail_service.send_message(create_message)
+                await asyncio.to_thread(gmail_service.send_message, create_message)
                 return True
             except Exception as e:
                 print(e)
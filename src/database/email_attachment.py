@@ -1,30 +1,79 @@
-import asyncio
 import base64
-import json
+import hashlib
 import logging
+import re
+import tempfile
+import time
 import uuid
 from datetime import datetime, timedelta
+from typing import Iterable, Iterator
 
-from google.cloud import storage
 from llama_index.core import SimpleDirectoryReader
+from redis.exceptions import LockError, RedisError
 from sqlalchemy import UUID, Boolean, Column, DateTime, ForeignKey, Integer, String
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import Session, relationship
 
+from src.database.cache import cache
 from src.database.db import Base
-from src.database.email_account import EmailProvider
 from src.database.vectory_db import VectorDB
-from src.libs.const import GCP_BUCKET_CREDENTIALS, GCP_BUCKET_NAME, STAGE
 from src.services.gmail_service import GmailService
 from src.services.outlook_service import OutlookService
+from src.services.storage_service import get_storage_service
 
 vector_db = VectorDB()
 
-if STAGE == "production":
-    storage_client = storage.Client.from_service_account_info(json.loads(GCP_BUCKET_CREDENTIALS))
-
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.WARNING)
 
+# Attachments are spooled in memory up to this size and spill to a temp file beyond it
+SPOOL_MAX_BYTES = 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+SIGNED_URL_EXPIRATION = timedelta(minutes=10)
+# Stop handing out a cached URL this long before it expires, so clients have time to use it
+SIGNED_URL_REFRESH_MARGIN = timedelta(minutes=2)
+
+# Serializes uploads and deletions of the same content addressed file
+FILE_LOCK_TTL_SECONDS = 5 * 60
+# A stored file counts as in use this long after an upload resolved to it, which covers
+# the time until the attachment row referencing it is committed
+FILE_IN_USE_TTL_SECONDS = 60 * 60
+
+
+def _json_string_field(body: bytes, field: str) -> memoryview:
+    """
+    The value of a string field of a JSON object, without parsing the whole object. Only
+    for fields whose value has no escapes, such as base64.
+    """
+    match = re.search(rb'"%s"\s*:\s*"' % field.encode(), body)
+    if not match:
+        raise ValueError(f"No {field} field in the response")
+    return memoryview(body)[match.end() : body.index(b'"', match.end())]
+
+
+def _iter_base64_chunks(data: memoryview, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> Iterator[bytes]:
+    """Decode urlsafe base64 piece by piece instead of materializing the whole file."""
+    step = chunk_size - chunk_size % 4
+    for start in range(0, len(data), step):
+        piece = data[start : start + step]
+        yield base64.urlsafe_b64decode(bytes(piece) + b"=" * (-len(piece) % 4))
+
+
+def _content_filepath(content_hash: str) -> str:
+    return f"attachments/sha256/{content_hash}"
+
+
+def _file_lock(content_hash: str):
+    return cache.lock(
+        f"lock:attachment_file:{content_hash}",
+        timeout=FILE_LOCK_TTL_SECONDS,
+        blocking_timeout=FILE_LOCK_TTL_SECONDS,
+    )
+
+
+def _file_in_use_key(content_hash: str) -> str:
+    return f"attachment_file_in_use:{content_hash}"
+
 
 class EmailAttachment(Base):
     __tablename__ = "email_attachments"
@@ -40,19 +89,86 @@ class EmailAttachment(Base):
     processed = Column(Boolean, default=False)
     uploaded = Column(Boolean, default=False)
     filepath = Column(String)
+    content_hash = Column(String(64), index=True)
 
     @property
     def url(self):
-        if STAGE == "production":
-            bucket = storage_client.bucket(GCP_BUCKET_NAME)
-            blob = bucket.blob(self.filepath)
-            url = blob.generate_signed_url(
-                version="v4", expiration=timedelta(minutes=10), method="GET"
-            )
-        else:
-            url = f"https://storage.googleapis.com/{GCP_BUCKET_NAME}/{self.id}"
+        if getattr(self, "_signed_url", None) is None:
+            EmailAttachment.sign_urls([self])
+        return getattr(self, "_signed_url", None)
+
+    def _signed_url_cache_key(self):
+        # The name is part of the key since it sets the download filename of shared blobs
+        return f"signed_url:{self.filepath}:{self.name}"
 
-        return url
+    @staticmethod
+    def urls_fresh_for(attachments: Iterable["EmailAttachment"]) -> float:
+        """
+        Seconds until the first signed URL of `attachments` is too old to hand out, infinite
+        when none is signed. Anything serving the URLs later, such as a cached page, must
+        not be kept longer.
+        """
+        fresh_until = [
+            attachment._url_fresh_until
+            for attachment in attachments
+            if getattr(attachment, "_url_fresh_until", None) is not None
+        ]
+        return min(fresh_until) - time.time() if fresh_until else float("inf")
+
+    @classmethod
+    def sign_urls(cls, attachments: list["EmailAttachment"]):
+        """
+        Resolve signed URLs for many attachments at once.
+
+        Signing is RSA work, so URLs are cached in Redis and shared by all workers until
+        shortly before they expire. Cached URLs are fetched with one MGET, and only the
+        misses are signed and written back in one pipeline. Use this before serializing a
+        list of emails instead of letting every `url` access sign on its own.
+        """
+        to_sign = [
+            attachment
+            for attachment in attachments
+            if attachment.filepath and getattr(attachment, "_signed_url", None) is None
+        ]
+        if not to_sign:
+            return
+
+        keys = [attachment._signed_url_cache_key() for attachment in to_sign]
+        try:
+            # With their remaining TTLs, which bound how long the URLs may still be handed out
+            pipeline = cache.pipeline(transaction=False)
+            for key in keys:
+                pipeline.get(key)
+                pipeline.pttl(key)
+            results = pipeline.execute()
+            cached_urls = list(zip(results[::2], results[1::2]))
+        except RedisError as e:
+            logger.warning(f"Signed URL cache unavailable: {e}")
+            cached_urls = [(None, None)] * len(keys)
+
+        now = time.time()
+        ttl = int((SIGNED_URL_EXPIRATION - SIGNED_URL_REFRESH_MARGIN).total_seconds())
+        signed = {}
+        for attachment, key, (cached_url, pttl) in zip(to_sign, keys, cached_urls):
+            if cached_url and pttl and pttl > 0:
+                attachment._signed_url = cached_url.decode("utf-8")
+                attachment._url_fresh_until = now + pttl / 1000
+                continue
+            if key not in signed:
+                signed[key] = get_storage_service().signed_url(
+                    attachment.filepath, expiration=SIGNED_URL_EXPIRATION, filename=attachment.name
+                )
+            attachment._signed_url = signed[key]
+            attachment._url_fresh_until = now + ttl
+
+        if signed:
+            try:
+                pipeline = cache.pipeline(transaction=False)
+                for key, url in signed.items():
+                    pipeline.set(key, url, ex=ttl)
+                pipeline.execute()
+            except RedisError as e:
+                logger.warning(f"Failed to cache signed URLs: {e}")
 
     def __init__(
         self,
@@ -98,48 +214,87 @@ class EmailAttachment(Base):
         return documents
 
     @staticmethod
-    def embed_and_store(
-        user_id: str,
-        email_id: str,
-        attachment: "EmailAttachment",
+    def download_and_store(
+        message_id: str,
+        attachment_id: str,
+        content_type: str = None,
         gmail_service: GmailService = None,
         outlook_service: OutlookService = None,
-    ):
-        if attachment.processed:
-            return True
-        # If email has content, create a document
+    ) -> dict:
+        """
+        Download an attachment and upload it to storage under its content hash.
+
+        The file is decoded chunk by chunk into a spooled temp file while it is hashed, so
+        large attachments never sit fully decoded in memory. Identical files (e.g. the
+        same PDF sent to many users) map to the same object and are only uploaded once.
+
+        Touches no database state so it can run in a worker thread.
+
+        Returns:
+            dict: filepath, content_hash and size of the stored file
+        """
         if gmail_service:
-            gmail_attachment = gmail_service.get_attachment(
-                message_id=email_id, attachment_id=attachment.attachment_id
-            )
-            attachment_data = base64.urlsafe_b64decode(gmail_attachment["data"])
-            filepath = f"attachments/{user_id}/{email_id}/{attachment.name}"
-            attachment.size = gmail_attachment["size"]
-        if outlook_service:
-            outlook_attachment = asyncio.run(
-                outlook_service.get_attachment(
-                    message_id=email_id, attachment_id=attachment.attachment_id
+            # Gmail has no media download for attachments, the file comes base64 encoded in
+            # one JSON response. Only the generator references it, so it is freed as soon
+            # as it is decoded, before the upload.
+            chunks = _iter_base64_chunks(
+                _json_string_field(
+                    gmail_service.get_attachment_body(
+                        message_id=message_id, attachment_id=attachment_id
+                    ),
+                    "data",
                 )
             )
-            attachment_data = base64.urlsafe_b64decode(outlook_attachment.content_bytes)
-            filepath = f"attachments/{user_id}/{email_id}/{attachment.name}"
+        elif outlook_service:
+            chunks = outlook_service.iter_attachment_content(
+                message_id=message_id, attachment_id=attachment_id, chunk_size=DOWNLOAD_CHUNK_SIZE
+            )
+        else:
+            raise ValueError("A Gmail or Outlook service is required to download attachments")
 
-        try:
-            bucket = storage_client.bucket(GCP_BUCKET_NAME)
-            blob = bucket.blob(filepath)
-            blob.upload_from_string(attachment_data, content_type=attachment.content_type)
-            attachment.filepath = filepath
-            attachment.uploaded = True
-        except Exception as e:
-            print(f"Error uploading attachment: {attachment.id} to GCP: ", e)
-            return False
+        storage_service = get_storage_service()
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as spool:
+            digest = hashlib.sha256()
+            size = 0
+            for chunk in chunks:
+                digest.update(chunk)
+                spool.write(chunk)
+                size += len(chunk)
+
+            content_hash = digest.hexdigest()
+            filepath = _content_filepath(content_hash)
+            with _file_lock(content_hash):
+                # Keeps delete_unused_file off the file until our row is committed
+                cache.set(_file_in_use_key(content_hash), 1, ex=FILE_IN_USE_TTL_SECONDS)
+                if not storage_service.exists(filepath):
+                    storage_service.upload(filepath, spool, content_type=content_type)
 
-        # try:
-        #     with open(f"/temp_file_storage/{filepath}", "wb") as f:
-        #         f.write(attachment_data)
-        #     vector_db.insert(attachment._create_document(f"/temp_file_storage/{filepath}"), user_id)
-        # except Exception as e:
-        #     print(f"Error embedding attachment: {attachment.id} to VectorDB: ", e)
-        #     return False
+        return {"filepath": filepath, "content_hash": content_hash, "size": size}
 
-        return True
+    @staticmethod
+    def delete_unused_file(db: Session, content_hash: str) -> bool:
+        """
+        Delete the stored file of `content_hash` unless an attachment references it.
+
+        Runs under the same lock as download_and_store, so an upload that found the file
+        already stored cannot end up pointing at a deleted one.
+
+        Returns:
+            bool: Whether the file was deleted
+        """
+        try:
+            with _file_lock(content_hash):
+                if cache.exists(_file_in_use_key(content_hash)):
+                    return False
+                referenced = (
+                    db.query(EmailAttachment.id)
+                    .filter(EmailAttachment.content_hash == content_hash)
+                    .first()
+                )
+                if referenced:
+                    return False
+                get_storage_service().delete(_content_filepath(content_hash))
+                return True
+        except LockError as e:
+            logger.warning(f"Kept attachment file {content_hash}, it is locked: {e}")
+            return False
@@ -10,15 +10,17 @@ from llama_index.core.query_engine import ToolRetrieverRouterQueryEngine
 
 from openai import OpenAI
 
+from src.database.db import async_engine, engine
 from src.libs import SafeSemanticSplitter
 from src.libs.const import OPENAI_API_KEY, DATABASE_URL
+from src.libs.metrics import openai_http_client
 from src.libs.rag_prompts import EMAIL_SUGGESTION_PROMPT, EMAIL_SYSTEM_PROMPT
 
 Settings.chunk_size = 8192
 
-llm = LLMOpenAI(model="gpt-5-nano", api_key=OPENAI_API_KEY)
+llm = LLMOpenAI(model="gpt-5-nano", api_key=OPENAI_API_KEY, http_client=openai_http_client())
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = OpenAI(api_key=OPENAI_API_KEY, http_client=openai_http_client())
 
 
 class VectorDB:
@@ -26,17 +28,29 @@ class VectorDB:
         self,
     ):
         self.database_url = DATABASE_URL
-        self.vector_store = PGVectorStore.from_params(
-            database=DATABASE_URL,
+        # Both stores use the ORM's engines, so vector queries share the process's pool
+        # instead of each store opening its own
+        self.vector_store = PGVectorStore(
+            connection_string=DATABASE_URL,
+            async_connection_string=async_engine.url.render_as_string(hide_password=False),
             table_name="email_vectors",
             embed_dim=1536,  # text-embedding-3-small dimension
+            engine=engine,
+            async_engine=async_engine,
         )
-        self.transaction_store = PGVectorStore.from_params(
-            database=DATABASE_URL,
+        self.transaction_store = PGVectorStore(
+            connection_string=DATABASE_URL,
+            async_connection_string=async_engine.url.render_as_string(hide_password=False),
             table_name="transaction_vectors",
             embed_dim=1536,
+            engine=engine,
+            async_engine=async_engine,
+        )
+        self.embed_model = OpenAIEmbedding(
+            api_key=OPENAI_API_KEY,
+            model="text-embedding-3-small",
+            http_client=openai_http_client(),
         )
-        self.embed_model = OpenAIEmbedding(api_key=OPENAI_API_KEY, model="text-embedding-3-small")
         Settings.embed_model = self.embed_model
 
         self.pipeline = IngestionPipeline(
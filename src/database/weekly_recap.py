@@ -1,13 +1,30 @@
 # src/database/weekly_email_recap.py
 import uuid
 from datetime import datetime
+from typing import Dict, List
 
-from sqlalchemy import UUID, Boolean, Column, DateTime, ForeignKey
+from sqlalchemy import UUID, Boolean, Column, DateTime, ForeignKey, text
 from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import Session, relationship
 
 from src.database.db import Base
 
+# Append to the account's current recap and drop duplicates in the same statement, so
+# concurrent enrichment batches never lose or repeat an email.
+_APPEND_TO_CURRENT_RECAP = text(
+    """
+    UPDATE weekly_email_recaps AS recap
+    SET email_ids = ARRAY(
+        SELECT DISTINCT unnest(
+            array_cat(COALESCE(recap.email_ids, '{}'), CAST(:email_ids AS uuid[]))
+        )
+    )
+    FROM email_accounts AS account
+    WHERE account.id = :email_account_id
+      AND recap.id = account.current_weekly_recap_id
+    """
+)
+
 
 class WeeklyEmailRecap(Base):
     __tablename__ = "weekly_email_recaps"
@@ -17,19 +34,39 @@ class WeeklyEmailRecap(Base):
     week_start = Column(DateTime, nullable=False)
     week_end = Column(DateTime, nullable=False)
     email_account_id = Column(UUID, ForeignKey("email_accounts.id"), nullable=False)
-    email_account = relationship("EmailAccount", back_populates="weekly_email_recap")
+    email_account = relationship(
+        "EmailAccount", back_populates="weekly_email_recap", foreign_keys=[email_account_id]
+    )
     completed = Column(Boolean, default=False)
     # store all email IDs for the recap in this array
     email_ids = Column(ARRAY(UUID), default=list)
 
     @classmethod
-    def add_to_latest_recap(cls, db: Session, email_account_id, email_ids):
-        """Add emails from this week to weekly recap"""
-        if latest_recap := cls.get_latest_recap(db, email_account_id):
-            latest_recap.email_ids.extend(email_ids)
-            db.add(latest_recap)
+    def add_to_current_recaps(cls, db: Session, email_ids_by_account: Dict[str, List[str]]):
+        """Add emails to each account's current weekly recap in one batched UPDATE"""
+        params = [
+            {
+                "email_account_id": str(email_account_id),
+                "email_ids": [str(email_id) for email_id in email_ids],
+            }
+            for email_account_id, email_ids in email_ids_by_account.items()
+            if email_ids
+        ]
+        if params:
+            db.execute(_APPEND_TO_CURRENT_RECAP, params)
             db.commit()
 
+    @classmethod
+    def get_current_recap(cls, db: Session, email_account_id):
+        from src.database.email_account import EmailAccount
+
+        return (
+            db.query(cls)
+            .join(EmailAccount, EmailAccount.current_weekly_recap_id == cls.id)
+            .filter(EmailAccount.id == email_account_id)
+            .first()
+        )
+
     @classmethod
     def get_latest_recap(cls, db: Session, email_account_id):
         return (
@@ -32,3 +32,49 @@ TELNYX_SECRET_KEY = os.getenv("TELNYX_SECRET_KEY")
 PHONE_NUMBER_NOT_FOUND_MESSAGE = os.getenv("PHONE_NUMBER_NOT_FOUND_MESSAGE")
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
+TASK_LOCK_TTL_SECONDS = int(os.getenv("TASK_LOCK_TTL_SECONDS", 5 * 60))
+SYNC_DEBOUNCE_SECONDS = int(os.getenv("SYNC_DEBOUNCE_SECONDS", 60))
+ATTACHMENT_STORAGE_BACKEND = os.getenv(
+    "ATTACHMENT_STORAGE_BACKEND", "gcs" if STAGE == "production" else "local"
+)
+ATTACHMENT_STORAGE_PATH = os.getenv("ATTACHMENT_STORAGE_PATH", "/temp_file_storage")
+ATTACHMENT_DOWNLOAD_CONCURRENCY = int(os.getenv("ATTACHMENT_DOWNLOAD_CONCURRENCY", 8))
+DAILY_REPORT_LLM_CONCURRENCY = int(os.getenv("DAILY_REPORT_LLM_CONCURRENCY", 16))
+DAILY_REPORT_MAIL_CONCURRENCY = int(os.getenv("DAILY_REPORT_MAIL_CONCURRENCY", 8))
+DAILY_REPORT_PROMPT_TOKEN_BUDGET = int(os.getenv("DAILY_REPORT_PROMPT_TOKEN_BUDGET", 16000))
+PROVIDER_CLIENT_CACHE_SIZE = int(os.getenv("PROVIDER_CLIENT_CACHE_SIZE", 256))
+PROVIDER_CLIENT_CACHE_TTL = int(os.getenv("PROVIDER_CLIENT_CACHE_TTL", 30 * 60))
+TOKEN_REFRESH_AHEAD_SECONDS = int(os.getenv("TOKEN_REFRESH_AHEAD_SECONDS", 10 * 60))
+GMAIL_QUOTA_UNITS_PER_SECOND = int(os.getenv("GMAIL_QUOTA_UNITS_PER_SECOND", 250))
+OUTLOOK_REQUESTS_PER_SECOND = int(os.getenv("OUTLOOK_REQUESTS_PER_SECOND", 16))
+PROVIDER_MAX_RETRIES = int(os.getenv("PROVIDER_MAX_RETRIES", 5))
+RATE_LIMIT_MAX_WAIT_SECONDS = int(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", 60))
+CALL_BRIEF_DEBOUNCE_SECONDS = int(os.getenv("CALL_BRIEF_DEBOUNCE_SECONDS", 5))
+CALL_BRIEF_MAX_EMAILS = int(os.getenv("CALL_BRIEF_MAX_EMAILS", 50))
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9100))
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "dashai-backend")
+# Provider API endpoints, overridden to point at local stand-ins (see benchmarks/)
+GMAIL_API_ENDPOINT = os.getenv("GMAIL_API_ENDPOINT")
+MSGRAPH_BASE_URL = os.getenv("MSGRAPH_BASE_URL", "https://graph.microsoft.com/v1.0")
+# Database pools. PROCESS_ROLE picks a pool profile (see src/database/db.py), the sizes
+# override it when set
+PROCESS_ROLE = os.getenv("PROCESS_ROLE", "api")
+DB_POOL_SIZE = os.getenv("DB_POOL_SIZE")
+DB_MAX_OVERFLOW = os.getenv("DB_MAX_OVERFLOW")
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+# Set when POSTGRES_URL points at PgBouncer in transaction pooling mode
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+# Read replicas for get_db(readonly=True), comma separated. Replicas lagging more than
+# REPLICA_MAX_LAG_SECONDS are skipped, and a user's reads stay on the primary for
+# READ_YOUR_WRITES_SECONDS after they change something
+POSTGRES_REPLICA_URLS = [url for url in os.getenv("POSTGRES_REPLICA_URLS", "").split(",") if url]
+REPLICA_MAX_LAG_SECONDS = int(os.getenv("REPLICA_MAX_LAG_SECONDS", 10))
+REPLICA_LAG_CHECK_SECONDS = int(os.getenv("REPLICA_LAG_CHECK_SECONDS", 5))
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", 30))
+# Cached first pages of email lists. A page carrying signed attachment URLs is kept no
+# longer than the URLs may still be handed out.
+INBOX_CACHE_TTL_SECONDS = int(os.getenv("INBOX_CACHE_TTL_SECONDS", 120))
+# Public key from the Telnyx portal, verifies the signature of Call Control webhooks
+TELNYX_PUBLIC_KEY = os.getenv("TELNYX_PUBLIC_KEY")
+TELNYX_WEBHOOK_TOLERANCE_SECONDS = int(os.getenv("TELNYX_WEBHOOK_TOLERANCE_SECONDS", 300))
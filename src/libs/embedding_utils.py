@@ -4,11 +4,12 @@ import numpy as np
 from openai import OpenAI
 
 from src.libs.const import OPENAI_API_KEY
+from src.libs.metrics import openai_http_client
 
+client = OpenAI(api_key=OPENAI_API_KEY, http_client=openai_http_client())
 
-def generate_embedding(text: str, model="text-embedding-3-small", **kwargs) -> List[float]:
-    client = OpenAI(api_key=OPENAI_API_KEY)
 
+def generate_embedding(text: str, model="text-embedding-3-small", **kwargs) -> List[float]:
     # replace newlines, which can negatively affect performance.
     text = text.replace("\n", " ")
 
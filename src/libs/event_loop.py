@@ -0,0 +1,82 @@
+"""
+One long-lived event loop per worker process for the async provider code.
+
+asyncio.run creates and closes a loop on every call, so nothing bound to a loop (such as
+the httpx pool of a cached Graph client) survives from one task to the next. Celery code
+runs coroutines with run_async instead, on a loop that lives in a daemon thread for the
+whole process and is shared by every task thread or greenlet.
+
+Under gevent's monkey patching a threading.Thread is only a greenlet on the calling OS
+thread, which would make the loop the running loop of every task. The loop therefore
+gets a native thread, and greenlets wait for it from gevent's thread pool so the hub
+keeps serving the other tasks meanwhile.
+"""
+
+import asyncio
+import os
+import threading
+from typing import Awaitable, TypeVar
+
+from gevent import monkey
+from gevent.threadpool import ThreadPool
+
+T = TypeVar("T")
+
+# Greenlets that can wait on the loop at once, the gevent pools run up to 50 tasks
+GEVENT_WAITERS = 64
+
+_start_native_thread = monkey.get_original("_thread", "start_new_thread")
+_allocate_native_lock = monkey.get_original("_thread", "allocate_lock")
+
+_lock = threading.Lock()
+_loop: asyncio.AbstractEventLoop = None
+_waiters: ThreadPool = None
+_pid: int = None
+
+
+def _worker_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _waiters, _pid
+    with _lock:
+        # A forked child inherits the loop object but not the thread running it
+        if _loop is None or _pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _waiters = None
+            _pid = os.getpid()
+            _start_native_thread(_loop.run_forever, ())
+        return _loop
+
+
+def _wait(loop: asyncio.AbstractEventLoop, coro: Awaitable[T]) -> T:
+    """Run `coro` on `loop` and block the calling native thread until it is done."""
+    # Native locks only, patched ones would need a gevent hub in this thread
+    done = _allocate_native_lock()
+    done.acquire()
+    tasks = []
+
+    def start():
+        task = loop.create_task(coro)
+        task.add_done_callback(lambda _: done.release())
+        tasks.append(task)
+
+    loop.call_soon_threadsafe(start)
+    done.acquire()
+    return tasks[0].result()
+
+
+def run_async(coro: Awaitable[T]) -> T:
+    """Run `coro` on the process's event loop and wait for its result."""
+    global _waiters
+    loop = _worker_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        raise RuntimeError("run_async cannot wait on the loop it is called from")
+    if not monkey.is_module_patched("threading"):
+        return _wait(loop, coro)
+    with _lock:
+        if _waiters is None:
+            _waiters = ThreadPool(GEVENT_WAITERS)
+        waiters = _waiters
+    return waiters.apply(_wait, (loop, coro))
@@ -0,0 +1,45 @@
+import logging
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Emails of a user changed in a way their email list shows. Payload: user_id, and folders
+# the emails are or were in, None when any folder may be affected.
+EMAILS_CHANGED = "emails_changed"
+
+_handlers: Dict[str, List[Callable]] = defaultdict(list)
+
+
+def subscribe(event: str):
+    """
+    Register the decorated function as a handler of `event`.
+
+    Handlers run in the publishing process, right after the change is committed, so they
+    should be quick. Every process that publishes has to import the modules defining
+    handlers, src/celery_config.py does so for the workers.
+
+    Example:
+        @subscribe(EMAILS_CHANGED)
+        def invalidate(user_id: str, folders=None):
+            ...
+    """
+
+    def register(handler: Callable) -> Callable:
+        _handlers[event].append(handler)
+        return handler
+
+    return register
+
+
+def publish(event: str, **payload):
+    """
+    Call every handler of `event` with the payload.
+
+    A failing handler is logged and does not fail the change that was already committed.
+    """
+    for handler in _handlers[event]:
+        try:
+            handler(**payload)
+        except Exception as e:
+            logger.error(f"Handler {handler.__qualname__} of {event} failed: {e}", exc_info=True)
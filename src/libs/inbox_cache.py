@@ -0,0 +1,140 @@
+"""
+Redis cache of the email list's first pages and folder counts.
+
+Entries are keyed by a version number per user and folder. A change to the user's emails
+publishes EMAILS_CHANGED, which bumps the versions of the folders it touched, so later
+reads miss and rebuild the entry while the old ones expire on their own. Readers take the
+version before querying Postgres, so a page built from data that changed meanwhile lands
+under the old version and is never served.
+"""
+
+import hashlib
+import json
+import logging
+from typing import Iterable, List, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+from src.database.cache import cache
+from src.libs.const import INBOX_CACHE_TTL_SECONDS
+from src.libs.events import EMAILS_CHANGED, subscribe
+from src.libs.metrics import INBOX_CACHE_REQUESTS
+from src.libs.types import EmailFolder
+
+logger = logging.getLogger(__name__)
+
+# Longer than any entry lives, so a version that expired cannot come back with entries
+# still cached under it
+VERSION_TTL_SECONDS = 24 * 60 * 60
+
+
+def _version_key(user_id: str, folder: str) -> str:
+    return f"inbox:version:{user_id}:{folder}"
+
+
+def _page_key(user_id: str, folder: str, version: int, params: dict) -> str:
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    return f"inbox:page:{user_id}:{folder}:{version}:{digest}"
+
+
+def _count_key(user_id: str, folder: str, version: int, categories: Optional[List[str]]) -> str:
+    return f"inbox:count:{user_id}:{folder}:{version}:{','.join(sorted(categories or []))}"
+
+
+def folder_version(user_id: str, folder: str) -> Optional[int]:
+    """Current version of the user's folder, None when the cache is unavailable."""
+    try:
+        return int(cache.get(_version_key(user_id, folder)) or 0)
+    except RedisError as e:
+        logger.warning(f"Inbox cache unavailable: {e}")
+        return None
+
+
+def get_page(
+    user_id: str, folder: str, version: int, params: dict
+) -> Optional[Tuple[bytes, List[str]]]:
+    """
+    Cached page as its JSON body and the IDs of its emails that were not shown yet.
+
+    Args:
+        params: Everything else the page depends on, such as account, filters and limit
+    """
+    try:
+        entry = cache.hgetall(_page_key(user_id, folder, version, params))
+    except RedisError as e:
+        logger.warning(f"Inbox cache unavailable: {e}")
+        entry = None
+    INBOX_CACHE_REQUESTS.labels(kind="page", result="hit" if entry else "miss").inc()
+    if not entry:
+        return None
+    return entry[b"body"], [i for i in entry[b"unshown"].decode().split(",") if i]
+
+
+def set_page(
+    user_id: str,
+    folder: str,
+    version: int,
+    params: dict,
+    body: bytes,
+    unshown_ids: Iterable[str],
+    ttl: float = INBOX_CACHE_TTL_SECONDS,
+):
+    """
+    Cache a page for at most `ttl` seconds, pass a shorter one when something in the body,
+    such as a signed URL, goes stale sooner.
+    """
+    ttl = int(min(ttl, INBOX_CACHE_TTL_SECONDS))
+    if ttl <= 0:
+        return
+    key = _page_key(user_id, folder, version, params)
+    try:
+        pipe = cache.pipeline()
+        pipe.hset(key, mapping={"body": body, "unshown": ",".join(map(str, unshown_ids))})
+        pipe.expire(key, ttl)
+        pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Could not cache page {key}: {e}")
+
+
+def get_count(
+    user_id: str, folder: str, version: int, categories: Optional[List[str]] = None
+) -> Optional[int]:
+    try:
+        count = cache.get(_count_key(user_id, folder, version, categories))
+    except RedisError as e:
+        logger.warning(f"Inbox cache unavailable: {e}")
+        count = None
+    INBOX_CACHE_REQUESTS.labels(kind="count", result="miss" if count is None else "hit").inc()
+    return None if count is None else int(count)
+
+
+def set_count(
+    user_id: str,
+    folder: str,
+    version: int,
+    count: int,
+    categories: Optional[List[str]] = None,
+):
+    key = _count_key(user_id, folder, version, categories)
+    try:
+        cache.set(key, count, ex=INBOX_CACHE_TTL_SECONDS)
+    except RedisError as e:
+        logger.warning(f"Could not cache count {key}: {e}")
+
+
+@subscribe(EMAILS_CHANGED)
+def invalidate(user_id: str, folders: Optional[Iterable[str]] = None):
+    """Drop the user's cached pages and counts of `folders`, or of every folder."""
+    from src.database.db import mark_recent_write, replicas
+
+    if replicas:
+        # The page is rebuilt on the next read, it must not come from a replica that does
+        # not have the change yet
+        mark_recent_write(str(user_id))
+    folders = {folder for folder in folders or () if folder} or [f.value for f in EmailFolder]
+    pipe = cache.pipeline(transaction=False)
+    for folder in folders:
+        key = _version_key(str(user_id), folder)
+        pipe.incr(key)
+        pipe.expire(key, VERSION_TTL_SECONDS)
+    pipe.execute()
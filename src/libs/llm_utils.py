@@ -1,14 +1,54 @@
 import json
+from functools import lru_cache
 from typing import List
 
 from llama_index.core.output_parsers import PydanticOutputParser
 import openai
+import tiktoken
 from pydantic import BaseModel
 
 from src.libs.const import OPENAI_API_KEY
+from src.libs.metrics import openai_http_client
 
 
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+client = openai.OpenAI(api_key=OPENAI_API_KEY, http_client=openai_http_client())
+
+# Tokenizer used by the gpt-4o / gpt-5 model family
+TOKEN_ENCODING = "o200k_base"
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    try:
+        return tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception:
+        # The encoding file is fetched on first use; fall back to an estimate when offline
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Count the tokens `text` uses in a prompt, estimating ~4 characters per token if
+    the tokenizer is unavailable."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` down to at most `max_tokens` tokens."""
+    if not text:
+        return ""
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[: max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
 
 # need more diverse examples
 multi_shot_examples = [
@@ -0,0 +1,120 @@
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Generator
+
+from redis.exceptions import LockError
+
+from src.database.cache import cache
+from src.libs.const import TASK_LOCK_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+SEMAPHORE_POLL_INTERVAL = 0.25
+
+
+def _renew_lease(lock, ttl: int, stop: threading.Event):
+    """Keep extending the lock until the holder is done with it."""
+    while not stop.wait(ttl / 3):
+        try:
+            lock.reacquire()
+        except LockError:
+            logger.warning(f"Lost lease on {lock.name}, another worker may take over")
+            return
+
+
+@contextmanager
+def distributed_lock(
+    name: str, ttl: int = TASK_LOCK_TTL_SECONDS, renew: bool = True
+) -> Generator[bool, None, None]:
+    """
+    Non-blocking Redis lock shared by every worker.
+
+    Yields True when the lock was acquired and False when another worker holds it, so
+    callers can skip work that is already in progress. While held, the lease is renewed
+    in the background so long runs do not expire mid-way, and a crashed worker releases
+    it after at most `ttl` seconds.
+
+    Example:
+        with distributed_lock(f"sync:{email_account.id}") as acquired:
+            if not acquired:
+                return
+            ...
+    """
+    # thread_local=False so the renewal thread can see the lock token
+    lock = cache.lock(f"lock:{name}", timeout=ttl, thread_local=False)
+    if not lock.acquire(blocking=False):
+        yield False
+        return
+
+    stop = threading.Event()
+    renewer = None
+    if renew:
+        renewer = threading.Thread(target=_renew_lease, args=(lock, ttl, stop), daemon=True)
+        renewer.start()
+    try:
+        yield True
+    finally:
+        stop.set()
+        if renewer:
+            renewer.join()
+        try:
+            lock.release()
+        except LockError:
+            logger.warning(f"Lock {lock.name} expired before it was released")
+
+
+def debounce(key: str, window: int) -> bool:
+    """
+    Return True at most once per `window` seconds for `key`.
+
+    Used to coalesce repeated on-demand requests (e.g. a sync triggered by every inbox
+    page load) into a single unit of work.
+    """
+    return bool(cache.set(f"debounce:{key}", 1, nx=True, ex=window))
+
+
+@contextmanager
+def semaphore(
+    name: str, limit: int, ttl: int = TASK_LOCK_TTL_SECONDS, timeout: float = None
+) -> Generator[bool, None, None]:
+    """
+    Counting semaphore shared by every worker.
+
+    Caps how many holders across all processes may be inside the block at once, e.g. to
+    stay under a provider's concurrency limit. Holders are kept in a sorted set scored by
+    acquisition time; entries older than `ttl` are treated as crashed and dropped. Waits
+    up to `timeout` seconds (forever if None) and yields whether a slot was acquired.
+
+    Example:
+        with semaphore("openai", 16, timeout=60) as acquired:
+            if not acquired:
+                raise TimeoutError("No OpenAI slot available")
+            ...
+    """
+    key = f"semaphore:{name}"
+    token = uuid.uuid4().hex
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    while True:
+        now = time.time()
+        pipe = cache.pipeline()
+        pipe.zremrangebyscore(key, "-inf", now - ttl)
+        pipe.zadd(key, {token: now})
+        pipe.zrank(key, token)
+        pipe.expire(key, ttl)
+        _, _, rank, _ = pipe.execute()
+        if rank is not None and rank < limit:
+            break
+        cache.zrem(key, token)
+        if deadline is not None and time.monotonic() >= deadline:
+            yield False
+            return
+        time.sleep(SEMAPHORE_POLL_INTERVAL)
+
+    try:
+        yield True
+    finally:
+        cache.zrem(key, token)
@@ -0,0 +1,225 @@
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+import httpx
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    multiprocess,
+    start_http_server,
+)
+from prometheus_client.core import CounterMetricFamily
+
+logger = logging.getLogger(__name__)
+
+# Set for servers that fork workers (gunicorn, prefork Celery) so every process's
+# samples are aggregated into one scrape
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TASK_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "API request latency by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+TASK_DURATION = Histogram(
+    "celery_task_duration_seconds",
+    "Celery task run time by final state",
+    ["task", "state"],
+    buckets=TASK_BUCKETS,
+)
+TASK_ITEMS = Counter("celery_task_items_total", "Items processed by Celery tasks", ["task", "item"])
+SYNC_ACCOUNT_DURATION = Histogram(
+    "sync_account_duration_seconds",
+    "Time to sync one email account",
+    ["provider"],
+    buckets=TASK_BUCKETS,
+)
+PROVIDER_CALLS = Counter(
+    "provider_calls_total", "Email provider API calls by outcome", ["provider", "outcome"]
+)
+PROVIDER_LATENCY = Histogram(
+    "provider_call_duration_seconds",
+    "Email provider API call latency, including retries and rate limit waits",
+    ["provider"],
+    buckets=LATENCY_BUCKETS,
+)
+OPENAI_REQUESTS = Counter(
+    "openai_requests_total", "OpenAI API requests", ["operation", "model", "status"]
+)
+OPENAI_TOKENS = Counter("openai_tokens_total", "OpenAI tokens used", ["model", "kind"])
+OPENAI_LATENCY = Histogram(
+    "openai_request_duration_seconds",
+    "OpenAI API request latency",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+TOKEN_REFRESHES = Counter(
+    "oauth_token_refreshes_total", "OAuth access token refreshes", ["provider", "outcome"]
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "SQLAlchemy pool connections: capacity, open and checked out",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time to get a connection from the SQLAlchemy pool, including opening a new one",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5, 10, 30),
+)
+DB_POOL_TIMEOUTS = Counter(
+    "db_pool_timeouts_total", "Checkouts that gave up waiting for a pool connection"
+)
+DB_READ_SESSIONS = Counter(
+    "db_read_sessions_total", "Read-only sessions by where they were routed", ["target", "reason"]
+)
+DAILY_REPORT_JOBS = Counter(
+    "daily_report_jobs_total", "Per-user daily morning report jobs by outcome", ["outcome"]
+)
+DAILY_REPORT_RUN_DURATION = Gauge(
+    "daily_report_run_duration_seconds",
+    "Time from dispatching the last daily morning report run to its last job",
+    multiprocess_mode="mostrecent",
+)
+INBOX_CACHE_REQUESTS = Counter(
+    "inbox_cache_requests_total", "Email list cache lookups", ["kind", "result"]
+)
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - start)
+
+
+def count_items(task: str, item: str, amount: int = 1):
+    if amount:
+        TASK_ITEMS.labels(task=task, item=item).inc(amount)
+
+
+class RateLimitCollector:
+    """
+    Exposes the per-provider counters the rate limiter keeps in Redis.
+
+    They are shared by every worker, so they are read at scrape time instead of being
+    counted per process.
+    """
+
+    FIELDS = ("requests", "units", "delayed", "throttled", "retries", "failed")
+
+    def collect(self):
+        # Imported late, the cache module is not needed to define metrics
+        from src.database.cache import cache
+        from src.libs.rate_limit import PROVIDER_LIMITS
+
+        family = CounterMetricFamily(
+            "provider_rate_limit_events",
+            "Rate limiter events across all workers",
+            labels=["provider", "event"],
+        )
+        try:
+            for provider in PROVIDER_LIMITS:
+                stats = cache.hgetall(f"ratelimit:stats:{provider}")
+                for field in self.FIELDS:
+                    family.add_metric([provider, field], int(stats.get(field.encode(), 0)))
+        except Exception as e:
+            logger.warning(f"Could not read rate limit stats: {e}")
+        yield family
+
+
+def instrument_engine(engine):
+    """Track pool saturation, connections in use against the pool's capacity."""
+    from sqlalchemy import event
+
+    pool = engine.pool
+    if hasattr(pool, "size"):
+        DB_POOL_CONNECTIONS.labels(state="capacity").inc(pool.size() + pool._max_overflow)
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CONNECTIONS.labels(state="checkedout").inc()
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        DB_POOL_CONNECTIONS.labels(state="checkedout").dec()
+
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        DB_POOL_CONNECTIONS.labels(state="open").inc()
+
+    @event.listens_for(engine, "close")
+    def _close(dbapi_connection, connection_record):
+        DB_POOL_CONNECTIONS.labels(state="open").dec()
+
+
+def _openai_operation(request: httpx.Request) -> str:
+    return request.url.path.removeprefix("/v1/").replace("/", ".")
+
+
+def _on_openai_request(request: httpx.Request):
+    request.extensions["metrics_start"] = time.perf_counter()
+
+
+def _on_openai_response(response: httpx.Response):
+    operation = _openai_operation(response.request)
+    start = response.request.extensions.get("metrics_start")
+    if start is not None:
+        OPENAI_LATENCY.labels(operation=operation).observe(time.perf_counter() - start)
+
+    model, usage = "unknown", {}
+    # Streamed responses are left alone, reading them here would consume the stream
+    if response.headers.get("content-type", "").startswith("application/json"):
+        try:
+            response.read()
+            body = json.loads(response.content)
+            model, usage = body.get("model", model), body.get("usage") or {}
+        except ValueError:
+            pass
+    OPENAI_REQUESTS.labels(operation=operation, model=model, status=str(response.status_code)).inc()
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if usage.get(kind):
+            OPENAI_TOKENS.labels(model=model, kind=kind.removesuffix("_tokens")).inc(usage[kind])
+
+
+def openai_http_client() -> httpx.Client:
+    """HTTP client for OpenAI clients that records request, latency and token metrics."""
+    return httpx.Client(
+        # The OpenAI SDK's defaults, which a custom client replaces
+        timeout=httpx.Timeout(600, connect=5),
+        limits=httpx.Limits(max_connections=1000, max_keepalive_connections=100),
+        event_hooks={"request": [_on_openai_request], "response": [_on_openai_response]},
+    )
+
+
+def _multiprocess_registry() -> CollectorRegistry:
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def start_exporter(port: int, shared: bool = False):
+    """
+    Serve /metrics on its own port from a background thread, never on the public API.
+
+    Args:
+        shared: Also export state shared by every process, such as the rate limiter's
+            counters. Only the API does this, so each series is scraped once.
+    """
+    registry = _multiprocess_registry() if MULTIPROC_DIR else REGISTRY
+    if shared:
+        registry.register(RateLimitCollector())
+    start_http_server(port, registry=registry)
+    logger.info(f"Serving metrics on port {port}")
@@ -0,0 +1,276 @@
+import asyncio
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional, Tuple, TypeVar
+
+from src.database.cache import cache
+from src.libs.const import (
+    GMAIL_QUOTA_UNITS_PER_SECOND,
+    OUTLOOK_REQUESTS_PER_SECOND,
+    PROVIDER_MAX_RETRIES,
+    RATE_LIMIT_MAX_WAIT_SECONDS,
+)
+from src.libs.metrics import PROVIDER_CALLS, PROVIDER_LATENCY
+from src.libs.tracing import span
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+GMAIL = "gmail"
+OUTLOOK = "outlook"
+
+# (bucket capacity, refill per second). Gmail meters "quota units" per user (most
+# message calls cost 5, sending 100); Graph allows ~10k requests per 10 minutes per
+# mailbox, i.e. ~16/s.
+PROVIDER_LIMITS = {
+    GMAIL: (GMAIL_QUOTA_UNITS_PER_SECOND, GMAIL_QUOTA_UNITS_PER_SECOND),
+    OUTLOOK: (OUTLOOK_REQUESTS_PER_SECOND * 4, OUTLOOK_REQUESTS_PER_SECOND),
+}
+
+BACKOFF_BASE_SECONDS = 1
+BACKOFF_MAX_SECONDS = 60
+RATE_LIMIT_REASONS = ("ratelimitexceeded", "rate limit exceeded", "quotaexceeded")
+TRANSIENT_STATUSES = {500, 502, 503, 504}
+
+# Returns 0 when `cost` tokens were taken, otherwise the milliseconds to wait. A cooldown
+# set after a 429 pauses every worker using the account, not only the one that got it.
+_TAKE_TOKENS = cache.register_script(
+    """
+    local cooldown = redis.call('PTTL', KEYS[2])
+    if cooldown > 0 then
+        redis.call('HINCRBY', KEYS[3], 'delayed', 1)
+        return cooldown
+    end
+
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+    local wait = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        redis.call('HINCRBY', KEYS[3], 'requests', 1)
+        redis.call('HINCRBY', KEYS[3], 'units', cost)
+    else
+        wait = math.ceil((cost - tokens) / rate * 1000)
+        redis.call('HINCRBY', KEYS[3], 'delayed', 1)
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+    return wait
+    """
+)
+
+
+class RateLimitExceeded(Exception):
+    """No provider quota became available within RATE_LIMIT_MAX_WAIT_SECONDS."""
+
+
+def _header(headers, name: str) -> Optional[str]:
+    if not headers:
+        return None
+    for key in (name, name.lower(), name.title()):
+        try:
+            value = headers.get(key)
+        except AttributeError:
+            return None
+        if value:
+            return value
+    return None
+
+
+def _status_and_headers(error: Exception) -> Tuple[Optional[int], object]:
+    """Pull the HTTP status and headers out of googleapiclient, requests or Graph errors."""
+    if (resp := getattr(error, "resp", None)) is not None:
+        return getattr(resp, "status", None), resp
+    if (response := getattr(error, "response", None)) is not None and hasattr(
+        response, "status_code"
+    ):
+        return response.status_code, response.headers
+    if status := getattr(error, "response_status_code", None):
+        return status, getattr(error, "response_headers", None)
+    return None, None
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(error: Exception, idempotent: bool = True) -> Tuple[bool, bool, Optional[float]]:
+    """
+    Only a 429 tells us the provider did not act on the request. After a 5xx the request
+    may have been carried out, so those are retried for idempotent calls only. Timeouts
+    and connection errors carry no status and are never retried here.
+
+    Returns:
+        (retryable, throttled, retry_after): whether the call may be retried, whether the
+        provider throttled us, and the delay it asked for, if any
+    """
+    status, headers = _status_and_headers(error)
+    if status is None:
+        return False, False, None
+    retry_after = _parse_retry_after(_header(headers, "Retry-After"))
+    if status == 429:
+        return True, True, retry_after
+    if status == 403 and any(reason in str(error).lower() for reason in RATE_LIMIT_REASONS):
+        # Gmail's quota errors, not retried but they still pause the account
+        return False, True, retry_after
+    if status in TRANSIENT_STATUSES and idempotent:
+        return True, False, retry_after
+    return False, False, None
+
+
+class RateLimiter:
+    """
+    Token bucket per provider and account, shared by every worker through Redis.
+
+    All provider API calls go through `call` / `call_async`, which wait for quota before
+    sending the request and retry throttled (429) and, for idempotent calls, transient
+    (5xx) failures with jittered exponential backoff, honouring Retry-After. Counters per
+    provider (requests, units, delayed, throttled, retries, failed) are kept in the
+    `ratelimit:stats:<provider>` hash.
+
+    `call` sleeps in the calling thread, async code must use `call_async` or run it with
+    asyncio.to_thread.
+    """
+
+    def _keys(self, provider: str, account_id: str):
+        return [
+            f"ratelimit:{provider}:{account_id}",
+            f"ratelimit:{provider}:{account_id}:cooldown",
+            f"ratelimit:stats:{provider}",
+        ]
+
+    def _take(self, provider: str, account_id: str, cost: int) -> float:
+        capacity, rate = PROVIDER_LIMITS[provider]
+        wait_ms = _TAKE_TOKENS(
+            keys=self._keys(provider, account_id), args=[capacity, rate, min(cost, capacity)]
+        )
+        return int(wait_ms) / 1000
+
+    def _record(self, provider: str, field: str):
+        cache.hincrby(f"ratelimit:stats:{provider}", field, 1)
+
+    def _backoff(
+        self, provider: str, account_id: str, error: Exception, attempt: int, idempotent: bool
+    ):
+        """Return how long to wait before retrying `error`, or raise it if it is final."""
+        retryable, throttled, retry_after = classify_error(error, idempotent)
+        # Full jitter so workers throttled together do not retry together
+        delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2**attempt))
+        if retry_after is not None:
+            delay = retry_after + random.uniform(0, BACKOFF_BASE_SECONDS)
+        if throttled:
+            self._record(provider, "throttled")
+            cache.set(self._keys(provider, account_id)[1], 1, px=max(1, int(delay * 1000)))
+        if not retryable or attempt >= PROVIDER_MAX_RETRIES:
+            if retryable:
+                self._record(provider, "failed")
+            raise error
+
+        self._record(provider, "retries")
+        logger.warning(
+            f"{provider} call for {account_id} failed ({error.__class__.__name__}), "
+            f"retrying in {delay:.1f}s (attempt {attempt + 1}/{PROVIDER_MAX_RETRIES})"
+        )
+        return delay
+
+    def acquire(self, provider: str, account_id: str, cost: int = 1):
+        """Block until `cost` units of the account's quota are available."""
+        deadline = time.monotonic() + RATE_LIMIT_MAX_WAIT_SECONDS
+        while (wait := self._take(provider, account_id, cost)) > 0:
+            if time.monotonic() + wait > deadline:
+                raise RateLimitExceeded(f"No {provider} quota for {account_id}")
+            time.sleep(wait)
+
+    async def acquire_async(self, provider: str, account_id: str, cost: int = 1):
+        deadline = time.monotonic() + RATE_LIMIT_MAX_WAIT_SECONDS
+        while (wait := self._take(provider, account_id, cost)) > 0:
+            if time.monotonic() + wait > deadline:
+                raise RateLimitExceeded(f"No {provider} quota for {account_id}")
+            await asyncio.sleep(wait)
+
+    def call(
+        self,
+        provider: str,
+        account_id: str,
+        fn: Callable[[], T],
+        cost: int = 1,
+        idempotent: bool = True,
+    ) -> T:
+        """
+        Run `fn` within the account's quota.
+
+        Args:
+            idempotent: False for calls that must not be repeated after a 5xx, such as
+                sending or modifying a message
+        """
+        start = time.perf_counter()
+        outcome = "error"
+        with span(f"{provider}.call", provider=provider, account_id=str(account_id)):
+            try:
+                attempt = 0
+                while True:
+                    self.acquire(provider, account_id, cost)
+                    try:
+                        result = fn()
+                        outcome = "ok"
+                        return result
+                    except Exception as error:
+                        time.sleep(self._backoff(provider, account_id, error, attempt, idempotent))
+                        attempt += 1
+            finally:
+                self._observe(provider, outcome, start)
+
+    async def call_async(
+        self,
+        provider: str,
+        account_id: str,
+        fn: Callable[[], Awaitable[T]],
+        cost: int = 1,
+        idempotent: bool = True,
+    ) -> T:
+        start = time.perf_counter()
+        outcome = "error"
+        with span(f"{provider}.call", provider=provider, account_id=str(account_id)):
+            try:
+                attempt = 0
+                while True:
+                    await self.acquire_async(provider, account_id, cost)
+                    try:
+                        result = await fn()
+                        outcome = "ok"
+                        return result
+                    except Exception as error:
+                        await asyncio.sleep(
+                            self._backoff(provider, account_id, error, attempt, idempotent)
+                        )
+                        attempt += 1
+            finally:
+                self._observe(provider, outcome, start)
+
+    def _observe(self, provider: str, outcome: str, start: float):
+        PROVIDER_CALLS.labels(provider=provider, outcome=outcome).inc()
+        PROVIDER_LATENCY.labels(provider=provider).observe(time.perf_counter() - start)
+
+
+rate_limiter = RateLimiter()
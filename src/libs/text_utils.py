@@ -1,11 +1,12 @@
 from openai import OpenAI
 
 from src.libs.const import OPENAI_API_KEY
+from src.libs.metrics import openai_http_client
 
+client = OpenAI(api_key=OPENAI_API_KEY, http_client=openai_http_client())
 
-def summarize_text(content, name):
-    client = OpenAI(api_key=OPENAI_API_KEY)
 
+def summarize_text(content, name):
     try:
         response = client.chat.completions.create(
             model="gpt-5-nano",
@@ -0,0 +1,60 @@
+import logging
+
+from opentelemetry import trace
+from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+from opentelemetry.instrumentation.celery import CeleryInstrumentor
+from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+from opentelemetry.instrumentation.requests import RequestsInstrumentor
+from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+from src.libs.const import OTEL_EXPORTER_OTLP_ENDPOINT, OTEL_SERVICE_NAME
+
+logger = logging.getLogger(__name__)
+
+tracer = trace.get_tracer("dashai")
+
+_configured = False
+
+
+def setup_tracing(component: str, app=None):
+    """
+    Export OpenTelemetry spans to OTEL_EXPORTER_OTLP_ENDPOINT, if it is set.
+
+    Celery propagates the trace context in task headers, so a task's spans join the
+    trace of the API request that queued it, and provider and OpenAI calls made by the
+    task are nested below it.
+
+    Args:
+        component (str): Process kind, e.g. "api" or "worker"
+        app (FastAPI): The API app to instrument, if this is the API process
+    """
+    global _configured
+    if _configured or not OTEL_EXPORTER_OTLP_ENDPOINT:
+        return
+    _configured = True
+
+    resource = Resource.create({"service.name": OTEL_SERVICE_NAME, "component": component})
+    provider = TracerProvider(resource=resource)
+    # The exporter reads OTEL_EXPORTER_OTLP_ENDPOINT (and headers) from the environment
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+
+    # Imported here, provider services import this module while src.database loads
+    from src.database.db import engine
+
+    CeleryInstrumentor().instrument()
+    RequestsInstrumentor().instrument()
+    HTTPXClientInstrumentor().instrument()
+    SQLAlchemyInstrumentor().instrument(engine=engine)
+    if app is not None:
+        FastAPIInstrumentor.instrument_app(app, excluded_urls="health,metrics")
+    logger.info(f"Tracing {component} to {OTEL_EXPORTER_OTLP_ENDPOINT}")
+
+
+def span(name: str, **attributes):
+    """Span around work no instrumented library covers, e.g. Gmail calls over httplib2."""
+    return tracer.start_as_current_span(name, attributes=attributes)
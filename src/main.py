@@ -1,4 +1,5 @@
 import secrets
+import time
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request, Response
@@ -6,6 +7,8 @@ from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
 
 from src.libs.const import STAGE
+from src.libs.metrics import HTTP_REQUEST_DURATION
+from src.libs.tracing import setup_tracing
 from src.routes import (
     auth_router,
     compose_router,
@@ -88,6 +91,29 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
         return response
 
 
+class MetricsMiddleware(BaseHTTPMiddleware):
+    """Record request latency per route template, e.g. /user/{user_id}/emails."""
+
+    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            # Unmatched paths share one label so scanners cannot blow up the series count
+            route = request.scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                method=request.method,
+                route=route.path if route else "unmatched",
+                status=str(status),
+            ).observe(time.perf_counter() - start)
+
+
+app.add_middleware(MetricsMiddleware)
+setup_tracing("api", app)
+
 if STAGE == "production":
     app.add_middleware(
         CORSMiddleware,
@@ -21,6 +21,7 @@ from src.libs.const import (
 from src.libs.discord_service import send_discord_message
 from src.routes.middleware import ALGORITHM, get_user_id
 from src.services import FlowService, GoogleProfileService, OutlookService
+from src.services.token_manager import token_manager
 
 router = APIRouter()
 
@@ -176,6 +177,8 @@ async def outlook_callback(callback: Callback):
 
         db.add_all([user, email_account])
         db.commit()
+        # Drop access tokens cached from the previous authorization
+        token_manager.invalidate(email_account.token.id)
 
         ingest_email.delay(email_account_id=email_account.id)
 
@@ -306,6 +309,8 @@ async def google_callback(callback: Callback):
 
         db.add_all([email_account, user])
         db.commit()
+        if email_account.token:
+            token_manager.invalidate(email_account.token.id)
         ingest_email.delay(email_account_id=email_account.id)
         user.last_login = datetime.utcnow()
 
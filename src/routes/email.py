@@ -1,12 +1,27 @@
 from enum import Enum
 from typing import Optional
 
-from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from sqlalchemy import any_, or_
-
-from src.celery_tasks.tasks import get_new_emails, mark_emails_as_shown
-from src.database import Contact, Email, EmailAccount, EmailLabel, VectorDB, get_db
+from sqlalchemy.orm import selectinload
+
+from src.celery_tasks.call_tasks import schedule_call_brief_refresh
+from src.celery_tasks.tasks import get_new_emails, record_shown_emails
+from src.database import (
+    Contact,
+    Email,
+    EmailAccount,
+    EmailAttachment,
+    EmailLabel,
+    VectorDB,
+    get_db,
+)
+from src.libs import inbox_cache
+from src.libs.const import SYNC_DEBOUNCE_SECONDS
+from src.libs.events import EMAILS_CHANGED, publish
+from src.libs.locks import debounce
 from src.libs.types import EmailData, EmailFolder
 from src.routes.middleware import get_user_id
 
@@ -37,10 +52,17 @@ async def get_emails_count(
     user=Depends(get_user_id),
 ):
     if user_id == user.get("user_id"):
-        with get_db() as db:
+        if category:
+            category = category.split(",")
+        version = inbox_cache.folder_version(user_id, folder.value)
+        if version is not None:
+            count = inbox_cache.get_count(user_id, folder.value, version, category)
+            if count is not None:
+                return count
+
+        with get_db(readonly=True, user_id=user_id) as db:
             if category:
-                category = category.split(",")
-                return (
+                count = (
                     db.query(Email)
                     .join(EmailAccount, Email.email_account_id == EmailAccount.id)
                     .filter(
@@ -51,12 +73,15 @@ async def get_emails_count(
                     .count()
                 )
             else:
-                return (
+                count = (
                     db.query(Email)
                     .join(EmailAccount, Email.email_account_id == EmailAccount.id)
                     .filter(Email.folder == folder, EmailAccount.user_id == user_id)
                     .count()
                 )
+        if version is not None:
+            inbox_cache.set_count(user_id, folder.value, version, count, category)
+        return count
 
     raise HTTPException(status_code=401, detail="Unauthorized")
 
@@ -75,11 +100,28 @@ async def get_emails(
 ):  # -> dict[str, Any]:
 
     if user_id == user.get("user_id"):
-        with get_db() as db:
+        # Coalesce syncs triggered by repeated page loads and scrolling
+        if debounce(f"get_new_emails:{user_id}", SYNC_DEBOUNCE_SECONDS):
             get_new_emails.delay(user_id)
-            if category:
-                category = [category] if isinstance(category, str) else category
-
+        if category:
+            category = [category] if isinstance(category, str) else category
+
+        # Only first pages are cached, they are most of the traffic
+        version = inbox_cache.folder_version(user_id, folder.value) if page == 1 else None
+        cache_params = {
+            "account": account,
+            "filter_is_read": filter_is_read,
+            "category": sorted(category or []),
+            "limit": limit,
+        }
+        if version is not None:
+            cached = inbox_cache.get_page(user_id, folder.value, version, cache_params)
+            if cached:
+                body, unshown_ids = cached
+                record_shown_emails(unshown_ids)
+                return Response(content=body, media_type="application/json")
+
+        with get_db(readonly=True, user_id=user_id) as db:
             if account:
                 email_account = (
                     db.query(EmailAccount)
@@ -120,7 +162,8 @@ async def get_emails(
                     )
 
                 emails = (
-                    email_query.order_by(Email.date.desc())
+                    email_query.options(selectinload(Email.attachments))
+                    .order_by(Email.date.desc())
                     .limit(limit)
                     .offset((page - 1) * limit)
                     .all()
@@ -161,22 +204,48 @@ async def get_emails(
                     )
 
                 emails: list[Email] = (
-                    email_query.order_by(Email.date.desc())
+                    email_query.options(selectinload(Email.attachments))
+                    .order_by(Email.date.desc())
                     .limit(limit)
                     .offset((page - 1) * limit)
                     .all()
                 )
 
-                mark_emails_as_shown.delay([email.id for email in emails])
+            unshown_ids = [] if account else [email.id for email in emails if not email.is_shown]
+            record_shown_emails(unshown_ids)
 
             # Check if we've reached the end of the records
             end = (page - 1) * limit + len(emails) >= total_count
 
-            return {
+            attachments = [attachment for email in emails for attachment in email.attachments]
+            EmailAttachment.sign_urls(attachments)
+
+            content = {
                 "emails": [email.to_dict() for email in emails],
                 "end": end,
                 "total_count": total_count,
             }
+            response = JSONResponse(jsonable_encoder(content))
+        if version is not None:
+            body = response.body
+            if unshown_ids:
+                # This response shows them as new, later ones see them shown once
+                # flush_shown_emails ran, which therefore leaves the cached page alone
+                shown = {str(email_id) for email_id in unshown_ids}
+                for email in content["emails"]:
+                    if email["id"] in shown:
+                        email["is_shown"] = True
+                body = JSONResponse(jsonable_encoder(content)).body
+            inbox_cache.set_page(
+                user_id,
+                folder.value,
+                version,
+                cache_params,
+                body,
+                unshown_ids,
+                ttl=EmailAttachment.urls_fresh_for(attachments),
+            )
+        return response
 
     raise HTTPException(status_code=401, detail="Unauthorized")
 
@@ -186,7 +255,7 @@ async def get_email(
     request: Request, user_id: str, id: str = Query(...), user=Depends(get_user_id)
 ):
     if user_id == user.get("user_id"):
-        with get_db() as db:
+        with get_db(readonly=True, user_id=user_id) as db:
             email = db.query(Email).filter(Email.id == id).first()
             if not email:
                 raise HTTPException(status_code=404, detail="Email not found")
@@ -207,15 +276,8 @@ async def get_email_content(
             )
 
             # increment score by 1 if email is opened
-            if contact := (
-                db.query(Contact)
-                .filter(
-                    Contact.email_address == email.sender[0],
-                    Contact.email_account_id == email.email_account_id,
-                )
-                .first()
-            ):
-                contact.increment_score(db, 2)
+            if email.sender:
+                Contact.apply_score_events(db, [(email.email_account_id, email.sender[0])], 2)
 
             return HTMLResponse(content=email.sanitized_content(request))
     raise HTTPException(status_code=401, detail="Unauthorized")
@@ -230,9 +292,10 @@ async def modify_email(
     user=Depends(get_user_id),
 ):
     if user_id == user.get("user_id"):
-        with get_db() as db:
+        with get_db(user_id=user_id) as db:
             email = db.query(Email).filter(Email.email_id == email_id).first()
             if email and str(email.email_account.user_id) == user_id:
+                folder = email.folder
                 if action == ActionType.read:
                     e = await email.mark_as_read(db)
                 elif action == ActionType.unread:
@@ -246,6 +309,8 @@ async def modify_email(
                 elif action == ActionType.spam:
                     e = await email.move_to_spam(db)
                 e = await e.sync_from_web(db)
+                publish(EMAILS_CHANGED, user_id=user_id, folders=[folder, e.folder])
+                schedule_call_brief_refresh(user_id)
                 return e.to_dict()
             else:
                 raise HTTPException(status_code=404, detail="Email not found")
@@ -256,7 +321,7 @@ async def modify_email(
 async def send_email(
     request: Request, user_id: str, email: EmailData = Body(...), user=Depends(get_user_id)
 ):
-    with get_db() as db:
+    with get_db(user_id=user_id) as db:
         if user_id != user.get("user_id"):
             raise HTTPException(status_code=401, detail="Unauthorized")
 
@@ -275,10 +340,9 @@ async def send_email(
 
         if res:
             # Inrement score of contact by 1 if user sends an email to them
-            contacts = email.to  # List of recipient email addresses
-            for recipient_email in contacts:
-                contact = db.query(Contact).filter(Contact.email_address == recipient_email).first()
-                contact.increment_score(db, 3)
+            recipients = [(email_account.id, recipient_email) for recipient_email in email.to]
+            Contact.bulk_upsert(db, [(email_account.id, address, "") for address in email.to])
+            Contact.apply_score_events(db, recipients, 3)
 
             return {"message": "Email sent successfully"}
         else:
@@ -307,13 +371,21 @@ async def search_email(
     query: str = Query(...),
     user=Depends(get_user_id),
 ):
-    with get_db() as db:
+    with get_db(readonly=True, user_id=user_id) as db:
         if user_id != user.get("user_id"):
             raise HTTPException(status_code=401, detail="Unauthorized")
 
         res = vector_db.query(query, 20, user_id)
         email_ids = [match["metadata"]["id"] for match in res["matches"]]
-        emails = db.query(Email).filter(Email.email_id.in_(email_ids)).all()
+        emails = (
+            db.query(Email)
+            .options(selectinload(Email.attachments))
+            .filter(Email.email_id.in_(email_ids))
+            .all()
+        )
+        EmailAttachment.sign_urls(
+            [attachment for email in emails for attachment in email.attachments]
+        )
         return [email.to_dict() for email in emails]
 
 
@@ -326,7 +398,7 @@ async def email_label_action(
     action: LabelActionType,
     user=Depends(get_user_id),
 ):
-    with get_db() as db:
+    with get_db(user_id=user_id) as db:
         if user_id != user.get("user_id"):
             raise HTTPException(status_code=401, detail="Unauthorized")
 
@@ -353,4 +425,5 @@ async def email_label_action(
                 email.email_labels.remove(label)
         db.add(email)
         db.commit()
+        publish(EMAILS_CHANGED, user_id=user_id, folders=[email.folder])
         return email.to_dict()
@@ -3,6 +3,7 @@ from enum import Enum
 from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request
 
 from src.database import Color, EmailLabel, get_db
+from src.libs.events import EMAILS_CHANGED, publish
 from src.routes.middleware import get_user_id
 
 router = APIRouter()
@@ -20,7 +21,7 @@ async def get_labels(
     user=Depends(get_user_id),
 ):
     if user_id == user.get("user_id"):
-        with get_db() as db:
+        with get_db(readonly=True, user_id=user_id) as db:
             if label_type and label_type == LabelType.EMAIL:
                 labels = (
                     db.query(EmailLabel)
@@ -50,7 +51,7 @@ async def create_label(
     user=Depends(get_user_id),
 ):
     if user_id == user.get("user_id"):
-        with get_db() as db:
+        with get_db(user_id=user_id) as db:
             if label_type and label_type == LabelType.EMAIL:
                 label = EmailLabel(name=name, user_id=user_id, color=color)
             else:
@@ -71,7 +72,7 @@ async def update_label(
     color: Color = Body(...),
     user=Depends(get_user_id),
 ):
-    with get_db() as db:
+    with get_db(user_id=user_id) as db:
         if user_id != user.get("user_id"):
             raise HTTPException(status_code=401, detail="Unauthorized")
 
@@ -87,6 +88,8 @@ async def update_label(
         label.color = color
         db.add(label)
         db.commit()
+        # Emails are listed with their labels, in whichever folder they are
+        publish(EMAILS_CHANGED, user_id=user_id)
         return label.to_dict()
 
 
@@ -97,7 +100,7 @@ async def delete_label(
     label_id: str,
     user=Depends(get_user_id),
 ):
-    with get_db() as db:
+    with get_db(user_id=user_id) as db:
         if user_id != user.get("user_id"):
             raise HTTPException(status_code=401, detail="Unauthorized")
 
@@ -111,4 +114,5 @@ async def delete_label(
 
         db.delete(label)
         db.commit()
+        publish(EMAILS_CHANGED, user_id=user_id)
         return {"message": "Label deleted successfully"}
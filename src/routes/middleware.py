@@ -1,8 +1,21 @@
+import logging
+
 import jwt
+import telnyx
 from fastapi import HTTPException, Request
 from jose import JWTError
+from nacl.exceptions import BadSignatureError
+
+from src.libs.const import (
+    SECRET_KEY,
+    TELNYX_PUBLIC_KEY,
+    TELNYX_SECRET_KEY,
+    TELNYX_WEBHOOK_TOLERANCE_SECONDS,
+)
 
-from src.libs.const import SECRET_KEY, TELNYX_SECRET_KEY
+logger = logging.getLogger(__name__)
+
+telnyx.public_key = TELNYX_PUBLIC_KEY
 
 ALGORITHM = "HS256"
 
@@ -27,3 +40,26 @@ def check_secret_token(request: Request):
     if secret_token != TELNYX_SECRET_KEY:
         raise HTTPException(status_code=401, detail="Invalid secret token")
     return request.headers.get("call_control_id")
+
+
+async def verify_telnyx_signature(request: Request):
+    """
+    Reject Call Control webhooks that Telnyx did not sign.
+
+    Telnyx cannot add the X-Telnyx-Secret header to these events, so they are checked
+    against the telnyx-signature-ed25519 header with the account's public key instead.
+    """
+    if not TELNYX_PUBLIC_KEY:
+        logger.error("TELNYX_PUBLIC_KEY is not set, rejecting Telnyx webhook")
+        raise HTTPException(status_code=401, detail="Invalid signature")
+    signature = request.headers.get("telnyx-signature-ed25519")
+    timestamp = request.headers.get("telnyx-timestamp")
+    if not signature or not timestamp:
+        raise HTTPException(status_code=401, detail="Missing signature")
+    payload = (await request.body()).decode()
+    try:
+        telnyx.Webhook.construct_event(
+            payload, signature, timestamp, tolerance=TELNYX_WEBHOOK_TOLERANCE_SECONDS
+        )
+    except (ValueError, BadSignatureError, telnyx.error.SignatureVerificationError):
+        raise HTTPException(status_code=401, detail="Invalid signature")
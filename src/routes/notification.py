@@ -10,7 +10,7 @@ router = APIRouter()
 @router.get("/user/{user_id}/notifications")
 async def get_notifications(user_id: str, user=Depends(get_user_id)):
     if user_id == user.get("user_id"):
-        with get_db() as db:
+        with get_db(readonly=True, user_id=user_id) as db:
             notifications = db.query(Notification).filter(Notification.user_id == user_id).all()
             return [notification.to_dict() for notification in notifications]
     raise HTTPException(status_code=401, detail="Unauthorized")
@@ -21,7 +21,7 @@ async def update_notification(
     user_id: str, notification_id: str, action: NotificationStatus, user=Depends(get_user_id)
 ):
     if user_id == user.get("user_id"):
-        with get_db() as db:
+        with get_db(user_id=user_id) as db:
             notification = (
                 db.query(Notification)
                 .filter(Notification.id == notification_id, Notification.user_id == user_id)
@@ -1,16 +1,240 @@
+import asyncio
+import hashlib
+import ipaddress
+import logging
+import re
+import socket
+import time
+from typing import Optional
+from urllib.parse import urljoin, urlparse
+
 import httpx
-from fastapi import APIRouter, Response
+from fastapi import APIRouter, Request, Response
+from redis.exceptions import RedisError
+
+from src.database.cache import async_cache
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+MAX_STYLESHEET_BYTES = 512 * 1024
+# Freshness used when the origin sends no max-age, and the bounds applied to it
+DEFAULT_MAX_AGE = 60 * 60
+MIN_MAX_AGE = 5 * 60
+MAX_MAX_AGE = 7 * 24 * 60 * 60
+# How long a stale copy is kept around for revalidation and as a fallback on errors
+STALE_TTL = 7 * 24 * 60 * 60
+# How long a failing URL or host is answered from the negative cache
+NEGATIVE_TTL = 5 * 60
+MAX_REDIRECTS = 5
 
-@router.get("/proxy-stylesheet/")
-async def proxy_stylesheet(url: str):
+# One pooled client per process instead of a new connection pool per request. Redirects are
+# followed by _fetch, which checks every target like the requested URL.
+client = httpx.AsyncClient(
+    timeout=httpx.Timeout(10, connect=5),
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    headers={"User-Agent": "DashAI-StylesheetProxy/1.0"},
+)
+
+
+class StylesheetTooLarge(Exception):
+    pass
+
+
+class InvalidStylesheetURL(Exception):
+    pass
+
+
+@router.on_event("shutdown")
+async def close_client():
+    await client.aclose()
+
+
+def _cache_key(url: str) -> str:
+    return f"stylesheet:{hashlib.sha256(url.encode()).hexdigest()}"
+
+
+def _is_public_address(address: str) -> bool:
+    # Drop the zone of scoped IPv6 addresses such as fe80::1%eth0
+    ip = ipaddress.ip_address(address.split("%")[0])
+    return ip.is_global and not ip.is_multicast
+
+
+def _is_allowed_url(url: str) -> bool:
+    """Whether the proxy may fetch `url`: http(s), and no loopback or private address."""
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        return False
+    if parsed.hostname == "localhost" or parsed.hostname.endswith(".localhost"):
+        return False
+    try:
+        return _is_public_address(parsed.hostname)
+    except ValueError:
+        return True
+
+
+async def _resolves_to_public(hostname: str) -> bool:
+    """Whether `hostname` resolves, and only to public addresses."""
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(
+            hostname, None, type=socket.SOCK_STREAM
+        )
+    except (socket.gaierror, UnicodeError):
+        return False
+    return bool(addresses) and all(_is_public_address(info[4][0]) for info in addresses)
+
+
+async def _check_url(url: str):
+    """Raise InvalidStylesheetURL unless `url` is allowed and its host resolves publicly."""
+    if not _is_allowed_url(url) or not await _resolves_to_public(urlparse(url).hostname):
+        raise InvalidStylesheetURL(url)
+
+
+async def _cached(key: str) -> Optional[dict]:
+    try:
+        return await async_cache.hgetall(key)
+    except RedisError as e:
+        logger.warning(f"Stylesheet cache unavailable: {e}")
+        return None
+
+
+async def _negative_cached(keys: list) -> bool:
+    try:
+        return any(await async_cache.mget(keys))
+    except RedisError as e:
+        logger.warning(f"Stylesheet cache unavailable: {e}")
+        return False
+
+
+async def _store(key: str, mapping: dict, ttl: int):
+    try:
+        pipe = async_cache.pipeline(transaction=False)
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, ttl)
+        await pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Could not cache stylesheet {key}: {e}")
+
+
+async def _store_negative(key: str):
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, timeout=10)
+        await async_cache.set(key, 1, ex=NEGATIVE_TTL)
+    except RedisError as e:
+        logger.warning(f"Could not cache failure {key}: {e}")
+
+
+def _max_age(cache_control: Optional[str]) -> Optional[int]:
+    """Seconds the origin lets us reuse the response, or None if it may not be stored."""
+    directives = (cache_control or "").lower()
+    if "no-store" in directives or "private" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0
+    if match := re.search(r"(?:s-maxage|max-age)=(\d+)", directives):
+        return min(max(int(match.group(1)), MIN_MAX_AGE), MAX_MAX_AGE)
+    return DEFAULT_MAX_AGE
+
+
+def _stylesheet_response(request: Request, entry: dict) -> Response:
+    etag = entry[b"etag_out"].decode()
+    remaining = max(0, int(float(entry[b"fresh_until"]) - time.time()))
+    headers = {"Cache-Control": f"public, max-age={remaining}", "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(
+        content=entry[b"body"], media_type=entry[b"content_type"].decode(), headers=headers
+    )
+
+
+def _failure_response() -> Response:
+    return Response(
+        "Failed to fetch stylesheet", status_code=500, headers={"Cache-Control": "no-store"}
+    )
+
+
+async def _fetch(url: str, entry: Optional[dict]) -> httpx.Response:
+    """
+    GET the stylesheet, revalidating a cached copy and enforcing the size limit.
+
+    The host of the URL and of every redirect target, followed up to MAX_REDIRECTS times,
+    must resolve to public addresses only, so neither a hostname pointing inside our
+    network nor a redirect can make the proxy fetch from it.
+    """
+    headers = {}
+    if entry and entry.get(b"etag"):
+        headers["If-None-Match"] = entry[b"etag"].decode()
+    if entry and entry.get(b"last_modified"):
+        headers["If-Modified-Since"] = entry[b"last_modified"].decode()
+
+    for _ in range(MAX_REDIRECTS + 1):
+        await _check_url(url)
+        async with client.stream("GET", url, headers=headers) as response:
+            if response.status_code == 304:
+                return response
+            if response.is_redirect:
+                url = urljoin(str(response.url), response.headers["Location"])
+                continue
             response.raise_for_status()
-            content_type = response.headers.get("Content-Type", "text/css")
-            return Response(content=response.text, media_type=content_type)
-    except httpx.RequestError:
-        return Response("Failed to fetch stylesheet", status_code=500)
+            if int(response.headers.get("Content-Length") or 0) > MAX_STYLESHEET_BYTES:
+                raise StylesheetTooLarge(url)
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body.extend(chunk)
+                if len(body) > MAX_STYLESHEET_BYTES:
+                    raise StylesheetTooLarge(url)
+            return httpx.Response(
+                response.status_code,
+                headers=response.headers,
+                content=bytes(body),
+                request=response.request,
+            )
+    raise httpx.TooManyRedirects(f"More than {MAX_REDIRECTS} redirects", request=response.request)
+
+
+@router.get("/proxy-stylesheet/")
+async def proxy_stylesheet(request: Request, url: str):
+    if not _is_allowed_url(url):
+        return Response("Invalid stylesheet URL", status_code=400)
+
+    key = _cache_key(url)
+    negative_keys = [f"{key}:failed", f"stylesheet:host_failed:{urlparse(url).hostname}"]
+    entry = await _cached(key)
+    if entry and float(entry[b"fresh_until"]) > time.time():
+        return _stylesheet_response(request, entry)
+
+    if await _negative_cached(negative_keys):
+        return _stylesheet_response(request, entry) if entry else _failure_response()
+
+    try:
+        response = await _fetch(url, entry)
+    except (httpx.HTTPError, StylesheetTooLarge, InvalidStylesheetURL) as e:
+        logger.info(f"Failed to fetch stylesheet {url}: {e!r}")
+        # Unreachable or erroring hosts are skipped for every URL on them, other
+        # failures (404, oversized, bad redirect) only for this URL
+        host_failure = isinstance(e, httpx.TransportError) or (
+            isinstance(e, httpx.HTTPStatusError) and e.response.status_code >= 500
+        )
+        negative_key = negative_keys[1] if host_failure else negative_keys[0]
+        await _store_negative(negative_key)
+        # Serve the stale copy rather than breaking the email's styling
+        return _stylesheet_response(request, entry) if entry else _failure_response()
+
+    max_age = _max_age(response.headers.get("Cache-Control"))
+    if response.status_code == 304:
+        fresh_until = time.time() + (max_age if max_age is not None else MIN_MAX_AGE)
+        await _store(key, {"fresh_until": fresh_until}, STALE_TTL)
+        entry[b"fresh_until"] = str(fresh_until).encode()
+        return _stylesheet_response(request, entry)
+
+    entry = {
+        b"body": response.content,
+        b"content_type": response.headers.get("Content-Type", "text/css").encode(),
+        b"etag": response.headers.get("ETag", "").encode(),
+        b"last_modified": response.headers.get("Last-Modified", "").encode(),
+        b"etag_out": f'"{hashlib.sha256(response.content).hexdigest()[:32]}"'.encode(),
+        b"fresh_until": str(time.time() + (max_age or 0)).encode(),
+    }
+    if max_age is not None:
+        await _store(key, entry, STALE_TTL)
+    return _stylesheet_response(request, entry)
@@ -11,9 +11,10 @@ from src.database.email import Email
 from src.database.email_account import EmailAccount
 from src.database.task import EmailTask, TaskStatus
 from src.libs.const import OPENAI_API_KEY
+from src.libs.metrics import openai_http_client
 from src.routes.middleware import get_user_id
 
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+client = openai.OpenAI(api_key=OPENAI_API_KEY, http_client=openai_http_client())
 router = APIRouter()
 
 
@@ -122,7 +123,7 @@ async def email_task_action(
     user=Depends(get_user_id),
 ):
     if user_id == user.get("user_id"):
-        with get_db() as db:
+        with get_db(user_id=user_id) as db:
             if action == TaskActionType.create:
                 email = db.query(Email).filter(Email.id == email_id).first()
                 if email:
@@ -198,7 +199,7 @@ async def get_tasks(
     user=Depends(get_user_id),
 ):
     if user_id == user.get("user_id"):
-        with get_db() as db:
+        with get_db(readonly=True, user_id=user_id) as db:
             # Get all email accounts for the user
             user_email_accounts = (
                 db.query(EmailAccount).filter(EmailAccount.user_id == user_id).all()
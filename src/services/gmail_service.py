@@ -1,22 +1,58 @@
-from datetime import datetime
+import json
+import threading
 
-from google.auth.exceptions import RefreshError
-from google.auth.transport.requests import Request
+import google_auth_httplib2
+import httplib2
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from sqlalchemy.orm import Session
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import HttpRequest
 
-from src.database import get_db
 from src.database.token import Token
-from src.libs.const import GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET
+from src.libs.client_cache import ClientCache
+from src.libs.const import (
+    GMAIL_API_ENDPOINT,
+    PROVIDER_CLIENT_CACHE_SIZE,
+    PROVIDER_CLIENT_CACHE_TTL,
+)
+from src.libs.rate_limit import GMAIL, rate_limiter
 from src.libs.types import EmailFolder
+from src.services.token_manager import token_manager
+
+# The discovery document ships with google-api-python-client, parse it once per process
+# instead of on every build()
+GMAIL_DISCOVERY_DOCUMENT = json.loads(discovery_cache.get_static_doc("gmail", "v1"))
+
+_clients = ClientCache(maxsize=PROVIDER_CLIENT_CACHE_SIZE, ttl=PROVIDER_CLIENT_CACHE_TTL)
+_thread_local = threading.local()
+
+
+def _thread_http() -> httplib2.Http:
+    """httplib2.Http is not thread safe; give every thread its own connection pool."""
+    if not hasattr(_thread_local, "http"):
+        _thread_local.http = httplib2.Http(timeout=60)
+    return _thread_local.http
+
+
+def _build_service(creds: Credentials):
+    def request_builder(http, *args, **kwargs):
+        # Requests run on whichever thread executes them, not the one that built the
+        # client, so authorize the calling thread's Http instead of a shared one
+        return HttpRequest(
+            google_auth_httplib2.AuthorizedHttp(creds, http=_thread_http()), *args, **kwargs
+        )
+
+    return build_from_document(
+        GMAIL_DISCOVERY_DOCUMENT,
+        credentials=creds,
+        requestBuilder=request_builder,
+        client_options={"api_endpoint": GMAIL_API_ENDPOINT} if GMAIL_API_ENDPOINT else None,
+    )
 
 
 class GmailService:
 
     def __init__(self, token: Token):
-        self._oauth_token = token.token
-        self._refresh_token = token.refresh_token
         self.labels = {
             EmailFolder.INBOX: "INBOX",
             EmailFolder.SENT: "SENT",
@@ -24,77 +60,85 @@ class GmailService:
             EmailFolder.TRASH: "TRASH",
             EmailFolder.SPAM: "SPAM",
         }
-        creds = Credentials(
-            token=self._oauth_token,
-            refresh_token=self._refresh_token,
-            client_id=GOOGLE_CLIENT_ID,
-            client_secret=GOOGLE_CLIENT_SECRET,
-            token_uri="https://accounts.google.com/o/oauth2/token",
+        token_id = str(token.id)
+
+        def refresh_handler(request, scopes=None):
+            return token_manager.get_access_token(token_id, "GMAIL")
+
+        def create_client():
+            access_token, expires_at = token_manager.get_access_token(token_id, "GMAIL")
+            # No refresh token here: google-auth calls refresh_handler once the access
+            # token expires, so refreshes go through the shared token manager
+            creds = Credentials(
+                token=access_token,
+                expiry=expires_at,
+                refresh_handler=refresh_handler,
+            )
+            return _build_service(creds)
+
+        self._token_id = token_id
+        self._service = _clients.get_or_create(token_id, create_client)
+
+    def _execute(self, request, cost: int = 5, idempotent: bool = True):
+        """Run an API request within the account's quota, retrying throttled calls."""
+        return rate_limiter.call(
+            GMAIL, self._token_id, request.execute, cost=cost, idempotent=idempotent
         )
-        if not creds or not creds.valid:
-            print("Token not valid")
-            creds = self.validate_token(cred=creds, token=token)
-
-        self._service = build("gmail", "v1", credentials=creds)
-
-    def validate_token(self, cred, token: Token, session: Session = get_db):
-        if cred and cred.expired and cred.refresh_token:
-            try:
-                cred.refresh(Request())
-                with session as db:
-                    token.token = cred.token
-                    token.refresh_token = cred.refresh_token
-                    token.updated_at = datetime.utcnow()
-                    db.commit()
-                return cred
-            except RefreshError:
-                print("Token refresh failed")
-
-        return cred
 
     def list_messages(self, user_id="me", q=None, folder: EmailFolder = None):
-        try:
-            result = (
+        """
+        List every message matching the query, following all result pages.
+
+        Raises on failure instead of returning a partial or empty list, which would look
+        like there is no new mail.
+        """
+        messages = []
+        page_token = None
+        while True:
+            result = self._execute(
                 self._service.users()
                 .messages()
-                .list(userId=user_id, q=q, labelIds=[self.labels[folder]])
-                .execute()
+                .list(userId=user_id, q=q, labelIds=[self.labels[folder]], pageToken=page_token)
             )
-            messages = []
-            if "messages" in result:
-                messages.extend(result["messages"])
-            while "nextPageToken" in result:
-                page_token = result["nextPageToken"]
-                result = (
-                    self._service.users()
-                    .messages()
-                    .list(userId="me", q=q, pageToken=page_token)
-                    .execute()
-                )
-                if "messages" in result:
-                    messages.extend(result["messages"])
-            return messages
-        except Exception as e:
-            print(f"Error listing messages: {str(e)}")
-            return []
+            messages.extend(result.get("messages", []))
+            page_token = result.get("nextPageToken")
+            if not page_token:
+                return messages
 
     def get_message(self, message_id, user_id="me"):
-        return self._service.users().messages().get(userId=user_id, id=message_id).execute()
+        return self._execute(self._service.users().messages().get(userId=user_id, id=message_id))
 
     def get_attachment(self, message_id, attachment_id, user_id="me"):
-        return (
+        return self._execute(
             self._service.users()
             .messages()
             .attachments()
             .get(userId=user_id, messageId=message_id, id=attachment_id)
-            .execute()
         )
 
+    def get_attachment_body(self, message_id, attachment_id, user_id="me") -> bytes:
+        """
+        Like get_attachment, but return the raw JSON body of the response. Parsing it would
+        hold a second copy of the whole file, its "data" field, as a str.
+        """
+        request = (
+            self._service.users()
+            .messages()
+            .attachments()
+            .get(userId=user_id, messageId=message_id, id=attachment_id)
+        )
+        request.postproc = lambda resp, content: content
+        return self._execute(request)
+
     def send_message(self, message):
-        return self._service.users().messages().send(userId="me", body=message).execute()
+        return self._execute(
+            self._service.users().messages().send(userId="me", body=message),
+            cost=100,
+            idempotent=False,
+        )
 
     def get_profile(self):
-        return self._service.users().getProfile(userId="me").execute()
+        return self._execute(self._service.users().getProfile(userId="me"), cost=1)
 
     def modify_labels(self, message_id, add_labels=None, remove_labels=None):
         body = {}
@@ -102,9 +146,14 @@ class GmailService:
             body["addLabelIds"] = add_labels
         if remove_labels:
             body["removeLabelIds"] = remove_labels
-        return (
-            self._service.users().messages().modify(userId="me", id=message_id, body=body).execute()
+        return self._execute(
+            self._service.users().messages().modify(userId="me", id=message_id, body=body),
+            idempotent=False,
         )
 
     def save_draft(self, message):
-        return self._service.users().drafts().create(userId="me", body=message).execute()
+        return self._execute(
+            self._service.users().drafts().create(userId="me", body=message),
+            cost=10,
+            idempotent=False,
+        )
@@ -1,6 +1,8 @@
+import asyncio
 import urllib.parse
 
 import requests
+import requests.adapters
 from fastapi import HTTPException
 from kiota_abstractions.base_request_configuration import RequestConfiguration
 from msgraph.generated.models.body_type import BodyType
@@ -17,24 +19,55 @@ from msgraph.generated.users.item.messages.messages_request_builder import (
 from msgraph.generated.users.item.send_mail.send_mail_post_request_body import (
     SendMailPostRequestBody,
 )
+from kiota_authentication_azure.azure_identity_authentication_provider import (
+    AzureIdentityAuthenticationProvider,
+)
+from msgraph import GraphRequestAdapter
 from msgraph.graph_service_client import GraphServiceClient
 
 from src.database.token import Token
+from src.libs.client_cache import ClientCache
 from src.libs.const import (
+    ATTACHMENT_DOWNLOAD_CONCURRENCY,
     MSFT_CLIENT_ID,
     MSFT_CLIENT_SECRET,
     MSFT_REDIRECT_URI,
     MSFT_TENANT_ID,
+    MSGRAPH_BASE_URL,
+    PROVIDER_CLIENT_CACHE_SIZE,
+    PROVIDER_CLIENT_CACHE_TTL,
 )
+from src.libs.rate_limit import OUTLOOK, rate_limiter
 from src.libs.types import EmailData, EmailFolder
 
 from .outlook_token import OutlookToken
 
+_clients = ClientCache(maxsize=PROVIDER_CLIENT_CACHE_SIZE, ttl=PROVIDER_CLIENT_CACHE_TTL)
+# Graph endpoints the SDK does not cover (attachment listings and raw content), with
+# connections kept alive across requests and accounts
+_http = requests.Session()
+_http.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=ATTACHMENT_DOWNLOAD_CONCURRENCY))
+
+DEFAULT_GRAPH_BASE_URL = "https://graph.microsoft.com/v1.0"
+
+
+def _build_graph_client(credentials) -> GraphServiceClient:
+    if MSGRAPH_BASE_URL == DEFAULT_GRAPH_BASE_URL:
+        return GraphServiceClient(credentials=credentials)
+    # Graph only sends tokens to allow-listed hosts, allow the configured one
+    auth_provider = AzureIdentityAuthenticationProvider(
+        credentials, allowed_hosts=[urllib.parse.urlparse(MSGRAPH_BASE_URL).hostname]
+    )
+    request_adapter = GraphRequestAdapter(auth_provider)
+    request_adapter.base_url = MSGRAPH_BASE_URL
+    return GraphServiceClient(request_adapter=request_adapter)
+
 
 class OutlookService:
     def __init__(self, token: Token = None, db: requests.Session = None):
         self.scopes = "openid profile email User.Read Mail.Send Mail.ReadWrite Calendars.ReadWrite offline_access"
-        self.client = None
+        self.token = None
+        self._client = None
         self.folders = {
             EmailFolder.INBOX: "inbox",
             EmailFolder.SENT: "sentitems",
@@ -43,8 +76,34 @@ class OutlookService:
             EmailFolder.SPAM: "junkemail",
         }
         if token:
-            self.token = OutlookToken(token, db)
-            self.client = GraphServiceClient(credentials=self.token)
+            self.token = OutlookToken(token)
+
+    @property
+    def client(self) -> GraphServiceClient:
+        """
+        Graph client for this account, reused across requests.
+
+        The underlying httpx pool is bound to the event loop it was first used on. Each
+        process runs its Graph calls on one long-lived loop, the server's in the API and
+        run_async's in workers, so clients are cached per account and owned by that loop.
+        """
+        if self.token is None:
+            return None
+        if self._client is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            if loop is None:
+                self._client = _build_graph_client(self.token)
+            else:
+                owner, self._client = _clients.get_or_create(
+                    self.token.token_id, lambda: (loop, _build_graph_client(self.token))
+                )
+                if owner is not loop:
+                    # Another loop than the process's own, e.g. asyncio.run in a script
+                    self._client = _build_graph_client(self.token)
+        return self._client
 
     def authorize_url(self, state: str = None, code_challenge: str = None):
         encoded_scopes = urllib.parse.quote(self.scopes, safe="")
@@ -72,100 +131,110 @@ class OutlookService:
 
     async def get_user_info(self, token: str = None):
         if token:
-            url = f"https://graph.microsoft.com/v1.0/me"
+            url = f"{MSGRAPH_BASE_URL}/me"
             headers = {
                 "Authorization": f"Bearer {token}",
             }
             response = requests.get(url, headers=headers)
             return response.json()
         elif self.client:
-            response = await self.client.me.get()
+            response = await self._call(lambda: self.client.me.get())
             return response
 
-    async def list_messages_for_folder(self, folder: EmailFolder, after_datetime_str: str):
+    def _message_query(self, after_datetime_str: str) -> RequestConfiguration:
+        select_params = [
+            "id",
+            "createdDateTime",
+            "sender",
+            "toRecipients",
+            "subject",
+            "ccRecipients",
+            "isRead",
+            "body",
+            "receivedDateTime",
+        ]
 
-        try:
-            select_params = [
-                "id",
-                "createdDateTime",
-                "sender",
-                "toRecipients",
-                "subject",
-                "ccRecipients",
-                "isRead",
-                "body",
-                "receivedDateTime",
-            ]
-
-            # Initialize query parameters
-            query_params = MessagesRequestBuilder.MessagesRequestBuilderGetQueryParameters(
-                select=select_params
-            )
+        # Initialize query parameters
+        query_params = MessagesRequestBuilder.MessagesRequestBuilderGetQueryParameters(
+            select=select_params
+        )
 
-            # Only add filter if after_datetime_str is provided
-            if after_datetime_str:
-                query_params.filter = f"receivedDateTime gt {after_datetime_str}"
+        # Only add filter if after_datetime_str is provided
+        if after_datetime_str:
+            query_params.filter = f"receivedDateTime gt {after_datetime_str}"
 
-            request_configuration = RequestConfiguration(query_parameters=query_params)
-            result = await self.client.me.mail_folders.by_mail_folder_id(
-                self.folders[folder]
-            ).messages.get(request_configuration=request_configuration)
-            return result.value
-        except Exception as e:
-            print("Error listing messages: ", e)
-            return []
+        return RequestConfiguration(query_parameters=query_params)
 
-    async def list_messages(self, after_datetime_str: str):
-        try:
-            select_params = [
-                "id",
-                "createdDateTime",
-                "sender",
-                "toRecipients",
-                "subject",
-                "ccRecipients",
-                "isRead",
-                "body",
-                "receivedDateTime",
-            ]
-
-            # Initialize query parameters
-            query_params = MessagesRequestBuilder.MessagesRequestBuilderGetQueryParameters(
-                select=select_params
-            )
+    async def _call(self, fn, idempotent: bool = True):
+        """Run a Graph request within the mailbox's quota, retrying throttled calls."""
+        return await rate_limiter.call_async(
+            OUTLOOK, self.token.token_id, fn, idempotent=idempotent
+        )
 
-            # Only add filter if after_datetime_str is provided
-            if after_datetime_str:
-                query_params.filter = f"receivedDateTime gt {after_datetime_str}"
+    async def _list_all(self, messages_builder, request_configuration: RequestConfiguration):
+        """
+        Fetch every page of a message listing.
 
-            request_configuration = RequestConfiguration(query_parameters=query_params)
-            result = await self.client.me.messages.get(request_configuration=request_configuration)
-            return result.value
-        except Exception as e:
-            print("Error listing messages: ", e)
-            return []
+        Raises on failure instead of returning a partial or empty list, which would look
+        like there is no new mail.
+        """
+        result = await self._call(
+            lambda: messages_builder.get(request_configuration=request_configuration)
+        )
+        messages = list(result.value or [])
+        while next_link := result.odata_next_link:
+            result = await self._call(lambda: messages_builder.with_url(next_link).get())
+            messages.extend(result.value or [])
+        return messages
+
+    async def list_messages_for_folder(self, folder: EmailFolder, after_datetime_str: str):
+        return await self._list_all(
+            self.client.me.mail_folders.by_mail_folder_id(self.folders[folder]).messages,
+            self._message_query(after_datetime_str),
+        )
+
+    async def list_messages(self, after_datetime_str: str):
+        return await self._list_all(
+            self.client.me.messages, self._message_query(after_datetime_str)
+        )
 
     async def get_message(self, message_id: str):
         try:
-            return await self.client.me.messages.by_message_id(message_id).get()
+            return await self._call(lambda: self.client.me.messages.by_message_id(message_id).get())
         except Exception as e:
             print("Error getting message: ", e)
             return None
 
+    def _get(self, url: str, stream: bool = False) -> requests.Response:
+        headers = {"Authorization": f"Bearer {self.token.get_token().token}"}
+        response = _http.get(url, headers=headers, stream=stream)
+        response.raise_for_status()
+        return response
+
     async def get_attachments(self, message_id: str):
         try:
-            url = f"https://graph.microsoft.com/v1.0/me/messages/{message_id}/attachments"
-            headers = {"Authorization": f"Bearer {self.token.get_token().token}"}
-            response = requests.get(url, headers=headers)
+            url = f"{MSGRAPH_BASE_URL}/me/messages/{message_id}/attachments"
+            # Off the event loop, the request and rate limit waits block
+            response = await asyncio.to_thread(
+                rate_limiter.call, OUTLOOK, self.token.token_id, lambda: self._get(url)
+            )
             return response.json().get("value", [])
         except Exception as e:
             print("Error getting attachments: ", e)
             return []
 
+    def iter_attachment_content(self, message_id: str, attachment_id: str, chunk_size: int):
+        """Stream the raw bytes of a file attachment without loading it into memory."""
+        url = f"{MSGRAPH_BASE_URL}/me/messages/{message_id}/attachments/{attachment_id}/$value"
+        with rate_limiter.call(
+            OUTLOOK, self.token.token_id, lambda: self._get(url, stream=True)
+        ) as response:
+            yield from response.iter_content(chunk_size=chunk_size)
+
     async def get_attachment(self, message_id: str, attachment_id: str):
         try:
-            return (
-                await self.client.me.messages.by_message_id(message_id)
+            return await self._call(
+                lambda: self.client.me.messages.by_message_id(message_id)
                 .attachments.by_attachment_id(attachment_id)
                 .get()
             )
@@ -177,7 +246,10 @@ class OutlookService:
         try:
             msg_update = Message()
             msg_update.is_read = True
-            await self.client.me.messages.by_message_id(message_id).patch(msg_update)
+            await self._call(
+                lambda: self.client.me.messages.by_message_id(message_id).patch(msg_update),
+                idempotent=False,
+            )
         except Exception as e:
             print("Error marking message as read: ", e)
             return False
@@ -186,7 +258,10 @@ class OutlookService:
         try:
             msg_update = Message()
             msg_update.is_read = False
-            await self.client.me.messages.by_message_id(message_id).patch(msg_update)
+            await self._call(
+                lambda: self.client.me.messages.by_message_id(message_id).patch(msg_update),
+                idempotent=False,
+            )
         except Exception as e:
             print("Error marking message as unread: ", e)
             return False
@@ -195,7 +270,10 @@ class OutlookService:
         try:
             msg_update = Message()
             msg_update.destination_id = "Archive"
-            await self.client.me.messages.by_message_id(message_id).move(msg_update)
+            await self._call(
+                lambda: self.client.me.messages.by_message_id(message_id).move(msg_update),
+                idempotent=False,
+            )
         except Exception as e:
             print("Error archiving message: ", e)
             return False
@@ -204,7 +282,10 @@ class OutlookService:
         try:
             msg_update = Message()
             msg_update.destination_id = "deleteditems"
-            await self.client.me.messages.by_message_id(message_id).move(msg_update)
+            await self._call(
+                lambda: self.client.me.messages.by_message_id(message_id).move(msg_update),
+                idempotent=False,
+            )
         except Exception as e:
             print("Error deleting message: ", e)
             return False
@@ -213,7 +294,10 @@ class OutlookService:
         try:
             msg_update = Message()
             msg_update.destination_id = "inbox"
-            await self.client.me.messages.by_message_id(message_id).move(msg_update)
+            await self._call(
+                lambda: self.client.me.messages.by_message_id(message_id).move(msg_update),
+                idempotent=False,
+            )
         except Exception as e:
             print("Error moving message to inbox: ", e)
             return False
@@ -222,7 +306,10 @@ class OutlookService:
         try:
             msg_update = Message()
             msg_update.destination_id = "junkemail"
-            await self.client.me.messages.by_message_id(message_id).move(msg_update)
+            await self._call(
+                lambda: self.client.me.messages.by_message_id(message_id).move(msg_update),
+                idempotent=False,
+            )
         except Exception as e:
             print("Error moving message to spam: ", e)
             return False
@@ -238,7 +325,7 @@ class OutlookService:
                     ],
                 )
             )
-            await self.client.me.send_mail.post(request_body)
+            await self._call(lambda: self.client.me.send_mail.post(request_body), idempotent=False)
         except Exception as e:
             print("Error sending email: ", e)
             raise HTTPException(status_code=500, detail="Failed to send email")
@@ -249,7 +336,10 @@ class OutlookService:
         message_id: str,
     ):
         try:
-            await self.client.me.messages.by_message_id(message_id).reply.post(reply_request)
+            await self._call(
+                lambda: self.client.me.messages.by_message_id(message_id).reply.post(reply_request),
+                idempotent=False,
+            )
             return True
         except Exception as e:
             print("Error sending reply: ", e)
@@ -257,7 +347,7 @@ class OutlookService:
 
     async def save_draft(self, message: Message):
         try:
-            await self.client.me.messages.post(message)
+            await self._call(lambda: self.client.me.messages.post(message), idempotent=False)
         except Exception as e:
             print("Error saving draft: ", e)
             raise HTTPException(status_code=500, detail="Failed to save draft")
@@ -0,0 +1,129 @@
+import json
+import os
+import shutil
+from abc import ABC, abstractmethod
+from datetime import timedelta
+from typing import BinaryIO
+
+from google.cloud import storage
+
+from src.libs.const import (
+    ATTACHMENT_STORAGE_BACKEND,
+    ATTACHMENT_STORAGE_PATH,
+    GCP_BUCKET_CREDENTIALS,
+    GCP_BUCKET_NAME,
+)
+
+
+class StorageService(ABC):
+    """Blob storage for attachment files."""
+
+    @abstractmethod
+    def exists(self, path: str) -> bool: ...
+
+    @abstractmethod
+    def upload(self, path: str, fileobj: BinaryIO, content_type: str = None): ...
+
+    @abstractmethod
+    def signed_url(self, path: str, expiration: timedelta, filename: str = None) -> str: ...
+
+    @abstractmethod
+    def delete_prefix(self, prefix: str) -> int: ...
+
+    @abstractmethod
+    def delete(self, path: str): ...
+
+
+class GCSStorageService(StorageService):
+    # Uploads larger than one chunk go through the resumable upload API, so the file is
+    # streamed from disk in chunks and a dropped connection only retries one chunk.
+    UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+    def __init__(
+        self, bucket_name: str = GCP_BUCKET_NAME, credentials: str = GCP_BUCKET_CREDENTIALS
+    ):
+        self.client = storage.Client.from_service_account_info(json.loads(credentials))
+        self.bucket = self.client.bucket(bucket_name)
+
+    def exists(self, path: str) -> bool:
+        return self.bucket.blob(path).exists()
+
+    def upload(self, path: str, fileobj: BinaryIO, content_type: str = None):
+        blob = self.bucket.blob(path, chunk_size=self.UPLOAD_CHUNK_SIZE)
+        blob.upload_from_file(fileobj, content_type=content_type, rewind=True)
+
+    def signed_url(self, path: str, expiration: timedelta, filename: str = None) -> str:
+        return self.bucket.blob(path).generate_signed_url(
+            version="v4",
+            expiration=expiration,
+            method="GET",
+            response_disposition=f'attachment; filename="{filename}"' if filename else None,
+        )
+
+    def delete_prefix(self, prefix: str) -> int:
+        blobs = list(self.client.list_blobs(self.bucket, prefix=prefix))
+        if blobs:
+            self.bucket.delete_blobs(blobs, on_error=lambda blob: None)
+        return len(blobs)
+
+    def delete(self, path: str):
+        self.bucket.blob(path).delete()
+
+
+class LocalStorageService(StorageService):
+    """Filesystem backend for development and tests."""
+
+    def __init__(self, root: str = ATTACHMENT_STORAGE_PATH):
+        self.root = root
+
+    def _path(self, path: str) -> str:
+        full_path = os.path.abspath(os.path.join(self.root, path))
+        if not full_path.startswith(os.path.abspath(self.root) + os.sep):
+            raise ValueError(f"Invalid storage path: {path}")
+        return full_path
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(self._path(path))
+
+    def upload(self, path: str, fileobj: BinaryIO, content_type: str = None):
+        full_path = self._path(path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        fileobj.seek(0)
+        with open(full_path, "wb") as f:
+            shutil.copyfileobj(fileobj, f)
+
+    def signed_url(self, path: str, expiration: timedelta, filename: str = None) -> str:
+        return f"file://{self._path(path)}"
+
+    def delete_prefix(self, prefix: str) -> int:
+        full_path = self._path(prefix)
+        if not os.path.exists(full_path):
+            return 0
+        count = sum(len(files) for _, _, files in os.walk(full_path))
+        shutil.rmtree(full_path)
+        return count
+
+    def delete(self, path: str):
+        full_path = self._path(path)
+        if os.path.exists(full_path):
+            os.remove(full_path)
+
+
+_storage_service: StorageService = None
+
+
+def get_storage_service() -> StorageService:
+    """Return the process wide storage backend selected by ATTACHMENT_STORAGE_BACKEND."""
+    global _storage_service
+    if _storage_service is None:
+        if ATTACHMENT_STORAGE_BACKEND == "gcs":
+            _storage_service = GCSStorageService()
+        else:
+            _storage_service = LocalStorageService()
+    return _storage_service
+
+
+def set_storage_service(storage_service: StorageService):
+    """Override the storage backend, e.g. with an in-memory fake."""
+    global _storage_service
+    _storage_service = storage_service
@@ -0,0 +1,267 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Set, Tuple
+
+import requests
+from google.auth._helpers import REFRESH_THRESHOLD
+from redis.exceptions import RedisError
+
+from src.database import get_db
+from src.database.cache import cache
+from src.database.token import Token
+from src.libs.const import (
+    GOOGLE_CLIENT_ID,
+    GOOGLE_CLIENT_SECRET,
+    MSFT_CLIENT_ID,
+    MSFT_CLIENT_SECRET,
+    MSFT_REDIRECT_URI,
+    MSFT_TENANT_ID,
+    TOKEN_REFRESH_AHEAD_SECONDS,
+)
+from src.libs.locks import distributed_lock
+from src.libs.metrics import TOKEN_REFRESHES
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
+MICROSOFT_TOKEN_URL = f"https://login.microsoftonline.com/{MSFT_TENANT_ID}/oauth2/v2.0/token"
+MICROSOFT_SCOPES = (
+    "openid profile email User.Read Mail.Send Mail.ReadWrite Calendars.ReadWrite offline_access"
+)
+
+# Below this much remaining lifetime a caller waits for the refresh instead of using the
+# current token while it is refreshed in the background. google-auth treats a token that
+# is within REFRESH_THRESHOLD of expiry as expired and fails instead of refreshing it, so
+# Gmail credentials must never get one.
+TOKEN_MIN_LIFETIME_SECONDS = int(REFRESH_THRESHOLD.total_seconds()) + 60
+REFRESH_LOCK_TTL = 30
+# How long a caller waits for another worker's in-flight refresh
+REFRESH_WAIT_SECONDS = 10
+REFRESH_POLL_INTERVAL = 0.2
+REQUEST_TIMEOUT = 15
+
+
+class TokenRefreshError(Exception):
+    pass
+
+
+def _refresh_google(refresh_token: str) -> dict:
+    response = _http.post(
+        GOOGLE_TOKEN_URL,
+        data={
+            "grant_type": "refresh_token",
+            "refresh_token": refresh_token,
+            "client_id": GOOGLE_CLIENT_ID,
+            "client_secret": GOOGLE_CLIENT_SECRET,
+        },
+        timeout=REQUEST_TIMEOUT,
+    )
+    if response.status_code != 200:
+        raise TokenRefreshError(f"Google token refresh failed: {response.text}")
+    return response.json()
+
+
+def _refresh_microsoft(refresh_token: str) -> dict:
+    response = _http.post(
+        MICROSOFT_TOKEN_URL,
+        data={
+            "grant_type": "refresh_token",
+            "refresh_token": refresh_token,
+            "client_id": MSFT_CLIENT_ID,
+            "client_secret": MSFT_CLIENT_SECRET,
+            "scope": MICROSOFT_SCOPES,
+            "redirect_uri": MSFT_REDIRECT_URI,
+        },
+        timeout=REQUEST_TIMEOUT,
+    )
+    if response.status_code != 200:
+        raise TokenRefreshError(f"Microsoft token refresh failed: {response.text}")
+    return response.json()
+
+
+_http = requests.Session()
+# Keyed by EmailProvider values
+_REFRESHERS: Dict[str, Callable[[str], dict]] = {
+    "GMAIL": _refresh_google,
+    "OUTLOOK": _refresh_microsoft,
+}
+
+
+class TokenManager:
+    """
+    Hands out provider access tokens and refreshes them ahead of expiry.
+
+    Access tokens are cached in process memory and in Redis, so every worker shares the
+    latest token. Refreshes are single-flight per account: one worker takes a Redis lock,
+    refreshes, and stores the result while the others wait for it instead of racing on
+    the stored refresh token. A token that is close to expiry but still usable is
+    returned immediately and refreshed in the background, so callers only block on an
+    OAuth round trip when the token is (nearly) expired.
+    """
+
+    def __init__(self, refresh_ahead: int = TOKEN_REFRESH_AHEAD_SECONDS):
+        self.refresh_ahead = refresh_ahead
+        self._tokens: Dict[str, Tuple[str, datetime]] = {}
+        self._refreshing: Set[str] = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _cache_key(token_id: str) -> str:
+        return f"oauth_token:{token_id}"
+
+    @staticmethod
+    def _remaining(expires_at: datetime) -> float:
+        return (expires_at - datetime.utcnow()).total_seconds()
+
+    def _remember(self, token_id: str, access_token: str, expires_at: datetime):
+        with self._lock:
+            self._tokens[token_id] = (access_token, expires_at)
+
+    def _from_memory(self, token_id: str):
+        with self._lock:
+            return self._tokens.get(token_id)
+
+    def _from_redis(self, token_id: str):
+        try:
+            cached = cache.get(self._cache_key(token_id))
+        except RedisError as e:
+            logger.warning(f"Could not read cached token {token_id}: {e}")
+            return None
+        if not cached:
+            return None
+        data = json.loads(cached)
+        entry = (data["access_token"], datetime.fromisoformat(data["expires_at"]))
+        self._remember(token_id, *entry)
+        return entry
+
+    def _from_db(self, token_id: str):
+        with get_db() as db:
+            token = db.query(Token).filter(Token.id == token_id).first()
+            if not token:
+                raise TokenRefreshError(f"Token {token_id} not found")
+            return token.token, token.expires_at, token.refresh_token
+
+    def get_access_token(self, token_id: str, provider: str) -> Tuple[str, datetime]:
+        """
+        Return a usable (access_token, expires_at) pair for a stored token.
+
+        Args:
+            token_id (str): ID of the Token row
+            provider (str): EmailProvider of the account the token belongs to
+
+        Raises:
+            TokenRefreshError: If no valid token could be obtained
+        """
+        token_id = str(token_id)
+        entry = self._from_memory(token_id)
+        if not entry or self._remaining(entry[1]) < self.refresh_ahead:
+            entry = self._from_redis(token_id) or entry
+
+        if entry and self._remaining(entry[1]) >= self.refresh_ahead:
+            return entry
+
+        if entry and self._remaining(entry[1]) >= TOKEN_MIN_LIFETIME_SECONDS:
+            with self._lock:
+                start = token_id not in self._refreshing
+                self._refreshing.add(token_id)
+            if start:
+                threading.Thread(
+                    target=self._refresh_quietly, args=(token_id, provider), daemon=True
+                ).start()
+            return entry
+
+        return self.refresh(token_id, provider)
+
+    def _refresh_quietly(self, token_id: str, provider: str):
+        try:
+            self.refresh(token_id, provider, wait=False)
+        except Exception as e:
+            logger.error(f"Background refresh of token {token_id} failed: {e}", exc_info=True)
+        finally:
+            with self._lock:
+                self._refreshing.discard(token_id)
+
+    def refresh(self, token_id: str, provider: str, wait: bool = True) -> Tuple[str, datetime]:
+        """Refresh a token now, or wait for the refresh another worker is running."""
+        token_id = str(token_id)
+        with distributed_lock(
+            f"token_refresh:{token_id}", ttl=REFRESH_LOCK_TTL, renew=False
+        ) as acquired:
+            if acquired:
+                return self._refresh_locked(token_id, provider)
+
+        entry = self._from_memory(token_id)
+        if not wait:
+            return entry
+        deadline = time.monotonic() + REFRESH_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(REFRESH_POLL_INTERVAL)
+            entry = self._from_redis(token_id)
+            if entry and self._remaining(entry[1]) >= TOKEN_MIN_LIFETIME_SECONDS:
+                return entry
+        raise TokenRefreshError(f"Timed out waiting for token {token_id} to be refreshed")
+
+    def _refresh_locked(self, token_id: str, provider: str) -> Tuple[str, datetime]:
+        # Another worker may have finished a refresh just before we took the lock
+        entry = self._from_redis(token_id)
+        if entry and self._remaining(entry[1]) >= self.refresh_ahead:
+            return entry
+
+        access_token, expires_at, refresh_token = self._from_db(token_id)
+        if expires_at and self._remaining(expires_at) >= self.refresh_ahead:
+            self._store(token_id, access_token, expires_at)
+            return access_token, expires_at
+
+        try:
+            token_data = _REFRESHERS[provider](refresh_token)
+        except Exception:
+            TOKEN_REFRESHES.labels(provider=provider, outcome="error").inc()
+            raise
+        TOKEN_REFRESHES.labels(provider=provider, outcome="ok").inc()
+        access_token = token_data["access_token"]
+        expires_at = datetime.utcnow() + timedelta(seconds=int(token_data["expires_in"]))
+        # Google only returns a refresh token when it rotates it
+        refresh_token = token_data.get("refresh_token") or refresh_token
+
+        with get_db() as db:
+            db.query(Token).filter(Token.id == token_id).update(
+                {
+                    Token.token: access_token,
+                    Token.refresh_token: refresh_token,
+                    Token.expires_at: expires_at,
+                    Token.updated_at: datetime.utcnow(),
+                }
+            )
+        self._store(token_id, access_token, expires_at)
+        logger.info(f"Refreshed {provider} token {token_id}, expires at {expires_at}")
+        return access_token, expires_at
+
+    def _store(self, token_id: str, access_token: str, expires_at: datetime):
+        self._remember(token_id, access_token, expires_at)
+        ttl = int(self._remaining(expires_at))
+        if ttl <= 0:
+            return
+        try:
+            cache.set(
+                self._cache_key(token_id),
+                json.dumps({"access_token": access_token, "expires_at": expires_at.isoformat()}),
+                ex=ttl,
+            )
+        except RedisError as e:
+            logger.warning(f"Could not cache token {token_id}: {e}")
+
+    def invalidate(self, token_id: str):
+        """Forget cached access tokens, e.g. after the account was re-authorized."""
+        token_id = str(token_id)
+        with self._lock:
+            self._tokens.pop(token_id, None)
+        try:
+            cache.delete(self._cache_key(token_id))
+        except RedisError as e:
+            logger.warning(f"Could not drop cached token {token_id}: {e}")
+
+
+token_manager = TokenManager()
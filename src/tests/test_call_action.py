@@ -0,0 +1,74 @@
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+
+class Retry(Exception):
+    pass
+
+
+class ProviderError(Exception):
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.resp = SimpleNamespace(status=status)
+
+
+@pytest.fixture
+def call_tasks(postgres, monkeypatch):
+    from src.celery_tasks import call_tasks
+
+    def retry(**kwargs):
+        raise Retry()
+
+    monkeypatch.setattr(call_tasks.apply_call_action, "retry", retry)
+    return call_tasks
+
+
+@pytest.fixture
+def email(call_tasks):
+    from src.database import Email, EmailAccount, EmailProvider, User, get_db
+
+    with get_db() as db:
+        user = User(email=f"{uuid.uuid4()}@example.com", name="Test User")
+        account = EmailAccount(email=user.email, provider=EmailProvider.GMAIL, user=user)
+        email = Email(email_account=account, email_id="message", subject="Hello")
+        db.add_all([user, account, email])
+        db.commit()
+        return SimpleNamespace(user_id=str(user.id), id=str(email.id))
+
+
+@pytest.fixture
+def drafts(call_tasks, monkeypatch):
+    from src.database import Email
+
+    calls = []
+
+    def failing_draft(error):
+        async def draft_response(self, body, db):
+            calls.append(body)
+            raise error
+
+        monkeypatch.setattr(Email, "draft_response", draft_response)
+
+    failing_draft.calls = calls
+    return failing_draft
+
+
+def test_draft_that_may_exist_is_not_retried(call_tasks, email, drafts):
+    from src.database.call_session import Action
+
+    drafts(ProviderError(503))
+
+    call_tasks.apply_call_action(email.user_id, email.id, Action.RESPOND_TO_EMAIL.value, "Hi")
+
+    assert drafts.calls == ["Hi"]
+
+
+def test_throttled_draft_is_retried(call_tasks, email, drafts):
+    from src.database.call_session import Action
+
+    drafts(ProviderError(429))
+
+    with pytest.raises(Retry):
+        call_tasks.apply_call_action(email.user_id, email.id, Action.RESPOND_TO_EMAIL.value, "Hi")
@@ -0,0 +1,76 @@
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+ACCOUNT = str(uuid.uuid4())
+
+
+@pytest.fixture
+def Contact(postgres):
+    from src.database.contact import Contact
+
+    return Contact
+
+
+@pytest.fixture
+def db(postgres):
+    # One connection for the whole test, so the temporary table below stays visible
+    engine = create_engine(postgres, poolclass=StaticPool)
+    with Session(engine) as session:
+        # Shadows the real table, which needs users and accounts for its foreign keys
+        session.execute(
+            text(
+                "CREATE TEMPORARY TABLE contacts (email_account_id uuid, email_address text, "
+                "score double precision, updated_at timestamp)"
+            )
+        )
+        session.execute(
+            text(
+                "INSERT INTO contacts VALUES (:account, 'a@x.com', 0.5, now()), "
+                "(:account, 'b@x.com', NULL, now()), (:account, 'c@x.com', 0.3, now())"
+            ),
+            {"account": ACCOUNT},
+        )
+        session.commit()
+        yield session
+    engine.dispose()
+
+
+def _scores(db) -> dict:
+    return dict(db.execute(text("SELECT email_address, score FROM contacts")).all())
+
+
+def _moving_average(score: float, value: float, alpha: float, events: int) -> float:
+    for _ in range(events):
+        score = alpha * value + (1 - alpha) * score
+    return score
+
+
+def test_apply_score_events_matches_one_update_per_event(Contact, db):
+    Contact.apply_score_events(
+        db, [(ACCOUNT, "a@x.com"), (ACCOUNT, "b@x.com"), (ACCOUNT, "a@x.com")], -1
+    )
+
+    scores = _scores(db)
+    assert scores["a@x.com"] == pytest.approx(_moving_average(0.5, -1, Contact.alpha, 2))
+    # A contact without a score starts from 0
+    assert scores["b@x.com"] == pytest.approx(_moving_average(0, -1, Contact.alpha, 1))
+    assert scores["c@x.com"] == pytest.approx(0.3)
+
+
+def test_apply_score_events_ignores_unknown_contacts(Contact, db):
+    Contact.apply_score_events(db, [(str(uuid.uuid4()), "a@x.com"), (ACCOUNT, "d@x.com")], 1)
+
+    scores = _scores(db)
+    assert scores["a@x.com"] == pytest.approx(0.5)
+    assert scores["b@x.com"] is None
+    assert "d@x.com" not in scores
+
+
+def test_apply_score_events_without_events(Contact, db):
+    Contact.apply_score_events(db, [], 1)
+
+    assert _scores(db)["a@x.com"] == pytest.approx(0.5)
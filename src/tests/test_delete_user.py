@@ -0,0 +1,54 @@
+import uuid
+
+import pytest
+from sqlalchemy import text
+
+
+@pytest.fixture
+def tasks(postgres, monkeypatch):
+    from src.celery_tasks import tasks
+
+    monkeypatch.setattr(tasks.delete_user, "update_state", lambda **kwargs: None)
+    monkeypatch.setattr(tasks, "send_discord_message", lambda *args: None)
+    monkeypatch.setattr(tasks, "_delete_attachment_files", lambda *args: 0)
+    return tasks
+
+
+@pytest.fixture
+def user_id(tasks):
+    from src.database import User, get_db
+
+    user = User(email=f"{uuid.uuid4()}@example.com", name="Test User")
+    with get_db() as db:
+        db.add(user)
+        db.commit()
+        return str(user.id)
+
+
+def test_delete_user_without_vector_tables(tasks, user_id, monkeypatch):
+    from src.database import User, get_db
+
+    # As on a database where nothing was embedded yet
+    monkeypatch.setattr(
+        tasks,
+        "DELETE_USER_STEPS",
+        [
+            ("data_missing_vectors", "metadata_->>'user_id' = :user_id"),
+            *tasks.DELETE_USER_STEPS,
+        ],
+    )
+
+    deleted = tasks.delete_user(user_id)
+
+    assert deleted["data_missing_vectors"] == 0
+    assert deleted["users"] == 1
+    with get_db() as db:
+        assert db.query(User).filter(User.id == user_id).first() is None
+
+
+def test_delete_in_chunks_skips_missing_tables(tasks):
+    from src.database import get_db
+
+    with get_db() as db:
+        assert db.execute(text("SELECT to_regclass('data_missing_vectors')")).scalar() is None
+        assert tasks._delete_in_chunks(db, "data_missing_vectors", "true", {}) == 0
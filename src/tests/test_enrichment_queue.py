@@ -0,0 +1,47 @@
+import pytest
+
+
+@pytest.fixture
+def tasks(postgres, monkeypatch, fake_cache):
+    from src.celery_tasks import tasks
+
+    monkeypatch.setattr(tasks, "cache", fake_cache)
+    return tasks
+
+
+@pytest.fixture
+def queued(tasks, monkeypatch):
+    batches = []
+    monkeypatch.setattr(
+        tasks.enrich_emails, "delay", lambda user_id, email_ids: batches.append(email_ids)
+    )
+    return batches
+
+
+def test_queue_enrichment_skips_emails_already_queued(tasks, queued):
+    assert tasks._queue_enrichment("user", ["a", "b"]) == 2
+    assert tasks._queue_enrichment("user", ["b", "c"]) == 1
+    assert queued == [["a", "b"], ["c"]]
+
+
+def test_queue_enrichment_marks_expire(tasks, queued, fake_cache):
+    tasks._queue_enrichment("user", ["a"])
+    assert 0 < fake_cache.ttl(tasks._enrich_queued_key("a")) <= tasks.ENRICH_QUEUED_TTL
+
+
+def test_queue_enrichment_chunks_batches(tasks, queued, monkeypatch):
+    monkeypatch.setattr(tasks, "CHUNK_SIZE", 2)
+    assert tasks._queue_enrichment("user", ["a", "b", "c", "d", "e"]) == 5
+    assert queued == [["a", "b"], ["c", "d"], ["e"]]
+
+
+def test_released_emails_can_be_queued_again(tasks, queued):
+    tasks._queue_enrichment("user", ["a", "b"])
+    tasks._release_enrichment(["a"])
+    assert tasks._queue_enrichment("user", ["a", "b"]) == 1
+    assert queued[-1] == ["a"]
+
+
+def test_queue_enrichment_without_emails(tasks, queued):
+    assert tasks._queue_enrichment("user", []) == 0
+    assert queued == []
@@ -0,0 +1,66 @@
+import asyncio
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from src.libs.event_loop import run_async
+
+GEVENT_SCRIPT = textwrap.dedent(
+    """
+    from gevent import monkey
+
+    monkey.patch_all()
+
+    import asyncio
+
+    import gevent
+
+    from src.libs.event_loop import run_async
+
+    async def loop_id(delay):
+        await asyncio.sleep(delay)
+        return id(asyncio.get_running_loop())
+
+    ticks = []
+
+    def tick():
+        # Keeps running while the tasks below wait on the loop
+        for _ in range(5):
+            ticks.append(1)
+            gevent.sleep(0.01)
+
+    ticker = gevent.spawn(tick)
+    tasks = [gevent.spawn(run_async, loop_id(0.05)) for _ in range(10)]
+    gevent.joinall([ticker, *tasks], raise_error=True)
+    assert len({task.value for task in tasks}) == 1, "every call must share one loop"
+    assert len(ticks) == 5
+    print("ok")
+    """
+)
+
+
+async def _loop_id():
+    return id(asyncio.get_running_loop())
+
+
+def test_run_async_reuses_one_loop():
+    assert run_async(_loop_id()) == run_async(_loop_id())
+
+
+def test_run_async_raises_from_the_coroutine():
+    async def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        run_async(fail())
+
+
+def test_run_async_under_gevent():
+    # Monkey patching is process wide, so it runs in its own interpreter
+    result = subprocess.run(
+        [sys.executable, "-c", GEVENT_SCRIPT], capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "ok"
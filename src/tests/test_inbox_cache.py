@@ -0,0 +1,105 @@
+import pytest
+from redis.exceptions import RedisError
+
+# EmailFolder.INBOX and SENT
+INBOX = "inbox"
+SENT = "sent"
+PARAMS = {"account": None, "filter_is_read": None, "category": [], "limit": 30}
+
+
+@pytest.fixture
+def inbox_cache(postgres, monkeypatch, fake_cache):
+    from src.libs import inbox_cache
+
+    monkeypatch.setattr(inbox_cache, "cache", fake_cache)
+    return inbox_cache
+
+
+@pytest.fixture
+def cache(inbox_cache, fake_cache):
+    return fake_cache
+
+
+@pytest.fixture
+def invalidate(inbox_cache, monkeypatch):
+    from src.database import db
+
+    monkeypatch.setattr(db, "replicas", [])
+    return inbox_cache.invalidate
+
+
+def test_versions_start_at_zero(inbox_cache):
+    assert inbox_cache.folder_version("user", INBOX) == 0
+
+
+def test_page_round_trip(inbox_cache):
+    inbox_cache.set_page("user", INBOX, 0, PARAMS, b'{"emails": []}', ["a", "b"])
+
+    assert inbox_cache.get_page("user", INBOX, 0, PARAMS) == (b'{"emails": []}', ["a", "b"])
+    assert inbox_cache.get_page("user", INBOX, 0, {**PARAMS, "limit": 10}) is None
+
+
+def test_page_ttl_is_capped(inbox_cache, cache):
+    inbox_cache.set_page("user", INBOX, 0, PARAMS, b"{}", [], ttl=float("inf"))
+    inbox_cache.set_page("user", INBOX, 1, PARAMS, b"{}", [], ttl=30.5)
+
+    assert (
+        0
+        < cache.ttl(inbox_cache._page_key("user", INBOX, 0, PARAMS))
+        <= inbox_cache.INBOX_CACHE_TTL_SECONDS
+    )
+    assert 0 < cache.ttl(inbox_cache._page_key("user", INBOX, 1, PARAMS)) <= 30
+
+
+def test_page_whose_urls_expired_is_not_cached(inbox_cache):
+    inbox_cache.set_page("user", INBOX, 0, PARAMS, b"{}", [], ttl=0.5)
+
+    assert inbox_cache.get_page("user", INBOX, 0, PARAMS) is None
+
+
+def test_count_round_trip(inbox_cache):
+    inbox_cache.set_count("user", INBOX, 0, 12, ["work"])
+
+    assert inbox_cache.get_count("user", INBOX, 0, ["work"]) == 12
+    assert inbox_cache.get_count("user", INBOX, 0) is None
+
+
+def test_invalidate_bumps_the_folders_it_is_given(inbox_cache, invalidate, cache):
+    invalidate("user", [INBOX])
+    invalidate("user", {INBOX})
+
+    assert inbox_cache.folder_version("user", INBOX) == 2
+    assert inbox_cache.folder_version("user", SENT) == 0
+    assert inbox_cache.folder_version("other", INBOX) == 0
+    assert 0 < cache.ttl(inbox_cache._version_key("user", INBOX))
+
+
+def test_invalidate_without_folders_bumps_every_folder(inbox_cache, invalidate):
+    invalidate("user")
+    invalidate("user", [None])
+
+    assert all(inbox_cache.folder_version("user", f.value) == 2 for f in inbox_cache.EmailFolder)
+
+
+def test_pages_of_an_old_version_are_not_served(inbox_cache, invalidate):
+    version = inbox_cache.folder_version("user", INBOX)
+    inbox_cache.set_page("user", INBOX, version, PARAMS, b"{}", [])
+    inbox_cache.set_count("user", INBOX, version, 3)
+
+    invalidate("user", [INBOX])
+
+    version = inbox_cache.folder_version("user", INBOX)
+    assert inbox_cache.get_page("user", INBOX, version, PARAMS) is None
+    assert inbox_cache.get_count("user", INBOX, version) is None
+
+
+def test_unavailable_cache_is_a_miss(inbox_cache, cache, monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise RedisError("connection refused")
+
+    for command in ("get", "hgetall"):
+        monkeypatch.setattr(cache, command, unavailable)
+
+    assert inbox_cache.folder_version("user", INBOX) is None
+    assert inbox_cache.get_page("user", INBOX, 0, PARAMS) is None
+    assert inbox_cache.get_count("user", INBOX, 0) is None
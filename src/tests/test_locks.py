@@ -0,0 +1,80 @@
+import pytest
+
+
+@pytest.fixture
+def locks(postgres, monkeypatch, fake_cache):
+    from src.libs import locks
+
+    monkeypatch.setattr(locks, "cache", fake_cache)
+    return locks
+
+
+@pytest.fixture
+def cache(locks, fake_cache):
+    return fake_cache
+
+
+def test_distributed_lock_is_exclusive(locks):
+    with locks.distributed_lock("sync:account", renew=False) as acquired:
+        assert acquired
+        with locks.distributed_lock("sync:account", renew=False) as contended:
+            assert not contended
+        with locks.distributed_lock("sync:other", renew=False) as other:
+            assert other
+
+
+def test_distributed_lock_is_released_on_exit(locks, cache):
+    with locks.distributed_lock("sync:account", renew=False) as acquired:
+        assert acquired
+    assert not cache.exists("lock:sync:account")
+    with locks.distributed_lock("sync:account", renew=False) as acquired:
+        assert acquired
+
+
+def test_distributed_lock_is_released_when_the_block_raises(locks, cache):
+    with pytest.raises(RuntimeError):
+        with locks.distributed_lock("sync:account", renew=False):
+            raise RuntimeError
+    assert not cache.exists("lock:sync:account")
+
+
+def test_distributed_lock_holds_a_lease(locks, cache):
+    with locks.distributed_lock("sync:account", ttl=60, renew=False):
+        assert 0 < cache.ttl("lock:sync:account") <= 60
+
+
+def test_distributed_lock_survives_an_expired_lease(locks, cache):
+    with locks.distributed_lock("sync:account", renew=False) as acquired:
+        assert acquired
+        # As if the lease ran out and another worker took over
+        cache.delete("lock:sync:account")
+
+
+def test_distributed_lock_renews_its_lease(locks, cache, monkeypatch):
+    renewed = []
+    monkeypatch.setattr(locks, "_renew_lease", lambda lock, ttl, stop: renewed.append(ttl))
+    with locks.distributed_lock("sync:account", ttl=30):
+        pass
+    assert renewed == [30]
+
+
+def test_debounce_allows_once_per_window(locks, cache):
+    assert locks.debounce("get_new_emails:user", 60)
+    assert not locks.debounce("get_new_emails:user", 60)
+    assert locks.debounce("get_new_emails:other", 60)
+    assert 0 < cache.ttl("debounce:get_new_emails:user") <= 60
+
+
+def test_debounce_allows_again_after_the_window(locks, cache):
+    assert locks.debounce("get_new_emails:user", 60)
+    cache.delete("debounce:get_new_emails:user")
+    assert locks.debounce("get_new_emails:user", 60)
+
+
+def test_semaphore_caps_holders(locks):
+    with locks.semaphore("openai", 1, timeout=0) as first:
+        assert first
+        with locks.semaphore("openai", 1, timeout=0) as second:
+            assert not second
+    with locks.semaphore("openai", 1, timeout=0) as again:
+        assert again
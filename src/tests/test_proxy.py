@@ -0,0 +1,79 @@
+import asyncio
+import socket
+
+import httpx
+import pytest
+
+ADDRESSES = {
+    "public.example": ["93.184.215.14"],
+    "internal.example": ["10.0.0.5"],
+    "mixed.example": ["93.184.215.14", "169.254.169.254"],
+    "v6.example": ["::1"],
+}
+
+
+@pytest.fixture
+def proxy(postgres, monkeypatch):
+    from src.routes import proxy
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        if host not in ADDRESSES:
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return [
+            (socket.AF_INET6 if ":" in a else socket.AF_INET, socket.SOCK_STREAM, 6, "", (a, 0))
+            for a in ADDRESSES[host]
+        ]
+
+    monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+    return proxy
+
+
+@pytest.fixture
+def origin(proxy, monkeypatch):
+    """Serve `routes` ({url: response}) instead of the network."""
+    routes = {}
+    monkeypatch.setattr(
+        proxy,
+        "client",
+        httpx.AsyncClient(transport=httpx.MockTransport(lambda r: routes[str(r.url)])),
+    )
+    return routes
+
+
+@pytest.mark.parametrize(
+    "hostname, public",
+    [
+        ("public.example", True),
+        ("internal.example", False),
+        ("mixed.example", False),
+        ("v6.example", False),
+        ("unknown.example", False),
+    ],
+)
+def test_resolves_to_public(proxy, hostname, public):
+    assert asyncio.run(proxy._resolves_to_public(hostname)) is public
+
+
+def test_fetch_rejects_a_host_that_resolves_internally(proxy, origin):
+    with pytest.raises(proxy.InvalidStylesheetURL):
+        asyncio.run(proxy._fetch("https://internal.example/style.css", None))
+
+
+def test_fetch_rejects_a_redirect_to_an_internal_host(proxy, origin):
+    origin["https://public.example/style.css"] = httpx.Response(
+        302, headers={"Location": "http://internal.example/style.css"}
+    )
+
+    with pytest.raises(proxy.InvalidStylesheetURL):
+        asyncio.run(proxy._fetch("https://public.example/style.css", None))
+
+
+def test_fetch_follows_a_redirect_to_a_public_host(proxy, origin):
+    origin["https://public.example/style.css"] = httpx.Response(
+        302, headers={"Location": "/v2/style.css"}
+    )
+    origin["https://public.example/v2/style.css"] = httpx.Response(200, content=b"a {}")
+
+    response = asyncio.run(proxy._fetch("https://public.example/style.css", None))
+
+    assert response.content == b"a {}"
@@ -0,0 +1,75 @@
+import pytest
+
+# Same as src.libs.rate_limit.GMAIL and OUTLOOK
+GMAIL = "gmail"
+OUTLOOK = "outlook"
+
+
+@pytest.fixture
+def rate_limit(postgres, monkeypatch, fake_cache):
+    from src.libs import rate_limit
+
+    monkeypatch.setattr(rate_limit, "cache", fake_cache)
+    # The script is registered on the client at import
+    monkeypatch.setattr(
+        rate_limit, "_TAKE_TOKENS", fake_cache.register_script(rate_limit._TAKE_TOKENS.script)
+    )
+    return rate_limit
+
+
+@pytest.fixture
+def limiter(rate_limit):
+    return rate_limit.RateLimiter()
+
+
+def _stats(cache, provider: str) -> dict:
+    return {
+        key.decode(): int(value)
+        for key, value in cache.hgetall(f"ratelimit:stats:{provider}").items()
+    }
+
+
+def test_take_from_a_full_bucket(limiter, fake_cache):
+    assert limiter._take(GMAIL, "account", 5) == 0
+    assert _stats(fake_cache, GMAIL) == {"requests": 1, "units": 5}
+
+
+def test_take_waits_once_the_bucket_is_empty(rate_limit, limiter, fake_cache):
+    capacity, rate = rate_limit.PROVIDER_LIMITS[OUTLOOK]
+    assert limiter._take(OUTLOOK, "account", capacity) == 0
+
+    wait = limiter._take(OUTLOOK, "account", 1)
+
+    assert 0 < wait <= 1 / rate + 0.001
+    assert _stats(fake_cache, OUTLOOK)["delayed"] == 1
+
+
+def test_buckets_are_per_account(rate_limit, limiter):
+    capacity, _ = rate_limit.PROVIDER_LIMITS[OUTLOOK]
+    limiter._take(OUTLOOK, "account", capacity)
+
+    assert limiter._take(OUTLOOK, "other", 1) == 0
+
+
+def test_take_caps_cost_at_capacity(rate_limit, limiter):
+    capacity, _ = rate_limit.PROVIDER_LIMITS[GMAIL]
+    # A call costing more than the bucket holds must not wait forever
+    assert limiter._take(GMAIL, "account", capacity * 10) == 0
+
+
+def test_take_waits_out_a_cooldown(limiter, fake_cache):
+    fake_cache.set(f"ratelimit:{GMAIL}:account:cooldown", 1, px=5000)
+
+    wait = limiter._take(GMAIL, "account", 1)
+
+    assert 4 < wait <= 5
+    assert _stats(fake_cache, GMAIL) == {"delayed": 1}
+    # Nothing was taken from the bucket meanwhile
+    assert not fake_cache.exists(f"ratelimit:{GMAIL}:account")
+
+
+def test_bucket_state_expires_once_refilled(rate_limit, limiter, fake_cache):
+    capacity, rate = rate_limit.PROVIDER_LIMITS[GMAIL]
+    limiter._take(GMAIL, "account", 1)
+
+    assert 0 < fake_cache.pttl(f"ratelimit:{GMAIL}:account") <= capacity / rate * 1000 + 1000
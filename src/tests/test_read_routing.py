@@ -0,0 +1,76 @@
+import pytest
+
+
+@pytest.fixture
+def db_module(postgres, monkeypatch, fake_cache):
+    from src.database import db
+
+    monkeypatch.setattr(db, "cache", fake_cache)
+    return db
+
+
+class FakeReplica:
+    def __init__(self, lag):
+        self._lag = lag
+        self.opened = 0
+
+    def lag(self):
+        return self._lag
+
+    def sessions(self):
+        self.opened += 1
+        return self
+
+
+def test_mark_recent_write(db_module, fake_cache):
+    assert not db_module._wrote_recently("user")
+
+    db_module.mark_recent_write("user")
+
+    assert db_module._wrote_recently("user")
+    assert 0 < fake_cache.ttl("db:recent_write:user") <= db_module.READ_YOUR_WRITES_SECONDS
+
+
+def test_without_redis_reads_stay_on_the_primary(db_module, monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise ConnectionError
+
+    monkeypatch.setattr(db_module.cache, "exists", unavailable)
+
+    assert db_module._wrote_recently("user")
+
+
+def test_reads_use_the_primary_without_replicas(db_module, monkeypatch):
+    monkeypatch.setattr(db_module, "replicas", [])
+
+    with db_module._read_session("user") as session:
+        assert session.get_bind() is db_module.engine
+
+
+def test_reads_use_a_current_replica(db_module, monkeypatch):
+    replica = FakeReplica(lag=0)
+    monkeypatch.setattr(db_module, "replicas", [replica])
+
+    assert db_module._read_session("user") is replica
+
+
+def test_reads_after_a_write_use_the_primary(db_module, monkeypatch):
+    replica = FakeReplica(lag=0)
+    monkeypatch.setattr(db_module, "replicas", [replica])
+    db_module.mark_recent_write("user")
+
+    with db_module._read_session("user") as session:
+        assert session.get_bind() is db_module.engine
+    assert replica.opened == 0
+    # Other users are not affected
+    assert db_module._read_session("other") is replica
+
+
+def test_lagging_or_unreachable_replicas_are_skipped(db_module, monkeypatch):
+    lagging = FakeReplica(lag=db_module.REPLICA_MAX_LAG_SECONDS + 1)
+    unreachable = FakeReplica(lag=None)
+    monkeypatch.setattr(db_module, "replicas", [lagging, unreachable])
+
+    with db_module._read_session("user") as session:
+        assert session.get_bind() is db_module.engine
+    assert lagging.opened == unreachable.opened == 0
@@ -0,0 +1,53 @@
+import pytest
+
+
+@pytest.fixture
+def tasks(postgres, monkeypatch, fake_cache):
+    from src.celery_tasks import tasks
+
+    monkeypatch.setattr(tasks, "cache", fake_cache)
+    return tasks
+
+
+@pytest.fixture
+def marked(tasks, monkeypatch):
+    batches = []
+    monkeypatch.setattr(
+        tasks,
+        "_mark_emails_as_shown",
+        lambda db, email_ids, invalidate=True: batches.append((sorted(email_ids), invalidate)),
+    )
+    return batches
+
+
+def test_record_shown_emails_collapses_repeated_views(tasks, fake_cache):
+    tasks.record_shown_emails(["a", "b"])
+    tasks.record_shown_emails(["b", "c"])
+    tasks.record_shown_emails([])
+
+    assert fake_cache.smembers(tasks.SHOWN_EMAILS_KEY) == {b"a", b"b", b"c"}
+
+
+def test_flush_shown_emails_marks_in_batches(tasks, marked, fake_cache, monkeypatch):
+    monkeypatch.setattr(tasks, "SHOWN_EMAILS_FLUSH_BATCH", 2)
+    tasks.record_shown_emails(["a", "b", "c"])
+
+    tasks.flush_shown_emails()
+
+    assert sorted(email_id for batch, _ in marked for email_id in batch) == ["a", "b", "c"]
+    assert [len(batch) for batch, _ in marked] == [2, 1]
+    # The email list caches its pages with these already shown
+    assert not any(invalidate for _, invalidate in marked)
+    assert not fake_cache.exists(tasks.SHOWN_EMAILS_KEY)
+
+
+def test_flush_shown_emails_keeps_emails_it_failed_to_mark(tasks, fake_cache, monkeypatch):
+    def fail(db, email_ids, invalidate=True):
+        raise RuntimeError("database is down")
+
+    monkeypatch.setattr(tasks, "_mark_emails_as_shown", fail)
+    tasks.record_shown_emails(["a", "b"])
+
+    tasks.flush_shown_emails()
+
+    assert fake_cache.smembers(tasks.SHOWN_EMAILS_KEY) == {b"a", b"b"}
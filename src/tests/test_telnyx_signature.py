@@ -0,0 +1,84 @@
+import base64
+import json
+import time
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from nacl.signing import SigningKey
+
+signing_key = SigningKey.generate()
+
+
+@pytest.fixture
+def middleware(postgres):
+    # src.routes imports every router, and with them the database
+    from src.routes import middleware
+
+    return middleware
+
+
+@pytest.fixture
+def client(middleware, monkeypatch):
+    public_key = base64.b64encode(bytes(signing_key.verify_key)).decode()
+    monkeypatch.setattr(middleware, "TELNYX_PUBLIC_KEY", public_key)
+    monkeypatch.setattr(middleware.telnyx, "public_key", public_key)
+
+    app = FastAPI()
+
+    @app.post("/events", dependencies=[Depends(middleware.verify_telnyx_signature)])
+    def events():
+        return {"message": "ok"}
+
+    return TestClient(app)
+
+
+def _signed(payload: str, key: SigningKey = signing_key, timestamp: int = None) -> dict:
+    timestamp = str(timestamp or int(time.time()))
+    signature = key.sign(f"{timestamp}|{payload}".encode()).signature
+    return {
+        "telnyx-signature-ed25519": base64.b64encode(signature).decode(),
+        "telnyx-timestamp": timestamp,
+    }
+
+
+PAYLOAD = json.dumps({"data": {"event_type": "call.hangup"}})
+
+
+def test_signed_event_is_accepted(client):
+    assert client.post("/events", content=PAYLOAD, headers=_signed(PAYLOAD)).status_code == 200
+
+
+def test_forged_signature_is_rejected(client):
+    headers = _signed(PAYLOAD, key=SigningKey.generate())
+
+    assert client.post("/events", content=PAYLOAD, headers=headers).status_code == 401
+
+
+def test_tampered_payload_is_rejected(client):
+    headers = _signed(PAYLOAD)
+
+    response = client.post(
+        "/events", content=PAYLOAD.replace("hangup", "answered"), headers=headers
+    )
+    assert response.status_code == 401
+
+
+def test_stale_timestamp_is_rejected(client):
+    headers = _signed(PAYLOAD, timestamp=int(time.time()) - 3600)
+
+    assert client.post("/events", content=PAYLOAD, headers=headers).status_code == 401
+
+
+@pytest.mark.parametrize("missing", ["telnyx-signature-ed25519", "telnyx-timestamp"])
+def test_missing_headers_are_rejected(client, missing):
+    headers = _signed(PAYLOAD)
+    del headers[missing]
+
+    assert client.post("/events", content=PAYLOAD, headers=headers).status_code == 401
+
+
+def test_rejected_without_a_public_key(middleware, client, monkeypatch):
+    monkeypatch.setattr(middleware, "TELNYX_PUBLIC_KEY", None)
+
+    assert client.post("/events", content=PAYLOAD, headers=_signed(PAYLOAD)).status_code == 401
@@ -0,0 +1,118 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture
+def token_manager(postgres, monkeypatch, fake_cache):
+    from src.services import token_manager
+
+    monkeypatch.setattr(token_manager, "cache", fake_cache)
+    return token_manager
+
+
+@pytest.fixture
+def manager(token_manager, monkeypatch):
+    manager = token_manager.TokenManager(refresh_ahead=600)
+    manager.refreshed = []
+    manager.background = []
+
+    def refresh(token_id, provider, wait=True):
+        manager.refreshed.append(token_id)
+        return "refreshed", datetime.utcnow() + timedelta(hours=1)
+
+    monkeypatch.setattr(manager, "refresh", refresh)
+
+    class Thread:
+        def __init__(self, target, args, daemon):
+            self.args = args
+
+        def start(self):
+            manager.background.append(self.args[0])
+
+    monkeypatch.setattr(token_manager.threading, "Thread", Thread)
+    return manager
+
+
+def _expiring_in(seconds: int) -> datetime:
+    return datetime.utcnow() + timedelta(seconds=seconds)
+
+
+def test_fresh_token_from_memory(manager):
+    manager._remember("token", "cached", _expiring_in(3600))
+
+    assert manager.get_access_token("token", "GMAIL")[0] == "cached"
+    assert manager.refreshed == manager.background == []
+
+
+def test_fresh_token_from_redis(manager, fake_cache):
+    manager._remember("token", "stale", _expiring_in(120))
+    fake_cache.set(
+        "oauth_token:token",
+        json.dumps({"access_token": "shared", "expires_at": _expiring_in(3600).isoformat()}),
+    )
+
+    assert manager.get_access_token("token", "GMAIL")[0] == "shared"
+    assert manager.refreshed == manager.background == []
+    # Remembered for the next call
+    assert manager._from_memory("token")[0] == "shared"
+
+
+def test_expiring_token_is_refreshed_in_the_background(manager, token_manager):
+    manager._remember(
+        "token", "expiring", _expiring_in(token_manager.TOKEN_MIN_LIFETIME_SECONDS + 60)
+    )
+
+    assert manager.get_access_token("token", "GMAIL")[0] == "expiring"
+    assert manager.get_access_token("token", "GMAIL")[0] == "expiring"
+    # Single-flight, the second call sees the refresh already running
+    assert manager.background == ["token"]
+    assert manager.refreshed == []
+
+
+def test_nearly_expired_token_is_refreshed_before_returning(manager, token_manager):
+    manager._remember(
+        "token", "expiring", _expiring_in(token_manager.TOKEN_MIN_LIFETIME_SECONDS // 2)
+    )
+
+    assert manager.get_access_token("token", "GMAIL")[0] == "refreshed"
+    assert manager.refreshed == ["token"]
+    assert manager.background == []
+
+
+def test_token_google_auth_considers_expired_is_refreshed_before_returning(manager):
+    from google.auth._helpers import REFRESH_THRESHOLD
+
+    # Still valid, but google-auth would reject it instead of calling the refresh handler
+    manager._remember("token", "expiring", _expiring_in(REFRESH_THRESHOLD.total_seconds() - 60))
+
+    assert manager.get_access_token("token", "GMAIL")[0] == "refreshed"
+    assert manager.background == []
+
+
+def test_unknown_token_is_refreshed(manager):
+    assert manager.get_access_token("token", "OUTLOOK")[0] == "refreshed"
+    assert manager.refreshed == ["token"]
+
+
+def test_token_ids_are_normalized(manager):
+    manager._remember("42", "cached", _expiring_in(3600))
+
+    assert manager.get_access_token(42, "GMAIL")[0] == "cached"
+
+
+def test_store_shares_the_token_until_it_expires(manager, fake_cache):
+    manager._store("token", "new", _expiring_in(3600))
+
+    assert 3500 < fake_cache.ttl("oauth_token:token") <= 3600
+    assert manager._from_redis("token")[0] == "new"
+
+
+def test_invalidate_forgets_the_token(manager, fake_cache):
+    manager._store("token", "old", _expiring_in(3600))
+
+    manager.invalidate("token")
+
+    assert manager._from_memory("token") is None
+    assert not fake_cache.exists("oauth_token:token")